@@ -1,12 +1,13 @@
 """A programmatic API for using Otter-Grader"""
 
-__all__ = ["export_notebook", "grade_submission"]
+__all__ = ["export_notebook", "grade_many", "grade_submission"]
 
 import os
 import sys
 import shutil
 import tempfile
 
+from concurrent.futures import as_completed, ProcessPoolExecutor
 from contextlib import redirect_stdout
 
 try:
@@ -16,9 +17,11 @@ except ImportError:
 
 from .export import export_notebook
 from .run import main as run_grader
+from .run.zygote import run_in_fork
 
 
-def grade_submission(submission_path, ag_path="autograder.zip", quiet=False, debug=False):
+def grade_submission(submission_path, ag_path="autograder.zip", quiet=False, debug=False,
+                     zygote=False):
     """
     Runs non-containerized grading on a single submission at ``submission_path`` using the autograder 
     configuration file at ``ag_path``. 
@@ -30,6 +33,11 @@ def grade_submission(submission_path, ag_path="autograder.zip", quiet=False, deb
     
     Print statements executed during grading can be suppressed with ``quiet``.
 
+    If ``zygote`` is true, the submission is graded in a process forked from a long-lived zygote
+    process, which is started the first time it is used and imports Otter and the autograder's
+    ``preload_modules`` only once, so that grading many submissions in the same Python process 
+    doesn't pay their import costs or share state between submissions.
+
     Args:
         submission_path (``str``): path to submission file
         ag_path (``str``): path to autograder zip file
@@ -37,6 +45,8 @@ def grade_submission(submission_path, ag_path="autograder.zip", quiet=False, deb
             ``False``
         debug (``bool``, optional): whether to run the submission in debug mode (without ignoring
             errors)
+        zygote (``bool``, optional): whether to grade the submission in a process forked from a 
+            zygote process
 
     Returns:
         ``otter.test_files.GradingResults``: the results object produced during the grading of the
@@ -54,7 +64,8 @@ def grade_submission(submission_path, ag_path="autograder.zip", quiet=False, deb
     # TODO: is the output_dir argument of run_grader necessary here?
     with cm:
         results = run_grader(
-            submission_path, autograder=ag_path, output_dir=dp, no_logo=True, debug=debug)
+            submission_path, autograder=ag_path, output_dir=dp, no_logo=True, debug=debug, 
+            zygote=zygote)
 
     if quiet:
         f.close()
@@ -62,3 +73,69 @@ def grade_submission(submission_path, ag_path="autograder.zip", quiet=False, deb
     shutil.rmtree(dp)
 
     return results
+
+
+def _grade_submission_in_fork(*args, **kwargs):
+    """
+    Calls ``grade_submission`` in a child forked from the current process and returns its result.
+    """
+    return run_in_fork(grade_submission, *args, **kwargs)[0]
+
+
+def grade_many(submission_paths, ag_path="autograder.zip", workers=None, debug=False):
+    """
+    Runs non-containerized grading on many submissions at once using the autograder configuration 
+    file at ``ag_path``, yielding the results of each submission as soon as it has been graded.
+
+    Each submission is graded as in ``grade_submission`` with ``quiet=True`` in one of ``workers`` 
+    worker processes, so that submissions graded at the same time don't share any interpreter state
+    (e.g. the working directory, ``sys.stdout``, or modules patched by student code). On platforms
+    that support forking, each submission is graded in a fresh child forked from its worker, so that
+    no state is passed from one submission to the next either. Like ``grade_submission``, this does
+    not run environment setup files or install requirements.
+
+    If grading a submission raises an error, it is re-raised when that submission's results would
+    have been yielded and the submissions that haven't started grading yet are cancelled.
+
+    .. code-block:: python
+
+        from glob import glob
+        from otter.api import grade_many
+
+        for path, results in grade_many(glob("submissions/*.ipynb"), "autograder.zip", workers=4):
+            print(path, results.total)
+
+    Args:
+        submission_paths (``list`` of ``str``): paths to the submission files
+        ag_path (``str``): path to autograder zip file
+        workers (``int``, optional): the number of worker processes; defaults to the number of CPUs
+        debug (``bool``, optional): whether to run the submissions in debug mode (without ignoring
+            errors)
+
+    Yields:
+        ``tuple[str, otter.test_files.GradingResults]``: the path to each submission and its results,
+            in the order in which the submissions finish grading
+    """
+    executor_kwargs = {}
+    if hasattr(os, "fork"):
+        grade_fn = _grade_submission_in_fork
+
+    # without fork, each worker process grades one submission (which requires Python 3.11+)
+    else:
+        grade_fn = grade_submission
+        if sys.version_info >= (3, 11):
+            executor_kwargs["max_tasks_per_child"] = 1
+
+    with ProcessPoolExecutor(max_workers=workers, **executor_kwargs) as executor:
+        futures = {
+            executor.submit(grade_fn, path, ag_path, quiet=True, debug=debug): path
+            for path in submission_paths
+        }
+
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+        finally:
+            for future in futures:
+                future.cancel()
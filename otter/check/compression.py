@@ -0,0 +1,155 @@
+"""Compression of the records in Otter's log files"""
+
+import io
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# compressed data starts with this magic string followed by the ID of its codec; uncompressed data is
+# a pickle, which starts with the pickle PROTO opcode instead
+COMPRESSION_MAGIC = b"OTZ"
+
+CODECS = {
+    "zlib": b"z",
+    "lzma": b"x",
+    "zstd": b"s",
+}
+
+_HEADER_SIZE = len(COMPRESSION_MAGIC) + 1
+
+# the number of compressed bytes passed to the zlib decompressor at a time
+_CHUNK_SIZE = 64 * 1024
+
+
+class LogCompression:
+    """
+    The configuration for compressing the records written to a log.
+
+    Args:
+        codec (``str``): the codec to compress with; one of ``"zlib"``, ``"lzma"``, or ``"zstd"``
+            (which requires the ``zstandard`` package)
+        level (``int``, optional): the compression level (the preset for ``"lzma"``); defaults to
+            the codec's default level
+        entries (``bool``, optional): whether to compress the pickled entries themselves in addition
+            to the variables in their shelves
+
+    Attributes:
+        codec (``str``): the codec to compress with
+        level (``int``): the compression level, or ``None`` to use the codec's default
+        entries (``bool``): whether to compress the pickled entries
+
+    Raises:
+        ``ValueError``: if ``codec`` is not supported or its package is not installed
+    """
+
+    def __init__(self, codec, level=None, entries=False):
+        if codec not in CODECS:
+            raise ValueError(
+                f"Unsupported log compression codec: '{codec}'; the supported codecs are "
+                f"{', '.join(CODECS)}")
+
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("The zstandard package must be installed to compress logs with zstd")
+
+        self.codec = codec
+        self.level = level
+        self.entries = entries
+
+    def __repr__(self):
+        return f"LogCompression(codec={self.codec!r}, level={self.level!r}, entries={self.entries!r})"
+
+    def compress(self, data):
+        """
+        Compress ``data``, prefixing it with a header that identifies the codec.
+
+        Args:
+            data (``bytes``): the data to compress
+
+        Returns:
+            ``bytes``: the compressed data
+        """
+        if self.codec == "zlib":
+            compressed = zlib.compress(data, -1 if self.level is None else self.level)
+
+        elif self.codec == "lzma":
+            compressed = lzma.compress(data, preset=self.level)
+
+        else:
+            compressed = zstandard.ZstdCompressor(
+                level=3 if self.level is None else self.level).compress(data)
+
+        return COMPRESSION_MAGIC + CODECS[self.codec] + compressed
+
+
+class _ZlibReader(io.RawIOBase):
+    """
+    A readable stream of the data decompressed from ``data``, which holds a zlib stream starting at
+    ``offset``.
+    """
+
+    def __init__(self, data, offset):
+        self._data = memoryview(data)
+        self._pos = offset
+        self._decompressor = zlib.decompressobj()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        out = b""
+        while not out and not self._decompressor.eof:
+            chunk = self._decompressor.unconsumed_tail
+            if not chunk:
+                chunk = self._data[self._pos:self._pos + _CHUNK_SIZE]
+                self._pos += len(chunk)
+
+                if not chunk:
+                    raise EOFError(
+                        "Compressed data ended before the end-of-stream marker was reached")
+
+            out = self._decompressor.decompress(chunk, len(b))
+
+        b[:len(out)] = out
+        return len(out)
+
+
+def open_data(data):
+    """
+    Open a readable binary stream of the data in ``data``, decompressing it as it is read if it was
+    compressed by ``LogCompression.compress``, so that it can be unpickled without holding all of the
+    decompressed data in memory.
+
+    Args:
+        data (``bytes``): the data, which may be compressed
+
+    Returns:
+        file-like object: the stream
+
+    Raises:
+        ``ValueError``: if the data was compressed with a codec whose package is not installed
+    """
+    if data[:len(COMPRESSION_MAGIC)] != COMPRESSION_MAGIC:
+        return io.BytesIO(data)
+
+    codec_id = data[len(COMPRESSION_MAGIC):_HEADER_SIZE]
+    if codec_id == CODECS["zlib"]:
+        return io.BufferedReader(_ZlibReader(data, _HEADER_SIZE))
+
+    f = io.BytesIO(data)
+    f.seek(_HEADER_SIZE)
+
+    if codec_id == CODECS["lzma"]:
+        return lzma.LZMAFile(f)
+
+    if codec_id == CODECS["zstd"]:
+        if zstandard is None:
+            raise ValueError("The zstandard package must be installed to read logs compressed with zstd")
+
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+
+    raise ValueError(f"Unsupported log compression codec ID: {codec_id!r}")
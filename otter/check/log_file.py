@@ -0,0 +1,686 @@
+"""
+Reading and writing Otter's indexed log file format
+"""
+
+import copy
+import mmap
+import os
+import pickle
+import struct
+import threading
+
+from collections import ChainMap, namedtuple
+from contextlib import contextmanager
+
+from .compression import open_data
+
+
+# the file starts with a header holding a magic string, the format version, and the number of times
+# the log has been compacted
+LOG_MAGIC = b"OTTERLOG"
+LOG_VERSION = 4
+
+# records start with their kind and the length of their payload
+ENTRY_RECORD = b"E"
+INDEX_RECORD = b"I"
+TOMBSTONE_RECORD = b"T"
+BLOB_RECORD = b"B"
+
+# the file ends with a footer holding the offset of the last index record and a magic string
+INDEX_MAGIC = b"OTTERIDX"
+
+# the index is stored in index records that form a chain: a full index record holds every entry in
+# the index, and each append after it writes a delta index record holding the offset of the previous
+# index record, the new entries, and the offsets of the entries whose shelves became obsolete. A
+# full index record is written again once the delta index records since the last one are larger
+# than it, so the number of index records read to load the index stays proportional to its size
+# while each append only writes its own entries.
+
+# logs are compacted when at least this many bytes are taken up by entries with obsolete shelves and
+# the blobs used only by them, and they make up at least half of the bytes taken up by records
+COMPACTION_MIN_BYTES = 1024 * 1024
+
+_HEADER = struct.Struct(">8sHI")
+_RECORD_HEADER = struct.Struct(">cQ")
+_FOOTER = struct.Struct(">Q8s")
+
+# blob records start with the SHA-256 digest of the blob
+_DIGEST_SIZE = 32
+
+# the index of each log read or appended to by this process, keyed by the log's absolute path, so
+# that appending to a log doesn't read its index again unless another process has changed the file
+_INDEXES = {}
+_INDEXES_LOCK = threading.RLock()
+
+
+IndexEntry = namedtuple(
+    "IndexEntry",
+    ["event_type", "question", "timestamp", "offset", "length", "shelved", "blobs", "obsolete"],
+    defaults=[None, None, False],
+)
+IndexEntry.__doc__ = """\
+An entry in the index of a log file, which locates a pickled ``otter.check.logs.LogEntry``.
+
+Attributes:
+    event_type (``str``): the name of the entry's ``otter.check.logs.EventType``
+    question (``str``): the entry's question, if any
+    timestamp (``datetime.datetime``): the entry's timestamp
+    offset (``int``): the offset of the pickled entry in the file
+    length (``int``): the length of the pickled entry in bytes
+    shelved (``tuple`` of ``str``): the names of the variables in the entry's shelf, or ``None`` if
+        it has no shelf or its shelf is obsolete
+    blobs (``tuple`` of ``tuple``): the hash, offset, and length of each blob used by the entry's
+        shelf, or ``None`` if its shelf isn't stored in blobs
+    obsolete (``bool``): whether the entry's shelf has been marked obsolete by a tombstone, in which
+        case it is removed when the entry is read
+"""
+
+
+class _LogIndex:
+    """
+    The index of an indexed log, along with everything needed to append to the log without reading
+    its index again.
+
+    Attributes:
+        index (``list`` of ``IndexEntry``): the index, in the order in which the entries were written
+        positions (``dict``): a map from the offset of each entry to its position in ``index``
+        blob_table (``dict``): a map from the hash of each blob in the log (including those used only
+            by obsolete shelves) to its offset and length
+        refs (``dict``): a map from the hash of each blob to the number of times it is used by
+            shelves that aren't obsolete
+        total (``int``): the number of bytes taken up by entries and blobs
+        obsolete (``int``): the number of bytes taken up by entries with obsolete shelves and the
+            blobs used only by them
+        version (``int``): the format version in the log's header
+        end (``int``): the offset at which new records should be written, or ``None`` if the log is
+            empty
+        last (``int``): the offset of the last index record, or ``None`` if the index has to be
+            written in full (e.g. because it was rebuilt from the records)
+        full_size (``int``): the size of the last full index record
+        delta_size (``int``): the total size of the delta index records written after it
+        key (``tuple``): identifies the state of the file the index was read from or written to
+    """
+
+    def __init__(self, version=LOG_VERSION):
+        self.index, self.positions, self.blob_table, self.refs = [], {}, {}, {}
+        self.total, self.obsolete = 0, 0
+        self.version, self.end, self.last = version, None, None
+        self.full_size, self.delta_size = 0, 0
+        self.key = None
+
+    def add_blob(self, h, offset, length):
+        """
+        Add a blob to the blob table; it counts as obsolete until a shelf uses it.
+        """
+        if h not in self.blob_table:
+            self.blob_table[h] = (offset, length)
+            self.total += length
+            self.obsolete += length
+
+    def add(self, ie):
+        """
+        Add the index entry ``ie`` to the end of the index.
+        """
+        self.positions[ie.offset] = len(self.index)
+        self.index.append(ie)
+        self.total += ie.length
+        for h, offset, length in ie.blobs or []:
+            self.add_blob(h, offset, length)
+
+        if ie.obsolete:
+            self.obsolete += ie.length
+            return
+
+        for h, _, _ in ie.blobs or []:
+            if self.refs.get(h, 0) == 0:
+                self.obsolete -= self.blob_table[h][1]
+            self.refs[h] = self.refs.get(h, 0) + 1
+
+    def mark_obsolete(self, offsets):
+        """
+        Mark the shelves of the entries at ``offsets`` obsolete.
+        """
+        for offset in offsets:
+            i = self.positions.get(offset)
+            if i is None or self.index[i].obsolete:
+                continue
+
+            ie = self.index[i]
+            self.index[i] = ie._replace(shelved=None, obsolete=True)
+            self.obsolete += ie.length
+            for h, _, _ in ie.blobs or []:
+                self.refs[h] -= 1
+                if self.refs[h] == 0:
+                    self.obsolete += self.blob_table[h][1]
+
+    def needs_compaction(self):
+        """
+        Determine whether the log has enough obsolete shelves to be worth compacting.
+        """
+        return self.obsolete >= COMPACTION_MIN_BYTES and 2 * self.obsolete >= self.total
+
+
+def is_indexed_log(filename):
+    """
+    Determine whether the file at ``filename`` is a log in the indexed format, rather than a log in
+    the original format (a stream of pickled entries).
+
+    Args:
+        filename (``str``): the path to the log
+
+    Returns:
+        ``bool``: whether the log is indexed
+    """
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(LOG_MAGIC)) == LOG_MAGIC
+
+    except FileNotFoundError:
+        return False
+
+
+def _read_header(buf):
+    """
+    Validate the header of the indexed log in ``buf`` and return its size and the log's generation.
+    """
+    if len(buf) < _HEADER.size:
+        raise ValueError("The log file is too short to be an indexed log")
+
+    magic, version, generation = _HEADER.unpack_from(buf, 0)
+    if magic != LOG_MAGIC:
+        raise ValueError("The log file is not an indexed log")
+
+    if version > LOG_VERSION:
+        raise ValueError(
+            f"The log file has version {version}, but this version of Otter can only read logs up "
+            f"to version {LOG_VERSION}")
+
+    return _HEADER.size, generation
+
+
+def _read_footer(buf):
+    """
+    Return the offset of the index record named by the footer of ``buf``, or ``None`` if the footer
+    is missing (e.g. because writing to the log was interrupted).
+    """
+    if len(buf) < _HEADER.size + _FOOTER.size:
+        return None
+
+    offset, magic = _FOOTER.unpack_from(buf, len(buf) - _FOOTER.size)
+    if magic != INDEX_MAGIC or offset + _RECORD_HEADER.size > len(buf) - _FOOTER.size:
+        return None
+
+    kind, length = _RECORD_HEADER.unpack_from(buf, offset)
+    if kind != INDEX_RECORD or offset + _RECORD_HEADER.size + length != len(buf) - _FOOTER.size:
+        return None
+
+    return offset
+
+
+def _make_index_entry(entry, offset, length, blob_table):
+    """
+    Create the index entry for ``entry``, locating the blobs used by its shelf in ``blob_table``.
+    """
+    shelved, hashes = entry.get_shelved_variables(), entry.get_blob_hashes()
+    return IndexEntry(
+        entry.event_type.name, entry.question, entry.timestamp, offset, length,
+        tuple(shelved) if shelved is not None else None,
+        tuple((h, *blob_table[h]) for h in hashes) if hashes else None,
+    )
+
+
+def _scan(buf, log_index):
+    """
+    Rebuild the index of ``buf`` in ``log_index`` by reading every complete record in it and set
+    ``log_index.end`` to the offset of the end of the last complete record.
+    """
+    offset = _read_header(buf)[0]
+    while offset + _RECORD_HEADER.size <= len(buf):
+        kind, length = _RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + _RECORD_HEADER.size
+        if kind not in (ENTRY_RECORD, INDEX_RECORD, TOMBSTONE_RECORD, BLOB_RECORD) or \
+                start + length > len(buf):
+            break
+
+        if kind == BLOB_RECORD:
+            digest = bytes(buf[start:start + _DIGEST_SIZE])
+            log_index.add_blob(digest.hex(), start + _DIGEST_SIZE, length - _DIGEST_SIZE)
+
+        # index records are rebuilt from the records they index
+        elif kind != INDEX_RECORD:
+            try:
+                payload = _load_entry(buf[start:start + length])
+            except Exception:
+                break
+
+            if kind == ENTRY_RECORD:
+                log_index.add(_make_index_entry(payload, start, length, log_index.blob_table))
+            else:
+                log_index.mark_obsolete(payload)
+
+        offset = start + length
+
+    log_index.end = offset
+
+
+def _read_index_records(buf):
+    """
+    Return the payloads and sizes of the chain of index records ending at the one named by the
+    footer of ``buf``, from last to first, or ``None`` if the footer is missing or the chain is
+    broken.
+    """
+    offset, records = _read_footer(buf), []
+    while offset is not None:
+        if offset < _HEADER.size or offset + _RECORD_HEADER.size > len(buf):
+            return None
+
+        kind, length = _RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + _RECORD_HEADER.size
+        if kind != INDEX_RECORD or start + length > len(buf):
+            return None
+
+        payload = pickle.loads(buf[start:start + length])
+        records.append((payload, _RECORD_HEADER.size + length))
+
+        # full index records (the only kind written before version 4) are lists of index entries
+        if isinstance(payload, list):
+            break
+
+        previous = payload["previous"]
+        if previous is not None and previous >= offset:
+            return None
+        offset = previous
+
+    return records if records and isinstance(records[-1][0], list) else None
+
+
+def _load_index(buf):
+    """
+    Return the ``_LogIndex`` of ``buf``, reading the chain of index records named by the footer if
+    there is one and scanning the records otherwise.
+    """
+    _read_header(buf)
+    log_index = _LogIndex(version=_HEADER.unpack_from(buf, 0)[1])
+    records = _read_index_records(buf)
+    if records is None:
+        _scan(buf, log_index)
+        return log_index
+
+    for payload, size in reversed(records):
+        if isinstance(payload, list):
+            for fields in payload:
+                log_index.add(_read_index_entry(fields))
+            log_index.full_size, log_index.delta_size = size, 0
+
+        else:
+            log_index.mark_obsolete(payload["obsolete"])
+            for fields in payload["entries"]:
+                log_index.add(_read_index_entry(fields))
+            log_index.delta_size += size
+
+    log_index.end = len(buf) - _FOOTER.size
+    log_index.last = _read_footer(buf)
+    return log_index
+
+
+def _load_entry(payload):
+    """
+    Unpickle the (possibly compressed) payload of an entry or tombstone record.
+    """
+    return pickle.load(open_data(payload))
+
+
+def _read_index_entry(fields):
+    """
+    Create an ``IndexEntry`` from the fields stored in an index record.
+    """
+    # indices written before blobs were added have no blobs field
+    if len(fields) == len(IndexEntry._fields) - 1:
+        fields = (*fields[:-1], None, fields[-1])
+    return IndexEntry(*fields)
+
+
+def _map(f):
+    """
+    Memory-map the file ``f`` for reading, returning ``b""`` if it is empty.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _file_key(f):
+    """
+    Return a key that changes whenever the file ``f`` is replaced or written to.
+    """
+    f.flush()
+    stat = os.fstat(f.fileno())
+    f.seek(max(stat.st_size - _FOOTER.size, 0))
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, f.read(_FOOTER.size))
+
+
+def _get_index(f, filename):
+    """
+    Return the ``_LogIndex`` of the log at ``filename``, open as ``f``, reusing the one cached by
+    this process if the file hasn't changed since it was last read or written. Must be called while
+    holding ``_INDEXES_LOCK``.
+    """
+    path, key = os.path.abspath(filename), _file_key(f)
+    log_index = _INDEXES.get(path)
+    if log_index is not None and log_index.key == key:
+        return log_index
+
+    if key[2] == 0:
+        return _LogIndex()
+
+    buf = _map(f)
+    try:
+        log_index = _load_index(buf)
+
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+    log_index.key = key
+    _INDEXES[path] = log_index
+    return log_index
+
+
+def _record(kind, payload):
+    return _RECORD_HEADER.pack(kind, len(payload)) + payload
+
+
+def _index_and_footer(index, offset):
+    return [
+        _record(INDEX_RECORD, pickle.dumps([tuple(ie) for ie in index])), 
+        _FOOTER.pack(offset, INDEX_MAGIC),
+    ]
+
+
+def _entry_records(entries, blob_table, offset, compression=None):
+    """
+    Return the records for ``entries``, each preceded by records for the blobs used by its shelf that
+    aren't already in the log, along with their index entries.
+
+    Args:
+        entries (``list`` of ``otter.check.logs.LogEntry``): the entries
+        blob_table (``dict``): a map from the hash of each blob in the log to its offset and length
+        offset (``int``): the offset at which the records will be written
+        compression (``otter.check.compression.LogCompression``, optional): the compression to
+            apply to the new blobs and, if configured, to the entries
+
+    Returns:
+        ``tuple`` of (``list`` of ``bytes``, ``list`` of ``IndexEntry``, ``int``): the records, the
+            index entries, and the offset after them
+    """
+    data, index, blob_table = [], [], ChainMap({}, blob_table)
+    for entry in entries:
+        for h in entry.get_blob_hashes():
+            if h not in blob_table:
+                blob = entry.blobs[h]
+                if compression is not None:
+                    blob = compression.compress(blob)
+
+                data.append(_record(BLOB_RECORD, bytes.fromhex(h) + blob))
+                blob_table[h] = (offset + _RECORD_HEADER.size + _DIGEST_SIZE, len(blob))
+                offset += len(data[-1])
+
+        # the blobs are stored in their own records instead of in the pickled entry
+        entry = copy.copy(entry)
+        entry.blobs = {}
+        payload = pickle.dumps(entry)
+        if compression is not None and compression.entries:
+            payload = compression.compress(payload)
+
+        data.append(_record(ENTRY_RECORD, payload))
+        index.append(
+            _make_index_entry(entry, offset + _RECORD_HEADER.size, len(payload), blob_table))
+        offset += len(data[-1])
+
+    return data, index, offset
+
+
+def read_generation(filename):
+    """
+    Read the generation of the indexed log at ``filename``, which is incremented each time the log is
+    compacted (and its entries are moved).
+
+    Args:
+        filename (``str``): the path to the log
+
+    Returns:
+        ``int``: the generation
+    """
+    with open(filename, "rb") as f:
+        return _read_header(f.read(_HEADER.size))[1]
+
+
+def read_index(filename):
+    """
+    Read the index of the indexed log at ``filename`` without reading any of its entries.
+
+    Args:
+        filename (``str``): the path to the log
+
+    Returns:
+        ``list`` of ``IndexEntry``: the index, in the order in which the entries were written
+    """
+    with _INDEXES_LOCK, open(filename, "rb") as f:
+        return list(_get_index(f, filename).index)
+
+
+def read_entries(filename, index_entries):
+    """
+    Read the entries located by ``index_entries`` from the indexed log at ``filename``, along with
+    the blobs used by their shelves. The shelves of entries marked obsolete are removed.
+
+    Args:
+        filename (``str``): the path to the log
+        index_entries (``list`` of ``IndexEntry``): the index entries of the entries to read
+
+    Returns:
+        ``list`` of ``otter.check.logs.LogEntry``: the entries
+    """
+    with open(filename, "rb") as f:
+        buf = _map(f)
+        try:
+            entries, blobs = [], {}
+            for ie in index_entries:
+                entry = _load_entry(buf[ie.offset:ie.offset + ie.length])
+                if ie.obsolete:
+                    entry.shelf = None
+
+                elif ie.blobs:
+                    for h, offset, length in ie.blobs:
+                        if h not in blobs:
+                            blobs[h] = buf[offset:offset + length]
+                    entry.blobs = {h: blobs[h] for h, _, _ in ie.blobs}
+
+                entries.append(entry)
+
+            return entries
+
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+
+def append_entries(filename, entries, obsolete=[], compression=None):
+    """
+    Append ``entries`` to the indexed log at ``filename``, creating it if it doesn't exist, and
+    append the changes to the index.
+
+    If ``obsolete`` contains the offsets of any entries, a tombstone marking their shelves as
+    obsolete is appended before the entries. Each blob used by the shelves of ``entries`` is only
+    written if the log doesn't already contain a blob with the same hash, so variables that haven't
+    changed since they were last shelved aren't stored again (or compressed again, if
+    ``compression`` is set). The new records are written over the footer, followed by a delta index
+    record that only holds the new entries and obsolete offsets, so the cost of an append doesn't
+    grow with the log. The index is kept in memory between appends and is only read again if the
+    file was changed by another process. Records don't move until the log is compacted, which
+    happens when enough of it is taken up by obsolete shelves (see ``compact_log``). If the footer
+    is missing, the index is rebuilt from the records and any incomplete record at the end of the
+    file is discarded.
+
+    Args:
+        filename (``str``): the path to the log
+        entries (``list`` of ``otter.check.logs.LogEntry``): the entries to append
+        obsolete (``list`` of ``int``, optional): the offsets of the entries whose shelves are
+            obsolete
+        compression (``otter.check.compression.LogCompression``, optional): the compression to
+            apply to the new blobs and, if configured, to the entries
+    """
+    path = os.path.abspath(filename)
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+    with _INDEXES_LOCK, os.fdopen(fd, "r+b") as f:
+        log_index = _get_index(f, filename)
+
+        # the cached index is updated before the records are written, so it is discarded if writing
+        # them fails
+        try:
+            data, offset = [], log_index.end
+            if offset is None:
+                data.append(_HEADER.pack(LOG_MAGIC, LOG_VERSION, 0))
+                offset = 0
+
+            # older logs are converted by updating the version in their header, since their index
+            # record is a valid full index record
+            elif log_index.version < LOG_VERSION:
+                f.seek(len(LOG_MAGIC))
+                f.write(struct.pack(">H", LOG_VERSION))
+                log_index.version = LOG_VERSION
+
+            f.seek(offset)
+            offset += sum(len(d) for d in data)
+            if obsolete:
+                data.append(_record(TOMBSTONE_RECORD, pickle.dumps(list(obsolete))))
+                log_index.mark_obsolete(obsolete)
+                offset += len(data[-1])
+
+            records, index, offset = _entry_records(
+                entries, log_index.blob_table, offset, compression=compression)
+            data.extend(records)
+            for ie in index:
+                log_index.add(ie)
+
+            if log_index.last is None or log_index.delta_size > log_index.full_size:
+                data.extend(_index_and_footer(log_index.index, offset))
+                log_index.full_size, log_index.delta_size = len(data[-2]), 0
+
+            else:
+                data.append(_record(INDEX_RECORD, pickle.dumps({
+                    "previous": log_index.last,
+                    "entries": [tuple(ie) for ie in index],
+                    "obsolete": list(obsolete),
+                })))
+                data.append(_FOOTER.pack(offset, INDEX_MAGIC))
+                log_index.delta_size += len(data[-2])
+
+            log_index.last, log_index.end = offset, offset + len(data[-2])
+
+            f.write(b"".join(data))
+            f.truncate()
+            log_index.key = _file_key(f)
+            _INDEXES[path] = log_index
+
+        except BaseException:
+            _INDEXES.pop(path, None)
+            raise
+
+        needs_compaction = log_index.needs_compaction()
+
+    if needs_compaction:
+        try:
+            compact_log(filename)
+
+        # the log is still valid if it can't be compacted (e.g. if it is open in another process on
+        # Windows), so compaction is tried again after the next append
+        except OSError:
+            pass
+
+
+@contextmanager
+def _replacing(filename):
+    """
+    Open a temporary file in the same directory as ``filename`` for writing and replace 
+    ``filename`` with it when the context exits without an error, so that the log is never left
+    partially written.
+    """
+    temp_path = os.path.join(
+        os.path.dirname(os.path.abspath(filename)), f".{os.path.basename(filename)}.tmp")
+
+    try:
+        with open(temp_path, "wb") as f:
+            yield f
+
+        os.replace(temp_path, filename)
+
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def write_entries(filename, entries):
+    """
+    Replace the log at ``filename`` with an indexed log containing ``entries``.
+
+    Args:
+        filename (``str``): the path to the log
+        entries (``list`` of ``otter.check.logs.LogEntry``): the entries to write
+    """
+    with _INDEXES_LOCK, _replacing(filename) as f:
+        records, index, offset = _entry_records(entries, {}, _HEADER.size)
+        f.write(_HEADER.pack(LOG_MAGIC, LOG_VERSION, 0))
+        f.write(b"".join(records + _index_and_footer(index, offset)))
+
+
+def compact_log(filename):
+    """
+    Rewrite the indexed log at ``filename`` without the shelves marked obsolete by tombstones and the
+    blobs used only by them, if it has any, and increment its generation.
+
+    The records of entries without obsolete shelves and of the blobs they use are copied as-is
+    (without being decompressed); only entries with obsolete shelves are unpickled and pickled again
+    without their shelves.
+
+    Args:
+        filename (``str``): the path to the log
+    """
+    with _INDEXES_LOCK:
+        index = read_index(filename)
+        if not any(ie.obsolete for ie in index):
+            return
+
+        with _replacing(filename) as f, open(filename, "rb") as src:
+            buf = _map(src)
+            try:
+                new_index, blob_table, offset = [], {}, _HEADER.size
+                f.write(_HEADER.pack(LOG_MAGIC, LOG_VERSION, _read_header(buf)[1] + 1))
+                for ie in index:
+                    payload, blobs = buf[ie.offset:ie.offset + ie.length], []
+                    if ie.obsolete:
+                        entry = _load_entry(payload)
+                        entry.shelf = None
+                        payload = pickle.dumps(entry)
+
+                    else:
+                        for h, blob_offset, length in ie.blobs or []:
+                            if h not in blob_table:
+                                blob = buf[blob_offset:blob_offset + length]
+                                f.write(_record(BLOB_RECORD, bytes.fromhex(h) + blob))
+                                blob_table[h] = (
+                                    offset + _RECORD_HEADER.size + _DIGEST_SIZE, length)
+                                offset += _RECORD_HEADER.size + _DIGEST_SIZE + length
+                            blobs.append((h, *blob_table[h]))
+
+                    f.write(_record(ENTRY_RECORD, payload))
+                    new_index.append(ie._replace(
+                        offset=offset + _RECORD_HEADER.size, length=len(payload),
+                        blobs=tuple(blobs) or None, obsolete=False))
+                    offset += _RECORD_HEADER.size + len(payload)
+
+                f.write(b"".join(_index_and_footer(new_index, offset)))
+
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
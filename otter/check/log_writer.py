@@ -0,0 +1,262 @@
+"""A background thread that writes entries to Otter's log"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+from .log_file import append_entries
+
+
+# the maximum number of entries waiting to be written; submitting an entry blocks while it is full
+MAX_QUEUED_ENTRIES = 64
+
+# the maximum number of entries written in one append
+MAX_BATCH_SIZE = 32
+
+# the maximum number of seconds for which written entries may wait to be fsynced
+FSYNC_INTERVAL = 2
+
+
+class _Write:
+    """
+    A request to append an entry to a log.
+    """
+
+    def __init__(self, entry, filename, compression, replace_shelves):
+        self.entry = entry
+        self.filename = filename
+        self.compression = compression
+        self.replace_shelves = replace_shelves
+
+
+class _Flush:
+    """
+    A request to write and fsync all of the entries submitted before it.
+    """
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class LogWriter:
+    """
+    A background thread that appends entries to logs, so that logging an event doesn't block the
+    caller on writing to the file system.
+
+    Entries are put into a bounded queue by ``LogWriter.submit`` and the thread appends them in
+    batches in the order in which they were submitted. Written entries are fsynced at most
+    ``FSYNC_INTERVAL`` seconds after they are written. ``LogWriter.flush`` blocks until every entry
+    submitted before it has been written and fsynced, and is called when the interpreter exits.
+
+    The thread is the only code in this process that should write to a log while it has entries
+    waiting to be written, so logs should be flushed before they are read or written by anything
+    else. Errors raised while writing entries are raised by the next call to ``LogWriter.submit`` or
+    ``LogWriter.flush``.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(MAX_QUEUED_ENTRIES)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._error = None
+        self._unsynced = set()
+        self._last_fsync = time.monotonic()
+
+    def _start(self):
+        """
+        Starts the writer thread, if it isn't already running.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="otter-log-writer", daemon=True)
+                self._thread.start()
+
+    def _raise_error(self):
+        """
+        Raises the error recorded by the writer thread, if any.
+        """
+        error, self._error = self._error, None
+        if error is not None:
+            raise Exception(
+                "Could not write to the log file. Please contact your instructor before continuing "
+                "on this assignment."
+            ) from error
+
+    def submit(self, entry, filename, compression=None, replace_shelves=False):
+        """
+        Queues ``entry`` to be appended to the log at ``filename``, blocking only if the queue is full.
+
+        Args:
+            entry (``otter.check.logs.LogEntry``): the entry
+            filename (``str``): the path to the log
+            compression (``otter.check.compression.LogCompression``, optional): the compression to
+                apply to the entry
+            replace_shelves (``bool``, optional): whether to mark the shelves of earlier entries for
+                the entry's question obsolete when it is written (see
+                ``otter.check.logs.LogEntry.replace_previous_shelves``)
+        """
+        self._raise_error()
+        self._start()
+        self._queue.put(_Write(entry, filename, compression, replace_shelves))
+
+    def flush(self):
+        """
+        Blocks until every entry submitted so far has been written to its log and fsynced.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            request = _Flush()
+            self._queue.put(request)
+            request.done.wait()
+
+        self._raise_error()
+
+    def close(self):
+        """
+        Writes and fsyncs every entry submitted so far and stops the writer thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            request = _Flush(stop=True)
+            self._queue.put(request)
+            request.done.wait()
+            self._thread.join()
+
+    def _fsync(self):
+        """
+        Fsyncs the logs that have been written to since they were last fsynced.
+        """
+        for filename in self._unsynced:
+            try:
+                with open(filename, "ab") as f:
+                    os.fsync(f.fileno())
+
+            except OSError as e:
+                self._error = self._error or e
+
+        self._unsynced.clear()
+        self._last_fsync = time.monotonic()
+
+    def _write(self, requests, obsolete):
+        """
+        Appends the entries of ``requests``, which are for the same log and compression, in one
+        append.
+        """
+        if not requests:
+            return
+
+        filename = requests[0].filename
+        try:
+            append_entries(
+                filename, [r.entry for r in requests], obsolete=obsolete,
+                compression=requests[0].compression)
+
+        except OSError as e:
+            self._error = self._error or e
+
+        self._unsynced.add(filename)
+
+    def _write_batch(self, batch):
+        """
+        Writes a batch of requests taken from the queue, grouping consecutive entries for the same
+        log into one append. Returns whether the thread should stop.
+        """
+        pending, obsolete = [], []
+        for request in batch:
+            if isinstance(request, _Flush):
+                self._write(pending, obsolete)
+                pending, obsolete = [], []
+                self._fsync()
+                request.done.set()
+                if request.stop:
+                    return True
+                continue
+
+            # an entry replacing the shelf of a pending entry needs that entry to be in the log
+            if pending and (request.filename != pending[0].filename or \
+                    request.compression is not pending[0].compression or \
+                    (request.replace_shelves and \
+                        any(r.entry.question == request.entry.question for r in pending))):
+                self._write(pending, obsolete)
+                pending, obsolete = [], []
+
+            if request.replace_shelves:
+                try:
+                    obsolete.extend(request.entry.replace_previous_shelves(request.filename))
+
+                except OSError as e:
+                    self._error = self._error or e
+
+            pending.append(request)
+
+        self._write(pending, obsolete)
+        return False
+
+    def _run(self):
+        """
+        The main loop of the writer thread.
+        """
+        while True:
+            timeout = None
+            if self._unsynced:
+                timeout = max(0, self._last_fsync + FSYNC_INTERVAL - time.monotonic())
+
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                self._fsync()
+                continue
+
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                stop = self._write_batch(batch)
+
+            # keep the thread alive so that callers waiting on the queue aren't blocked forever
+            except Exception as e:
+                self._error = self._error or e
+                for request in batch:
+                    if isinstance(request, _Flush):
+                        request.done.set()
+                stop = any(isinstance(r, _Flush) and r.stop for r in batch)
+
+            if stop:
+                return
+
+            if self._unsynced and time.monotonic() - self._last_fsync >= FSYNC_INTERVAL:
+                self._fsync()
+
+
+_log_writer = None
+
+
+def get_log_writer():
+    """
+    Returns the log writer shared by this process, creating it if necessary. The writer is flushed
+    when the interpreter exits.
+
+    Returns:
+        ``LogWriter``: the log writer
+    """
+    global _log_writer
+    if _log_writer is None:
+        _log_writer = LogWriter()
+        atexit.register(_log_writer.close)
+    return _log_writer
+
+
+def _reset_log_writer():
+    """
+    Drops the log writer inherited by a forked process, whose thread and queue don't survive the fork.
+    """
+    global _log_writer
+    _log_writer = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_log_writer)
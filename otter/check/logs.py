@@ -4,15 +4,19 @@ Logging for Otter Check
 
 import os
 import pickle
+import hashlib
 import types
 import dill
-import tempfile
 import datetime as dt
 import numpy as np
 
 from enum import Enum, auto
 from glob import glob
 
+from .compression import open_data
+from .log_file import (
+    append_entries, is_indexed_log, read_entries, read_generation, read_index, write_entries)
+
 class QuestionNotInLogException(Exception):
     """
     Exception that indicates that a specific question was not found in any entry in the log
@@ -61,7 +65,10 @@ class LogEntry:
 
     Attributes:
         event_type (``EventType``): the entry type
-        shelf (``bytes``): a pickled environment stored as a bytes string
+        shelf (``dict``): a map of the name of each shelved variable to the hash of its pickled value
+            in ``blobs`` (entries shelved by older versions of Otter store the pickled environment as
+            a ``bytes`` string instead)
+        blobs (``dict``): a map of hashes to the pickled values of the shelved variables
         unshelved (``list`` of ``str``): a list of variable names that were unable to be pickled during
             shelving
         results (``list`` of ``otter.test_files.abstract_test.TestCollectionResults``): grading results 
@@ -76,6 +83,7 @@ class LogEntry:
         assert event_type in EventType, "Invalid event type"
         self.event_type = event_type
         self.shelf = shelf
+        self.blobs = {}
         self.unshelved = []
         self.results = results
         self.question = question
@@ -125,16 +133,27 @@ class LogEntry:
         if self.error is not None:
             raise self.error
 
-    def flush_to_file(self, filename):
+    def flush_to_file(self, filename, compression=None):
         """
         Appends this log entry (pickled) to a file
+
+        New logs are written in the indexed format of ``otter.check.log_file``; entries are appended
+        to logs in the original format as a stream of pickled entries so that they stay readable.
+        ``compression`` is only applied to logs in the indexed format.
         
         Args:
             filename (``str``): the path to the file to append this entry
+            compression (``otter.check.compression.LogCompression``, optional): the compression to
+                apply to the variables in this entry's shelf and, if configured, to the entry
         """
         try:
-            file = open(filename, "ab+")
-            pickle.dump(self, file)
+            if os.path.isfile(filename) and os.path.getsize(filename) > 0 and \
+                    not is_indexed_log(filename):
+                with open(filename, "ab+") as file:
+                    pickle.dump(self, file)
+
+            else:
+                append_entries(filename, [self], compression=compression)
 
         except OSError:
             raise Exception(
@@ -142,15 +161,14 @@ class LogEntry:
                 "instructor before continuing on this assignment."
             )
 
-        finally:
-            if "file" in locals():
-                file.close()
-
     def shelve(self, env, delete=False, filename=None, ignore_modules=[], variables=None):
         """
-        Stores an environment ``env`` in this log entry using dill as a ``bytes`` object in this entry
-        as the ``shelf`` attribute. Writes names of any variables in ``env`` that are not stored to
-        the ``unshelved`` attribute.
+        Stores an environment ``env`` in this log entry by pickling each variable with dill into the
+        ``blobs`` attribute, keyed by the SHA-256 hash of its pickle, and recording the hash of each
+        variable in the ``shelf`` attribute. Writes names of any variables in ``env`` that are not
+        stored to the ``unshelved`` attribute. When the entry is written to an indexed log, blobs
+        that are already in the log (e.g. because the variable hasn't changed since the last check)
+        are not written again.
 
         If ``delete`` is ``True``, old environments in the log at ``filename`` for this question are
         cleared before writing ``env``. Any module names in ``ignore_modules`` will have their functions
@@ -167,57 +185,115 @@ class LogEntry:
         Returns:
             ``LogEntry``: this entry
         """
-        # delete old entry without reading entire log
+        # mark old environments for this question obsolete without reading the entire log
         if delete:
             assert filename, "old env deletion indicated but no log filename provided"
-            try:                
-                # copy the existing log to a temporary file so that we can edit the original
-                with tempfile.TemporaryFile() as tf:
-                    with open(filename, "rb") as f:
-                        tf.write(f.read())
-                    tf.seek(0)
-                    os.system(f"rm -f {filename}")
-                    while True:
-                        try:
-                            entry = pickle.load(tf)
-
-                            if entry.question == self.question and entry.shelf is not None:
-
-                                # only edit variables if it's not provided
-                                if variables is None:
-                                    variables = list(entry.unshelve().keys())
-                                    variables_stored = None
-                                else:
-                                    variables_stored = list(entry.unshelve().keys())
-                                
-                                entry.shelf = None
-
-                            entry.flush_to_file(filename)
-
-                            del locals()["entry"]
-
-                        except EOFError:
-                            break
-
-            except FileNotFoundError:
-                pass
 
-        try:
-            if isinstance(variables_stored, list):
-                variables = {k : v for k, v in variables.items() if k in variables_stored}
-        except UnboundLocalError:
-            pass
+            previous = self._find_previous_shelves(filename)
+            if previous:
+
+                # only edit variables if it's not provided
+                if variables is None:
+                    variables = list(previous[-1].shelved)
+                else:
+                    variables = {k : v for k, v in variables.items() if k in previous[-1].shelved}
+
+                append_entries(filename, [], obsolete=[ie.offset for ie in previous])
+
+        pickled_env, unshelved = LogEntry.serialize_environment(env, variables=variables, ignore_modules=ignore_modules)
+        self.shelf, self.blobs = {}, {}
+        for k, data in pickled_env.items():
+            h = hashlib.sha256(data).hexdigest()
+            self.shelf[k] = h
+            self.blobs[h] = data
 
-        shelf_contents, unshelved = LogEntry.shelve_environment(env, variables=variables, ignore_modules=ignore_modules)
-        self.shelf = shelf_contents
         self.unshelved = unshelved
         return self
-        
+
+    def _find_previous_shelves(self, filename):
+        """
+        Returns the index entries of the entries for this entry's question in the log at
+        ``filename`` whose shelves are not obsolete, converting the log to the indexed format if it
+        is in the original format.
+
+        Args:
+            filename (``str``): the path to the log
+
+        Returns:
+            ``list`` of ``otter.check.log_file.IndexEntry``: the index entries
+        """
+        # logs in the original format are converted to the indexed format once
+        if os.path.isfile(filename) and os.path.getsize(filename) > 0 and \
+                not is_indexed_log(filename):
+            write_entries(filename, LogEntry._read_entries_in_order(filename))
+
+        index = read_index(filename) if os.path.isfile(filename) else []
+        return [ie for ie in index if ie.question == self.question and ie.shelved is not None]
+
+    def replace_previous_shelves(self, filename):
+        """
+        Prepares this shelved entry to replace the environments of earlier entries for its question
+        in the log at ``filename``, for entries that are shelved before the log is available to
+        write to (e.g. by ``otter.check.log_writer.LogWriter``). As when ``shelve`` is called with
+        ``delete=True``, only the variables in the most recent earlier environment are kept.
+
+        Args:
+            filename (``str``): the path to the log
+
+        Returns:
+            ``list`` of ``int``: the offsets of the earlier entries, whose shelves should be marked
+                obsolete when this entry is appended to the log
+        """
+        if not isinstance(self.shelf, dict):
+            return []
+
+        previous = self._find_previous_shelves(filename)
+        if not previous:
+            return []
+
+        for k in list(self.shelf):
+            if k not in previous[-1].shelved:
+                del self.shelf[k]
+                self.unshelved.append(k)
+
+        hashes = set(self.shelf.values())
+        self.blobs = {h: b for h, b in self.blobs.items() if h in hashes}
+
+        return [ie.offset for ie in previous]
+
+    def get_shelved_variables(self):
+        """
+        Returns the names of the variables stored in this entry's shelf.
+
+        Returns:
+            ``list`` of ``str``: the variable names, or ``None`` if this entry has no shelf
+        """
+        if self.shelf is None:
+            return None
+
+        # entries shelved by older versions of Otter store the whole environment in one pickle
+        if not isinstance(self.shelf, dict):
+            return list(dill.loads(self.shelf).keys())
+
+        return list(self.shelf)
+
+    def get_blob_hashes(self):
+        """
+        Returns the hashes of the blobs used by this entry's shelf.
+
+        Returns:
+            ``list`` of ``str``: the hashes
+        """
+        if not isinstance(self.shelf, dict):
+            return []
+        return list(dict.fromkeys(self.shelf.values()))
+
     def unshelve(self, global_env={}):
         """
-        Parses a ``bytes`` object stored in the ``shelf`` attribute and unpickles the object stored
-        there using dill. Updates the ``__globals__`` of any functions in ``shelf`` to include elements
-        in the shelf. Optionally includes the env passed in as ``global_env``.
+        Unpickles the variables stored in the ``shelf`` attribute using dill, decompressing them
+        as they are read if they were compressed when the entry was written. Updates the
+        ``__globals__`` of any functions in ``shelf`` to include elements in the shelf. Optionally
+        includes the env passed in as ``global_env``.
 
         Args:
             global_env (``dict``, optional): a global env to include in unpickled function globals
@@ -225,14 +301,16 @@ class LogEntry:
         Returns:
             ``dict``: the shelved environment
         """
-        assert self.shelf, "no shelf in this entry"
+        assert self.shelf is not None, "no shelf in this entry"
+
+        if isinstance(self.shelf, dict):
+            shelf = {k: dill.load(open_data(self.blobs[h])) for k, h in self.shelf.items()}
+
+        # entries shelved by older versions of Otter store the whole environment in one pickle
+        else:
+            shelf = dill.load(open_data(self.shelf))
+
 
-        # read bytes in self.shelf and load with dill
-        with tempfile.TemporaryFile() as tf:
-            tf.write(self.shelf)
-            tf.seek(0)
-            shelf = dill.load(tf)
-            
         # add the unpickeld env and global_env to all function __globals__
         for k, v in shelf.items():
             if type(v) == types.FunctionType:
@@ -259,95 +337,113 @@ class LogEntry:
         return list(sorted(log, key = lambda l: l.timestamp, reverse = True))
 
     @staticmethod
-    def log_from_file(filename, ascending=True):
+    def _read_entries_in_order(filename):
         """
-        Reads a log file and returns a sorted list of the log entries pickled in that file
-        
+        Reads all of the entries in a log file of either format in the order in which they were
+        written.
+
         Args:
             filename (``str``): the path to the log
-            ascending (``bool``, optional): whether the log should be sorted in ascending (chronological) 
-                order; default ``True``
 
         Returns:
-            ``list`` of ``LogEntry``: the sorted log
+            ``list`` of ``LogEntry``: the entries
         """
-        try:
-            file = open(filename, "rb")
+        if is_indexed_log(filename):
+            return read_entries(filename, read_index(filename))
 
-            log = []
+        log = []
+        with open(filename, "rb") as file:
             while True:
                 try:
                     log.append(pickle.load(file))
                 except EOFError:
                     break
 
-            log = list(sorted(log, key = lambda l: l.timestamp, reverse = not ascending))
-            
-            return log
-            
-        finally:
-            file.close()
+        return log
 
     @staticmethod
-    def shelve_environment(env, variables=None, ignore_modules=[]):
+    def log_from_file(filename, ascending=True):
+        """
+        Reads a log file and returns a sorted list of the log entries pickled in that file
+        
+        Args:
+            filename (``str``): the path to the log
+            ascending (``bool``, optional): whether the log should be sorted in ascending (chronological) 
+                order; default ``True``
+
+        Returns:
+            ``list`` of ``LogEntry``: the sorted log
+        """
+        log = LogEntry._read_entries_in_order(filename)
+        return list(sorted(log, key = lambda l: l.timestamp, reverse = not ascending))
+
+    @staticmethod
+    def serialize_environment(env, variables=None, ignore_modules=[]):
         """
-        Pickles an environment ``env`` using dill, ignoring any functions whose module is listed in
-        ``ignore_modules``. Returns the pickle file contents as a ``bytes`` object and a list of
+        Pickles each variable in an environment ``env`` separately using dill, ignoring any functions
+        whose module is listed in ``ignore_modules``. Each variable is pickled once, and only if it
+        is selected by ``variables``. Returns a map of variable names to their pickles and a list of
         variable names that were unable to be shelved/ignored during shelving.
 
+        Because each variable is pickled separately, variables that refer to the same object are
+        unpickled as separate copies.
+
         Args:
             env (``dict``): the environment to shelve
-            variables (``dict`` *or* ``list``, optional): a map of variable name to type string indicating 
-                **only** variables to include (all variables not in this dictionary will be ignored) 
-                or a list of variable names to include regardless of tpye
-            ignore_modules (``list`` of ``str``, optional): the module names to igonre
+            variables (``dict`` *or* ``list``, optional): a map of variable name to type string indicating
+                **only** variables to include (all variables not in this dictionary will be ignored)
+                or a list of variable names to include regardless of type
+            ignore_modules (``list`` of ``str``, optional): the module names to ignore
 
         Returns:
-            ``tuple`` of (``bytes``, ``list`` of ``str``): the pickled environment and list of unshelved
-                variable names.
+            ``tuple`` of (``dict``, ``list`` of ``str``): the map of variable names to their pickles
+                and list of unshelved variable names.
         """
         from .notebook import Notebook
         unshelved = []
-        filtered_env = {}
+        pickled_env = {}
         for k, v in env.items():
 
             # don't store modules or otter.Notebook instances
             if type(v) == types.ModuleType or type(v) == Notebook:
                 unshelved.append(k)
-            
+
             # ignore any functions whose __module__ is in ignore_modules
             elif type(v) == types.FunctionType and v.__module__ in ignore_modules:
                 unshelved.append(k)
-            
-            # ensure object is pickleable by attempting dump and if so add to filtered_env
+
+            # only store variable names in variables that have the correct type
+            elif variables and (k not in variables or (isinstance(variables, dict) and \
+                    type(v).__module__ + "." + type(v).__name__ != variables[k])):
+                unshelved.append(k)
+
+            # store the pickle if the object can be pickled
             else:
                 try:
-                    dill.dumps(v)
-
-                    # only store variable names in variables that have the correct type
-                    if (variables and k in variables) or not variables:
-                        full_type = type(v).__module__ + "." + type(v).__name__
+                    pickled_env[k] = dill.dumps(v)
+                except:
+                    unshelved.append(k)
 
-                        if (isinstance(variables, dict) and full_type == variables[k]) or \
-                            isinstance(variables, list) or not variables:
-                            filtered_env[k] = v
+        return pickled_env, unshelved
 
-                        else:
-                            unshelved.append(k)
+    @staticmethod
+    def shelve_environment(env, variables=None, ignore_modules=[]):
+        """
+        Pickles each variable in an environment ``env`` separately using dill. This is an alias of
+        ``LogEntry.serialize_environment`` kept for backwards compatibility.
 
-                    else:
-                        unshelved.append(k)
-                        
-                except:
-                    unshelved.append(k)
+        Args:
+            env (``dict``): the environment to shelve
+            variables (``dict`` *or* ``list``, optional): a map of variable name to type string indicating
+                **only** variables to include (all variables not in this dictionary will be ignored)
+                or a list of variable names to include regardless of type
+            ignore_modules (``list`` of ``str``, optional): the module names to ignore
 
-        # dump filtered_env to a temporary file and then return the bytes and unshelved list
-        with tempfile.TemporaryFile() as tf:
-            dill.dump(filtered_env, tf)
-            tf.seek(0)
-            shelf_contents = tf.read()
-            
-        return shelf_contents, unshelved
+        Returns:
+            ``tuple`` of (``dict``, ``list`` of ``str``): the map of variable names to their pickles
+                and list of unshelved variable names.
+        """
+        return LogEntry.serialize_environment(env, variables=variables, ignore_modules=ignore_modules)
 
 
 class Log:
@@ -355,6 +451,11 @@ class Log:
     A class for reading and interacting with a log. Allows you to iterate over the entries in the log 
     and supports integer indexing. *Does not support editing the log file.*
 
+    Logs read from files in the indexed format of ``otter.check.log_file`` only read the index of the 
+    file when they are created. ``Log.get_questions`` is answered from the index and 
+    ``Log.get_question_entry`` only reads the entry it returns; all of the entries are read the 
+    first time ``entries`` is accessed.
+
     Args:
         entries (``list`` of ``LogEntry``): the list of entries for this log
         ascending (``bool``, optional): whether the log is sorted in ascending (chronological) order;
@@ -367,8 +468,23 @@ class Log:
     """
 
     def __init__(self, entries, ascending=True):
-        self.entries = entries
+        self._entries = entries
         self.ascending = ascending
+        self._filename = None
+        self._index = None
+        self._generation = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._read_entries(self._index)
+            self._index = None
+        return self._entries
+
+    @entries.setter
+    def entries(self, entries):
+        self._entries = entries
+        self._index = None
 
     def __repr__(self):
         return "otter.logs.Log([\n  {}\n])".format(",\n  ".join([repr(e) for e in self.entries]))
@@ -395,8 +511,10 @@ class Log:
         Args:
             ascending (``bool``, optional): whether to sort the log chronologically; defaults to ``True``
         """
-        self.entries = LogEntry.sort_log(self.entries, ascending=ascending)
-        # self.entries = LogEntry.sort_log(self.entries)
+        if self._index is not None:
+            self._index = sorted(self._index, key = lambda ie: ie.timestamp, reverse = not ascending)
+        else:
+            self.entries = LogEntry.sort_log(self.entries, ascending=ascending)
         self.ascending = ascending
 
     def get_questions(self):
@@ -406,7 +524,10 @@ class Log:
         Returns:
             ``list`` of ``str``: the questions in this log
         """
-        all_questions = [entry.question for entry in self.entries if entry.event_type == EventType.CHECK]
+        if self._index is not None:
+            all_questions = [ie.question for ie in self._index if ie.event_type == EventType.CHECK.name]
+        else:
+            all_questions = [entry.question for entry in self.entries if entry.event_type == EventType.CHECK]
         return list(sorted(set(all_questions)))
 
     @classmethod
@@ -422,7 +543,31 @@ class Log:
         Returns:
             ``Log``: the ``Log`` instance created from the file
         """
-        return cls(entries=LogEntry.log_from_file(filename, ascending=ascending), ascending=ascending)
+        if not is_indexed_log(filename):
+            return cls(entries=LogEntry.log_from_file(filename, ascending=ascending), ascending=ascending)
+
+        log = cls(entries=None, ascending=ascending)
+        log._filename = filename
+        log._generation = read_generation(filename)
+        log._index = read_index(filename)
+        log.sort(ascending=ascending)
+        return log
+
+    def _read_entries(self, index_entries):
+        """
+        Reads the entries located by ``index_entries`` from this log's file. If the file has been
+        compacted since its index was read, the index is read again first, since the entries may
+        have moved.
+        """
+        generation = read_generation(self._filename)
+        if generation != self._generation:
+            key = lambda ie: (ie.event_type, ie.question, ie.timestamp)
+            new_index = {key(ie): ie for ie in read_index(self._filename)}
+            self._index = [new_index[key(ie)] for ie in self._index]
+            index_entries = [new_index[key(ie)] for ie in index_entries]
+            self._generation = generation
+
+        return read_entries(self._filename, index_entries)
 
     def get_question_entry(self, question):
         """
@@ -438,11 +583,15 @@ class Log:
             ``QuestionNotInLogException``: if the question is not in the log
         """
         if self.ascending:
-            self.entries = LogEntry.sort_log(self.entries, ascending=False)
-            self.ascending = False
-        for entry in self.entries:
-            if entry.question == question:
-                return entry
+            self.sort(ascending=False)
+        if self._index is not None:
+            for ie in self._index:
+                if ie.question == question:
+                    return self._read_entries([ie])[0]
+        else:
+            for entry in self.entries:
+                if entry.question == question:
+                    return entry
         raise QuestionNotInLogException(f"question {question} is not in the log")
 
     def get_results(self, question):
@@ -1,6 +1,7 @@
 """IPython notebook API for Otter Check"""
 
 import datetime as dt
+import contextvars
 import inspect
 import json
 import os
@@ -17,6 +18,9 @@ from IPython.display import display, HTML, Javascript
 from textwrap import indent
 from urllib.parse import urljoin
 
+from .compression import LogCompression
+from .log_file import compact_log, is_indexed_log
+from .log_writer import get_log_writer
 from .logs import LogEntry, EventType, Log
 from .utils import colab_incompatible, grade_zip_file, logs_event, running_on_colab, save_notebook
 
@@ -31,6 +35,10 @@ _OTTER_LOG_FILENAME = ".OTTER_LOG"
 _SHELVE = False
 _ZIP_NAME_FILENAME = "__zip_filename__"
 
+# overrides the tests_dir arg of Notebook.__init__, used for changing the tests dir during grading;
+# a context variable so that concurrent grading calls don't see each others' overrides
+_TESTS_DIR_OVERRIDE = contextvars.ContextVar("tests_dir_override", default=None)
+
 
 class Notebook:
     """
@@ -43,9 +51,6 @@ class Notebook:
             this information is automatically parsed from IPython on creation
     """
 
-    # overrides tests_dir arg in __init__, used for changing tests dir during grading
-    _tests_dir_override = None
-
     @logs_event(EventType.INIT)
     def __init__(self, nb_path=None, tests_dir="./tests", colab=None):
         global _SHELVE
@@ -56,8 +61,9 @@ class Notebook:
         if colab and not os.path.isdir(tests_dir):
             raise ValueError(f"Tests directory {tests_dir} does not exist")
 
-        if type(self)._tests_dir_override is not None:
-            self._path = type(self)._tests_dir_override
+        tests_dir_override = _TESTS_DIR_OVERRIDE.get()
+        if tests_dir_override is not None:
+            self._path = tests_dir_override
         else:
             self._path = tests_dir
 
@@ -65,6 +71,8 @@ class Notebook:
         self._notebook = nb_path
         self._addl_files = []
         self._plugin_collections = {}
+        self._log_compression = None
+        self._log_writer = None
 
         # assume using otter service if there is a .otter file
         otter_configs = glob("*.otter")
@@ -80,6 +88,16 @@ class Notebook:
             self._ignore_modules = self._config.get("ignore_modules", [])
             self._vars_to_store = self._config.get("variables", None)
 
+            if self._config.get("log_compression") is not None:
+                self._log_compression = LogCompression(
+                    self._config["log_compression"],
+                    level=self._config.get("log_compression_level", None),
+                    entries=self._config.get("compress_log_entries", False),
+                )
+
+            if self._config.get("async_logging", False):
+                self._log_writer = get_log_writer()
+
             self._notebook = self._config["notebook"]
 
     def _log_event(self, event_type, results=[], question=None, success=True, error=None, shelve_env={}):
@@ -102,16 +120,34 @@ class Notebook:
             error=error
         )
 
-        if _SHELVE and event_type == EventType.CHECK:
+        # the log configurations aren't set if __init__ raised an error before reading the config
+        compression = getattr(self, "_log_compression", None)
+        log_writer = getattr(self, "_log_writer", None)
+        shelve = _SHELVE and event_type == EventType.CHECK
+
+        # the environment is shelved now, since it may change before the entry is written, but old
+        # environments are only marked obsolete when the log writer appends the entry
+        if shelve:
             entry.shelve(
                 shelve_env,
-                delete=True,
+                delete=log_writer is None,
                 filename=_OTTER_LOG_FILENAME,
                 ignore_modules=self._ignore_modules,
                 variables=self._vars_to_store
             )
 
-        entry.flush_to_file(_OTTER_LOG_FILENAME)
+        if log_writer is None:
+            entry.flush_to_file(_OTTER_LOG_FILENAME, compression=compression)
+        else:
+            log_writer.submit(
+                entry, _OTTER_LOG_FILENAME, compression=compression, replace_shelves=shelve)
+
+    def _flush_log(self):
+        """
+        Waits for the log writer, if any, to write all of the entries logged so far.
+        """
+        if self._log_writer is not None:
+            self._log_writer.flush()
 
     def _resolve_nb_path(self, nb_path):
         """
@@ -327,7 +363,15 @@ class Notebook:
             else:
                 warnings.warn("Could not locate a PDF to include")
 
+        self._flush_log()
         if os.path.isfile(_OTTER_LOG_FILENAME):
+            # drop obsolete environments so that they aren't submitted
+            if is_indexed_log(_OTTER_LOG_FILENAME):
+                try:
+                    compact_log(_OTTER_LOG_FILENAME)
+                except OSError:
+                    pass
+
             zf.write(_OTTER_LOG_FILENAME)
 
         zf.writestr(_ZIP_NAME_FILENAME, os.path.basename(zip_path))
@@ -387,6 +431,7 @@ class Notebook:
             for test_name in sorted(tests):
                 results.append(self.check(test_name, global_env))
         else:
+            self._flush_log()
             log = Log.from_file(_OTTER_LOG_FILENAME, ascending=False)
             for file in sorted(tests):
                 if "__init__.py" not in file:
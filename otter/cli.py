@@ -89,6 +89,7 @@ defaults = generate.__kwdefaults__
 @click.option("--username", help="Gradescope username for generating a token")
 @click.option("--password", help="Gradescope password for generating a token")
 @click.option("--token", help="Gradescope token for uploading PDFs")
+@click.option("--template", type=click.Path(exists=True, dir_okay=False), help="Path to the notebook distributed to students, for pre-screening submissions")
 @click.argument("files", nargs=-1)
 def generate_cli(*args, **kwargs):
     """
@@ -114,10 +115,19 @@ defaults = grade.__kwdefaults__
 
 # other settings and optional arguments
 @click.option("-v", "--verbose", is_flag=True, help="Flag for verbose output")
-@click.option("--containers", type=click.INT, help="Specify number of containers to run in parallel")
+@click.option("--containers", type=click.INT, help="Specify maximum number of containers or local workers to run in parallel")
 @click.option("--image", default=defaults["image"], help="Custom docker image to run on")
 @click.option("--timeout", type=click.INT, help="Submission execution timeout in seconds")
 @click.option("--no-network", is_flag=True, help="Disable networking in the containers")
+@click.option("--cpus", type=click.FLOAT, help="Number of CPUs each container is limited to")
+@click.option("--memory", help="Memory limit of each container or local worker (e.g. 2g)")
+@click.option("--backend", default=defaults["backend"], type=click.Choice(["docker", "local"]), help="Grade in Docker containers or in local worker processes without Docker")
+@click.option("--pool", is_flag=True, help="Grade submissions in a pool of long-lived containers")
+@click.option("--jobs-per-container", type=click.INT, help="Number of submissions a pooled container grades before it is replaced")
+@click.option("--batch-size", type=click.INT, help="Number of submissions to grade in a single interpreter in each container")
+@click.option("--no-resume", is_flag=True, help="Regrade submissions that were graded in a previous run")
+@click.option("--no-cache", is_flag=True, help="Do not use cached grading results")
+@click.option("--invalidate-cache", is_flag=True, help="Clear the cache of grading results before grading")
 @click.option("--no-kill", is_flag=True, help="Do not kill containers after grading")
 @click.option("--debug", is_flag=True, help="Print stdout/stderr from grading for debugging")
 
@@ -9,11 +9,17 @@ import nbformat
 
 from IPython import get_ipython
 
+from .cell_cache import get_cell_cache
 from .execute_log import execute_log
 from .execute_notebook import execute_notebook
+from .fork_tests import run_test_files_in_forks
+from .screen import (
+    SKIP_MESSAGES, get_screened_results, record_screened_results, screen_key, screen_notebook)
+from .snapshot import PrefixSnapshot
 from .transforms import filter_ignored_cells, script_to_notebook
 
 from ..test_files import GradingResults, NotebookMetadataOKTestFile, OKTestFile
+from ..test_files.ok_test import _TIMEOUT_OVERRIDE
 from ..utils import id_generator
 
 
@@ -59,10 +65,20 @@ def check(nb_or_test_path, test_name=None, global_env=None):
 
 def grade_notebook(submission_path, *, tests_glob=None, name=None, ignore_errors=True, script=False, 
     cwd=None, test_dir=None, seed=None, seed_variable=None, log=None, variables=None, 
-    plugin_collection=None):
+    plugin_collection=None, single_pass=False, cell_cache_dir=None, test_workers=None,
+    cell_timeout=None, test_timeout=None, snapshot=None, prescreen=False, template=None):
     """
     Grade an assignment file and return grade information
 
+    If ``prescreen`` is true, the notebook is screened with 
+    ``otter.execute.screen.screen_notebook`` before anything is executed. If it is unchanged from
+    ``template`` or has no code that can be executed, and a notebook with the same code has already
+    been graded by this process with the same arguments, it is given a copy of that notebook's 
+    results without being executed, and the skip is recorded in the ``output`` of the results. This
+    assumes that grading is deterministic (e.g. that ``seed`` is set if the notebook uses random
+    numbers). Notebooks aren't screened when grading from a log, when errors aren't ignored, or 
+    when plugins are run, since plugins may depend on the executed environment or the submission.
+
     Args:
         submission_path (``str``): path to a single notebook or Python script
         tests_glob (``list`` of ``str``, optional): paths to test files to run
@@ -79,6 +95,24 @@ def grade_notebook(submission_path, *, tests_glob=None, name=None, ignore_errors
             object to prevent arbitrary code from being put into the environment; ignored if log is ``None``
         plugin_collection (``otter.plugins.PluginCollection``, optional): a set of plugins to run on
             this assignment during execution and grading
+        single_pass (``bool``, optional): whether to collect check results as the notebook is 
+            executed instead of executing it a second time; ignored if log is not ``None``
+        cell_cache_dir (``str``, optional): a directory in which to cache the compiled cells of the
+            notebook on disk; if unspecified, compiled cells are only cached in memory
+        test_workers (``int``, optional): the number of forked worker processes in which to run the
+            tests in ``tests_glob`` that aren't run by the notebook; if unspecified, they are run
+            one after another in this process (see ``run_test_files_in_forks``)
+        cell_timeout (``float``, optional): the number of seconds each code cell may run for before
+            it is interrupted and skipped; ignored if log is not ``None``. The indices of the cells
+            that were skipped are recorded in the ``output`` of the results
+        test_timeout (``float``, optional): the number of seconds each test case may run for before
+            it is interrupted and marked as failed
+        snapshot (``otter.execute.snapshot.PrefixSnapshot``, optional): a snapshot taken with 
+            ``snapshot_notebook`` from which to resume execution if the notebook starts with the 
+            same cells; ignored if log is not ``None``
+        prescreen (``bool``, optional): whether to screen the notebook before executing it
+        template (``str``, optional): path to the notebook distributed to students, against which 
+            screened notebooks are compared
 
     Returns:
         ``otter.test_files.GradingResults``: the results of grading
@@ -99,6 +133,31 @@ def grade_notebook(submission_path, *, tests_glob=None, name=None, ignore_errors
     if not script:
         nb = filter_ignored_cells(nb)
 
+    key = None
+    if prescreen and not script and log is None and ignore_errors and plugin_collection is None:
+        if template is not None:
+            template = filter_ignored_cells(nbformat.read(template, as_version=NBFORMAT_VERSION))
+
+        reason = screen_notebook(nb, template)
+        if reason is not None:
+            key = screen_key(nb, reason, {
+                "tests_glob": sorted(tests_glob or []),
+                "name": name,
+                "cwd": cwd,
+                "test_dir": test_dir,
+                "seed": seed,
+                "seed_variable": seed_variable,
+                "single_pass": single_pass,
+                "cell_timeout": cell_timeout,
+                "test_timeout": test_timeout,
+            })
+
+            results = get_screened_results(key)
+            if results is not None:
+                print(SKIP_MESSAGES[reason])
+                results.set_output(SKIP_MESSAGES[reason])
+                return results
+
     secret = id_generator()
     results_array = "check_results_{}".format(secret)
     initial_env = {
@@ -108,42 +167,115 @@ def grade_notebook(submission_path, *, tests_glob=None, name=None, ignore_errors
     if name:
         initial_env["__name__"] = name
 
-    if log is not None:
-        global_env = execute_log(
-            nb, log, secret, initial_env, ignore_errors=ignore_errors, cwd=cwd, test_dir=test_dir, 
-            variables=variables)
+    timed_out_cells = []
+    token = _TIMEOUT_OVERRIDE.set(test_timeout)
+    try:
+        if log is not None:
+            global_env = execute_log(
+                nb, log, secret, initial_env, ignore_errors=ignore_errors, cwd=cwd, 
+                test_dir=test_dir, variables=variables)
+
+        else:
+            global_env = execute_notebook(
+                nb, results_array, initial_env, ignore_errors=ignore_errors, cwd=cwd, 
+                test_dir=test_dir, seed=seed, seed_variable=seed_variable, single_pass=single_pass,
+                cell_cache=get_cell_cache(cell_cache_dir), cell_timeout=cell_timeout, 
+                timed_out_cells=timed_out_cells, snapshot=snapshot)
+
+        if plugin_collection is not None:
+            plugin_collection.run("after_execution", global_env)
+
+        tests_run = global_env[results_array]
+
+        # Check for tests which were not included in the notebook and specified by tests_globs
+        # Allows instructors to run notebooks with additional tests not accessible to user
+        if tests_glob:
+            # unpack list of paths into a single list
+            tested_set = [test.path for test in tests_run]
+            extra_tests = []
+            for t in sorted(tests_glob):
+                include = True
+                for tested in tested_set:
+                    if tested in t or t in tested:     # e.g. if 'tests/q1.py' is in /srv/repo/lab01/tests/q1.py
+                        include = False
+
+                if include:
+                    extra_tests.append(OKTestFile.from_file(t))
+
+            if test_workers:
+                run_test_files_in_forks(extra_tests, global_env, test_workers)
+
+            else:
+                for test in extra_tests:
+                    test.run(global_env)
+
+            tests_run += extra_tests
+
+    finally:
+        _TIMEOUT_OVERRIDE.reset(token)
 
-    else:
-        global_env = execute_notebook(
-            nb, results_array, initial_env, ignore_errors=ignore_errors, cwd=cwd, test_dir=test_dir, 
-            seed=seed, seed_variable=seed_variable)
+    results = GradingResults(tests_run)
+
+    if timed_out_cells:
+        cells = ", ".join(str(i) for i in timed_out_cells)
+        if len(timed_out_cells) == 1:
+            output = f"Cell {cells} timed out after {cell_timeout} seconds and was skipped"
+        else:
+            output = f"Cells {cells} timed out after {cell_timeout} seconds and were skipped"
+        results.set_output(output)
+
+    if key is not None:
+        record_screened_results(key, results)
 
     if plugin_collection is not None:
-        plugin_collection.run("after_execution", global_env)
+        plugin_collection.run("after_grading", results)
+    
+    return results
 
-    tests_run = global_env[results_array]
 
-    # Check for tests which were not included in the notebook and specified by tests_globs
-    # Allows instructors to run notebooks with additional tests not accessible to user
-    if tests_glob:
-        # unpack list of paths into a single list
-        tested_set = [test.path for test in tests_run]
-        extra_tests = []
-        for t in sorted(tests_glob):
-            include = True
-            for tested in tested_set:
-                if tested in t or t in tested:     # e.g. if 'tests/q1.py' is in /srv/repo/lab01/tests/q1.py
-                    include = False
+def snapshot_notebook(submission_path, num_cells, *, name=None, ignore_errors=True, cwd=None, 
+    test_dir=None, seed=None, seed_variable=None, single_pass=False, cell_cache_dir=None, 
+    cell_timeout=None):
+    """
+    Execute the first ``num_cells`` cells of a notebook as ``grade_notebook`` would and return a
+    snapshot of the resulting environment, from which ``grade_notebook`` can resume the execution of
+    notebooks that start with the same cells when called with the same arguments.
 
-            if include:
-                extra_tests.append(OKTestFile.from_file(t))
-                extra_tests[-1].run(global_env)
+    The first ``num_cells`` cells shouldn't run any checks (see 
+    ``otter.execute.snapshot.common_prefix_length``).
 
-        tests_run += extra_tests
+    Args:
+        submission_path (``str``): path to a notebook
+        num_cells (``int``): the number of cells to execute
+        name (``str``, optional): initial environment name
+        ignore_errors (``bool``, optional): whether errors in execution should be ignored
+        cwd (``str``, optional): working directory of execution to be appended to ``sys.path`` in 
+            grading environment
+        test_dir (``str``, optional): path to directory of tests in grading environment
+        seed (``int``, optional): random seed for intercell seeding
+        seed_variable (``str``, optional): a variable name to override with the seed
+        single_pass (``bool``, optional): whether the notebooks will be executed in a single pass
+        cell_cache_dir (``str``, optional): a directory in which to cache the compiled cells of the
+            notebook on disk
+        cell_timeout (``float``, optional): the number of seconds each code cell may run for
 
-    results = GradingResults(tests_run)
+    Returns:
+        ``otter.execute.snapshot.PrefixSnapshot``: the snapshot
+    """
+    nb = filter_ignored_cells(nbformat.read(submission_path, as_version=NBFORMAT_VERSION))
 
-    if plugin_collection is not None:
-        plugin_collection.run("after_grading", results)
-    
-    return results
+    results_array = "check_results_{}".format(id_generator())
+    initial_env = {
+        results_array: []
+    }
+
+    if name:
+        initial_env["__name__"] = name
+
+    snapshot = PrefixSnapshot(num_cells)
+    execute_notebook(
+        nb, results_array, initial_env, ignore_errors=ignore_errors, cwd=cwd, test_dir=test_dir, 
+        seed=seed, seed_variable=seed_variable, single_pass=single_pass, 
+        cell_cache=get_cell_cache(cell_cache_dir), cell_timeout=cell_timeout, snapshot=snapshot)
+
+    return snapshot
@@ -0,0 +1,176 @@
+"""Caching of transformed and compiled notebook cells"""
+
+import marshal
+import os
+import sys
+import tempfile
+import threading
+
+from collections import OrderedDict
+from hashlib import sha256
+
+import IPython
+
+try:
+    from IPython.core.inputtransformer2 import TransformerManager
+    _IPYTHON_7 = True
+except ImportError:
+    from IPython.core.inputsplitter import IPythonInputSplitter
+    _IPYTHON_7 = False
+
+
+def transform_cell(source):
+    """
+    Strip magic commands and calls to ``interact`` from the source of a code cell and transform the
+    remaining IPython syntax into Python.
+
+    Args:
+        source (``str`` or ``list`` of ``str``): the source of the cell
+
+    Returns:
+        ``str``: the transformed source
+    """
+    if _IPYTHON_7:
+        isp = TransformerManager()
+    else:
+        isp = IPythonInputSplitter(line_input_checker=False)
+
+    code_lines = []
+    cell_source_lines = source
+    source_is_str_bool = False
+    if isinstance(cell_source_lines, str):
+        source_is_str_bool = True
+        cell_source_lines = cell_source_lines.split('\n')
+
+    for line in cell_source_lines:
+        if not line.startswith('%') and  "interact(" not in line:
+            code_lines.append(line)
+            if source_is_str_bool:
+                code_lines.append('\n')
+
+    return isp.transform_cell(''.join(code_lines))
+
+
+class CellCache:
+    """
+    A cache of the transformed source and compiled code objects of notebook cells, keyed by a hash
+    of the cell's source, the code prepended to it, and the versions of IPython and Python.
+
+    Cells that are identical across submissions (e.g. provided setup code and imports) are only
+    transformed and compiled once per process. At most ``max_entries`` cells are kept in memory,
+    evicting the least recently used. If ``directory`` is set, entries are also written to it with
+    ``marshal`` so that they can be reused by other processes.
+
+    Args:
+        directory (``str``, optional): a directory in which to store entries on disk
+        max_entries (``int``, optional): the maximum number of entries to keep in memory
+    """
+
+    def __init__(self, directory=None, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(source, prefix=""):
+        """
+        Return the cache key for a cell.
+
+        Args:
+            source (``str`` or ``list`` of ``str``): the source of the cell
+            prefix (``str``, optional): code prepended to the cell after it is transformed
+
+        Returns:
+            ``str``: the key
+        """
+        if not isinstance(source, str):
+            # a list of lines can't be joined as-is, since lines are only newline-terminated when
+            # the source is a string
+            source = repr(list(source))
+        version = f"{IPython.__version__}:{sys.implementation.cache_tag}"
+        return sha256(f"{version}\0{prefix}\0{source}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return marshal.load(f)
+
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _write(self, key, entry):
+        # write to a temporary file first so that other processes never read a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(entry, f)
+
+        os.replace(temp_path, self._path(key))
+
+    def compile_cell(self, source, prefix=""):
+        """
+        Transform and compile the source of a code cell, using the cached results if the cell has
+        been compiled before.
+
+        Args:
+            source (``str`` or ``list`` of ``str``): the source of the cell
+            prefix (``str``, optional): code to prepend to the cell after it is transformed
+
+        Returns:
+            ``tuple[str, types.CodeType]``: the transformed source, including ``prefix``, and its
+                compiled code object
+
+        Raises:
+            ``SyntaxError``: if the transformed source is not valid Python
+        """
+        key = self.key(source, prefix)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self.directory is not None:
+            entry = self._read(key)
+
+        if entry is None:
+            cell_source = prefix + transform_cell(source)
+            entry = (cell_source, compile(cell_source, "<string>", "exec"))
+            if self.directory is not None:
+                self._write(key, entry)
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return entry
+
+
+_CELL_CACHES = {}
+
+
+def get_cell_cache(directory=None):
+    """
+    Return the cell cache for this process that stores its entries in ``directory``, creating it if
+    necessary.
+
+    Args:
+        directory (``str``, optional): the directory in which the cache stores its entries on disk;
+            if ``None``, the cache is only kept in memory
+
+    Returns:
+        ``CellCache``: the cache
+    """
+    if directory is not None:
+        directory = os.path.abspath(directory)
+    if directory not in _CELL_CACHES:
+        _CELL_CACHES[directory] = CellCache(directory)
+    return _CELL_CACHES[directory]
@@ -11,6 +11,10 @@ class CheckCallWrapper(ast.NodeTransformer):
     ``otter.Notebook.check`` in calls to ``list.append`` to collect results of execution. Removes calls
     to ``otter.Notebook.check_all``, `otter.Notebook.export``, and ``otter.Notebook.to_pdf``.
     
+    The import syntax and names of ``otter`` and its ``Notebook`` instance are tracked on each 
+    instance (starting from the defaults defined on the class), so that notebooks transformed at the 
+    same time don't affect each other.
+
     Args:
         list_name (``str``): the name of the list to collect check results in
     
@@ -56,10 +60,10 @@ class CheckCallWrapper(ast.NodeTransformer):
             ``ast.ImportFrom``: the original node
         """
         if node.module == "otter" and "Notebook" in [n.name for n in node.names]:
-            type(self).OTTER_IMPORT_SYNTAX = "from"
+            self.OTTER_IMPORT_SYNTAX = "from"
             nb_asname = [n.asname for n in node.names if n.name == "Notebook"][0]
             if nb_asname is not None:
-                type(self).OTTER_CLASS_NAME = nb_asname
+                self.OTTER_CLASS_NAME = nb_asname
         return node
 
     def visit_Import(self, node):
@@ -73,10 +77,10 @@ class CheckCallWrapper(ast.NodeTransformer):
             ``ast.Import``: the original node
         """
         if "otter" in [n.name for n in node.names]:
-            type(self).OTTER_IMPORT_SYNTAX = "import"
+            self.OTTER_IMPORT_SYNTAX = "import"
             otter_asname = [n.asname for n in node.names if n.name == "otter"][0]
             if otter_asname is not None:
-                type(self).OTTER_IMPORT_NAME = otter_asname
+                self.OTTER_IMPORT_NAME = otter_asname
         return node
 
     def visit_Assign(self, node):
@@ -91,15 +95,15 @@ class CheckCallWrapper(ast.NodeTransformer):
             ``ast.Assign``: the original node
         """
         if isinstance(node.value, ast.Call):
-            if isinstance(node.value.func, ast.Attribute) and type(self).OTTER_IMPORT_SYNTAX == "import":
+            if isinstance(node.value.func, ast.Attribute) and self.OTTER_IMPORT_SYNTAX == "import":
                 if node.value.func.attr == "Notebook" and isinstance(node.value.func.value, ast.Name):
-                    if node.value.func.value.id == type(self).OTTER_IMPORT_NAME:
+                    if node.value.func.value.id == self.OTTER_IMPORT_NAME:
                         assert len(node.targets) == 1, "error parsing otter.Notebook instance in ast"
-                        type(self).OTTER_INSTANCE_NAME = node.targets[0].id
-            elif isinstance(node.value.func, ast.Name) and type(self).OTTER_IMPORT_SYNTAX == "from":
-                if node.value.func.id == type(self).OTTER_CLASS_NAME:
+                        self.OTTER_INSTANCE_NAME = node.targets[0].id
+            elif isinstance(node.value.func, ast.Name) and self.OTTER_IMPORT_SYNTAX == "from":
+                if node.value.func.id == self.OTTER_CLASS_NAME:
                     assert len(node.targets) == 1, "error parsing otter.Notebook instance in ast"
-                    type(self).OTTER_INSTANCE_NAME = node.targets[0].id
+                    self.OTTER_INSTANCE_NAME = node.targets[0].id
         return node
 
     def visit_Expr(self, node):
@@ -118,7 +122,7 @@ class CheckCallWrapper(ast.NodeTransformer):
         if isinstance(node.value, ast.Call):
             call_node = node.value
             if isinstance(call_node.func, ast.Attribute):
-                if isinstance(call_node.func.value, ast.Name) and call_node.func.value.id == type(self).OTTER_INSTANCE_NAME:
+                if isinstance(call_node.func.value, ast.Name) and call_node.func.value.id == self.OTTER_INSTANCE_NAME:
                     if call_node.func.attr in ["check_all", "export", "to_pdf"]:
                         return None
                     elif call_node.func.attr == "check":
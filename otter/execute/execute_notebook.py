@@ -8,26 +8,43 @@ from contextlib import redirect_stdout, redirect_stderr
 from IPython.display import display
 from unittest import mock
 
-try:
-    from IPython.core.inputtransformer2 import TransformerManager
-    _IPYTHON_7 = True
-except ImportError:
-    from IPython.core.inputsplitter import IPythonInputSplitter
-    _IPYTHON_7 = False
-
+from .cell_cache import get_cell_cache
 from .check_wrapper import CheckCallWrapper
 from .transforms import create_collected_check_cell
 
-from ..utils import id_generator
+from ..utils import id_generator, time_limit
 
 
 def execute_notebook(nb, check_results_list_name="check_results_secret", initial_env=None, 
-                     ignore_errors=False, cwd=None, test_dir=None, seed=None, seed_variable=None):
+                     ignore_errors=False, cwd=None, test_dir=None, seed=None, seed_variable=None,
+                     single_pass=False, cell_cache=None, cell_timeout=None, timed_out_cells=None,
+                     snapshot=None):
     """
     Execute a notebook and return the global environment that results from execution.
 
     If ``ignore_errors`` is true, exceptions are swallowed.
 
+    By default, each code cell is executed once and the source of the cells that run without error
+    is then executed a second time as a single program, with calls to ``otter.Notebook.check`` 
+    wrapped by ``CheckCallWrapper`` to collect their results. If ``single_pass`` is true, the 
+    ``CheckCallWrapper`` is instead applied to each cell before it is executed and the checks in the
+    cell's metadata are run right after it, so that each cell is only executed once. As in the second
+    pass, the check results collected from a cell that raises an error are discarded.
+
+    The transformed source and compiled code of each cell are taken from ``cell_cache``, so that 
+    cells shared by many submissions are only transformed and compiled once per process.
+
+    If ``cell_timeout`` is set, a code cell that runs for longer than ``cell_timeout`` seconds is
+    interrupted and skipped (regardless of ``ignore_errors``), and its index is appended to
+    ``timed_out_cells``. Skipped cells aren't included in the second pass, which is limited to
+    ``cell_timeout`` seconds for each cell it contains.
+
+    If ``snapshot`` is empty, only the cells in its prefix are executed and the resulting environment
+    is recorded in it. If it has been taken in another process from which this one was forked and
+    matches the first cells of ``nb`` and the execution options, execution starts from the 
+    snapshot's environment after the prefix instead (see ``PrefixSnapshot``).
+    In two-pass mode, the source of the prefix is still included in the second pass.
+
     Args:
         nb (``nbformat.NotebookNode``): the notebook to execute
         check_results_list_name (``str``, optional): the name of the list to collect check results in
@@ -38,10 +55,29 @@ def execute_notebook(nb, check_results_list_name="check_results_secret", initial
         test_dir (``str``, optional): path to directory of tests in grading environment
         seed (``int``, optional): random seed for intercell seeding
         seed_variable (``str``, optional): a variable name to override with the seed
+        single_pass (``bool``, optional): whether to collect check results as the cells are
+            executed instead of executing the notebook a second time
+        cell_cache (``otter.execute.cell_cache.CellCache``, optional): the cache of compiled cells;
+            defaults to this process's in-memory cache
+        cell_timeout (``float``, optional): the number of seconds each code cell may run for
+        timed_out_cells (``list`` of ``int``, optional): a list to which to append the indices of 
+            the cells that were skipped because they timed out
+        snapshot (``otter.execute.snapshot.PrefixSnapshot``, optional): a snapshot of the
+            environment after executing the first cells of the notebook to take or to resume from
 
     Results:
         ``dict``: global environment resulting from executing all code of the input notebook
     """
+    options = {
+        "cwd": cwd,
+        "test_dir": test_dir,
+        "seed": seed,
+        "seed_variable": seed_variable,
+        "ignore_errors": ignore_errors,
+        "single_pass": single_pass,
+        "cell_timeout": cell_timeout,
+    }
+
     if initial_env:
         global_env = initial_env.copy()
     else:
@@ -50,94 +86,143 @@ def execute_notebook(nb, check_results_list_name="check_results_secret", initial
     # add display from IPython
     global_env["display"] = display
 
-    from ..check.notebook import Notebook
-    Notebook._tests_dir_override = test_dir if test_dir is not None else './tests'
+    from ..check.notebook import Notebook, _TESTS_DIR_OVERRIDE
 
-    # add dummy Notebook class so that we can collect results w/out altering how the CheckCallWrapper
-    # needs to function
-    secret = id_generator()
-    notebook_class_name = f"Notebook_{secret}"
-    global_env[notebook_class_name] = Notebook
+    # set the tests dir of notebooks created by the submission for this call only
+    token = _TESTS_DIR_OVERRIDE.set(test_dir if test_dir is not None else './tests')
+    try:
+        # add dummy Notebook class so that we can collect results w/out altering how the 
+        # CheckCallWrapper needs to function
+        secret = id_generator()
+        notebook_class_name = f"Notebook_{secret}"
+        global_env[notebook_class_name] = Notebook
 
-    source = ""
+        source = ""
 
-    if cwd:
-        source = f"import sys\nsys.path.append(r\"{cwd}\")\n"
-        exec(source, global_env)
+        if cwd:
+            source = f"import sys\nsys.path.append(r\"{cwd}\")\n"
+            exec(source, global_env)
     
-    if seed is not None and seed_variable is None:
-        import numpy as np
-        import random
-        global_env["np"] = np
-        global_env["random"] = random
-
-    if test_dir is None:
-        test_dir = "/home/tests"
-
-    for cell in nb['cells']:
-        if cell['cell_type'] == 'code':
-            if _IPYTHON_7:
-                isp = TransformerManager()
-            else:
-                isp = IPythonInputSplitter(line_input_checker=False)
-
-            try:
-                code_lines = []
-                cell_source_lines = cell['source']
-                source_is_str_bool = False
-                if isinstance(cell_source_lines, str):
-                    source_is_str_bool = True
-                    cell_source_lines = cell_source_lines.split('\n')
-
-                for line in cell_source_lines:
-                    if not line.startswith('%') and  "interact(" not in line:
-                        code_lines.append(line)
-                        if source_is_str_bool:
-                            code_lines.append('\n')
-
-                if seed is not None:
-                    if seed_variable is None:
-                        cell_source = f"np.random.seed({seed})\nrandom.seed({seed})\n" + \
-                            isp.transform_cell(''.join(code_lines))
-                    else:
-                        cell_source = f"{seed_variable} = {seed}\n" + \
-                            isp.transform_cell(''.join(code_lines))
-
-                else:
-                    cell_source = isp.transform_cell(''.join(code_lines))
+        if seed is not None and seed_variable is None:
+            import numpy as np
+            import random
+            global_env["np"] = np
+            global_env["random"] = random
 
-                # patch otter.Notebook.export so that we don't create PDFs in notebooks
-                # TODO: move this patch into CheckCallWrapper
-                m = mock.mock_open()
-                with mock.patch('otter.Notebook.export', m), mock.patch("otter.Notebook._log_event", m):
-                    exec(cell_source, global_env)
-                source += cell_source
+        if test_dir is None:
+            test_dir = "/home/tests"
 
-            except:
-                if not ignore_errors:
-                    raise
+        transformer = CheckCallWrapper(check_results_list_name)
 
-        source += create_collected_check_cell(
-            cell, check_results_list_name, notebook_class_name, test_dir)
+        if cell_cache is None:
+            cell_cache = get_cell_cache()
+
+        prefix = ""
+        if seed is not None:
+            if seed_variable is None:
+                prefix = f"np.random.seed({seed})\nrandom.seed({seed})\n"
+            else:
+                prefix = f"{seed_variable} = {seed}\n"
+
+        start, recording = 0, snapshot is not None and not snapshot.taken
+        if snapshot is not None and snapshot.matches(nb, options):
+            start = snapshot.num_cells
+            # the snapshot's objects are only copies because this process was forked from the one
+            # that took it
+            global_env = {**snapshot.global_env, **global_env}
+            source = snapshot.source
+            transformer = copy.copy(snapshot.transformer)
+            transformer.list_name = check_results_list_name
+
+        num_cells = start
+        for i, cell in enumerate(nb['cells']):
+            if i < start:
+                continue
+
+            if recording and i == snapshot.num_cells:
+                break
+
+            if cell['cell_type'] == 'code':
+                limit = time_limit(cell_timeout)
+                try:
+                    cell_source, cell_code = cell_cache.compile_cell(cell['source'], prefix)
+
+                    # the check results list has a different name for each submission, so cells
+                    # wrapped by the CheckCallWrapper can't be cached
+                    if single_pass:
+                        tree = transformer.visit(ast.parse(cell_source))
+                        ast.fix_missing_locations(tree)
+                        cell_code = compile(tree, filename="nb-ast", mode="exec")
+
+                        # a cell that fails isn't included in the second pass, so discard the results
+                        # of any checks it ran before failing
+                        num_results = len(global_env[check_results_list_name])
+
+                    # patch otter.Notebook.export so that we don't create PDFs in notebooks
+                    # TODO: move this patch into CheckCallWrapper
+                    m = mock.mock_open()
+                    with mock.patch('otter.Notebook.export', m), mock.patch("otter.Notebook._log_event", m):
+                        try:
+                            with limit:
+                                exec(cell_code, global_env)
+
+                        except:
+                            if single_pass:
+                                del global_env[check_results_list_name][num_results:]
+                            raise
+
+                    if not single_pass:
+                        source += cell_source
+                        num_cells += 1
+
+                except:
+                    if limit.expired:
+                        print(f"Cell {i} timed out after {cell_timeout} seconds and was skipped")
+                        if timed_out_cells is not None:
+                            timed_out_cells.append(i)
+
+                    elif not ignore_errors:
+                        raise
+
+            check_source = create_collected_check_cell(
+                cell, check_results_list_name, notebook_class_name, test_dir)
+
+            if not single_pass:
+                source += check_source
+
+            elif check_source:
+                try:
+                    with open(os.devnull, 'w') as f, redirect_stdout(f), redirect_stderr(f):
+                        exec(check_source, global_env)
+
+                except:
+                    if not ignore_errors:
+                        raise
+
+        if recording:
+            snapshot.record(nb, options, global_env, source, transformer)
+
+        if single_pass or recording:
+            return global_env
+
+        tree = ast.parse(source)
+        tree = transformer.visit(tree)
+        ast.fix_missing_locations(tree)
+
+        try:
+            cleaned_source = compile(tree, filename="nb-ast", mode="exec")
+            with open(os.devnull, 'w') as f, redirect_stdout(f), redirect_stderr(f):
+                # patch otter.Notebook.export so that we don't create PDFs in notebooks
+                m = mock.mock_open()
+                with mock.patch("otter.Notebook.export", m), mock.patch("otter.Notebook._log_event", m), \
+                        time_limit(cell_timeout and cell_timeout * max(num_cells, 1)):
+                    exec(cleaned_source, global_env)
 
-    tree = ast.parse(source)
-    transformer = CheckCallWrapper(check_results_list_name)
-    tree = transformer.visit(tree)
-    ast.fix_missing_locations(tree)
+        except:
+            if not ignore_errors:
+                raise
 
-    try:
-        cleaned_source = compile(tree, filename="nb-ast", mode="exec")
-        with open(os.devnull, 'w') as f, redirect_stdout(f), redirect_stderr(f):
-            # patch otter.Notebook.export so that we don't create PDFs in notebooks
-            m = mock.mock_open()
-            with mock.patch("otter.Notebook.export", m), mock.patch("otter.Notebook._log_event", m):
-                exec(cleaned_source, global_env)
-
-    except:
-        if not ignore_errors:
-            raise
-    
-    # reset tests dir
-    Notebook._tests_dir_override = None
+        return global_env
 
-    return global_env
+    finally:
+        _TESTS_DIR_OVERRIDE.reset(token)
@@ -0,0 +1,92 @@
+"""Running test files in forked worker processes"""
+
+import multiprocessing
+import os
+import pickle
+import tempfile
+
+from multiprocessing.connection import wait
+
+from ..test_files.abstract_test import TestCaseResult
+
+
+def run_test_files_in_forks(test_files, global_env, max_workers):
+    """
+    Run test files against ``global_env``, each in its own forked worker process.
+
+    Each worker inherits ``global_env`` copy-on-write from the current process, runs a single test
+    file, and sends its ``TestCaseResult`` objects back to the current process, where they are
+    stored on the test file. At most ``max_workers`` workers run at once. Because each test file is
+    run in a copy of the environment, changes that one test file makes to the environment are not
+    seen by the others.
+
+    If a worker exits without sending back its results (e.g. because the test segfaulted or was
+    killed), every test case in its test file is marked as failed. If ``os.fork`` is unavailable,
+    the test files are run one after another in the current process.
+
+    Args:
+        test_files (``list`` of ``otter.test_files.abstract_test.TestFile``): the test files to run
+        global_env (``dict``): the global environment to run the tests against
+        max_workers (``int``): the maximum number of worker processes to run at once
+    """
+    if not hasattr(os, "fork"):
+        for test_file in test_files:
+            test_file.run(global_env)
+        return
+
+    ctx = multiprocessing.get_context("fork")
+    pending = list(test_files)
+    running = {}
+
+    try:
+        while pending or running:
+            while pending and len(running) < max_workers:
+                test_file = pending.pop(0)
+                fd, results_path = tempfile.mkstemp(suffix=".pkl")
+                os.close(fd)
+
+                worker = ctx.Process(target=_run_test_file, args=(test_file, global_env, results_path))
+                worker.start()
+                running[worker.sentinel] = (worker, test_file, results_path)
+
+            for sentinel in wait(list(running)):
+                worker, test_file, results_path = running.pop(sentinel)
+                worker.join()
+                _collect_results(test_file, results_path, worker.exitcode)
+
+    finally:
+        # if the parent is interrupted, don't leave any workers behind
+        for worker, _, results_path in running.values():
+            worker.kill()
+            worker.join()
+            os.remove(results_path)
+
+
+def _run_test_file(test_file, global_env, results_path):
+    """
+    Run a test file in a worker process and pickle its results to ``results_path``.
+    """
+    test_file.run(global_env)
+    with open(results_path, "wb") as f:
+        pickle.dump(test_file.test_case_results, f)
+
+
+def _collect_results(test_file, results_path, exitcode):
+    """
+    Load the results of a test file run by a worker from ``results_path`` into the test file,
+    marking every test case as failed if the worker didn't finish.
+    """
+    try:
+        if exitcode == 0:
+            with open(results_path, "rb") as f:
+                test_file.test_case_results = pickle.load(f)
+            return
+
+    finally:
+        os.remove(results_path)
+
+    message = f"The test could not be run to completion (the worker exited with code {exitcode})"
+    test_file.test_case_results = [
+        TestCaseResult(test_case=test_case, message=message, passed=False)
+        for test_case in test_file.test_cases
+    ]
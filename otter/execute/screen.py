@@ -0,0 +1,141 @@
+"""Pre-screening of submissions that can be graded without being executed"""
+
+import ast
+import copy
+import json
+
+from .cell_cache import transform_cell
+from .snapshot import cell_hash
+from .transforms import CELL_METADATA_KEY
+
+
+# the reasons for which a submission can be graded without being executed
+UNCHANGED = "unchanged"
+EMPTY = "empty"
+
+SKIP_MESSAGES = {
+    UNCHANGED: "This submission is unchanged from the distributed notebook, so it was not executed "
+        "and was given the results of the distributed notebook.",
+    EMPTY: "None of the code cells in this submission could be parsed or they were all empty, so it "
+        "was not executed and was given the results of an empty notebook.",
+}
+
+
+def _code_cells(nb):
+    return [cell for cell in nb["cells"] if cell.get("cell_type") == "code"]
+
+
+def _parse(cell):
+    """
+    Parse the source of a code cell, returning ``None`` if it can't be parsed.
+    """
+    try:
+        return ast.parse(transform_cell(cell.get("source", "")))
+
+    except Exception:
+        return None
+
+
+def _parses_to_nothing(cell):
+    """
+    Determine whether a code cell is empty or fails to parse, in which case executing it does
+    nothing but run the code that is prepended to every cell.
+    """
+    tree = _parse(cell)
+    return tree is None or not tree.body
+
+
+def screen_notebook(nb, template=None):
+    """
+    Determine, without executing anything, whether a notebook would receive the same results as
+    another notebook that has already been graded.
+
+    A notebook is ``UNCHANGED`` if its code cells have the same hashes (see
+    ``otter.execute.snapshot.cell_hash``) as the code cells of ``template``, the notebook
+    distributed to students. It is ``EMPTY`` if none of its cells have tests in their metadata and
+    all of its code cells are empty or raise a ``SyntaxError`` when parsed, in which case executing
+    it has no effect other than setting up the environment.
+
+    Args:
+        nb (``nbformat.NotebookNode``): the notebook
+        template (``nbformat.NotebookNode``, optional): the notebook distributed to students
+
+    Returns:
+        ``str`` or ``None``: ``UNCHANGED``, ``EMPTY``, or ``None`` if the notebook must be executed
+    """
+    code_cells = _code_cells(nb)
+
+    if template is not None and \
+            [cell_hash(c) for c in code_cells] == [cell_hash(c) for c in _code_cells(template)]:
+        return UNCHANGED
+
+    if not any(c.get("metadata", {}).get(CELL_METADATA_KEY, {}).get("tests") for c in nb["cells"]) \
+            and all(_parses_to_nothing(c) for c in code_cells):
+        return EMPTY
+
+    return None
+
+
+def screen_key(nb, reason, options):
+    """
+    Return a key under which to store the results of grading a screened notebook, which is the same
+    for all notebooks that receive the same results when graded with the same ``options``.
+
+    Args:
+        nb (``nbformat.NotebookNode``): the notebook
+        reason (``str``): the reason returned by ``screen_notebook`` for the notebook
+        options (``dict``): the arguments with which the notebook is graded
+
+    Returns:
+        ``tuple``: the key
+    """
+    if reason == UNCHANGED:
+        fingerprint = tuple(cell_hash(c) for c in _code_cells(nb))
+
+    else:
+        # cells that parse still run the code prepended to each cell (e.g. to seed the RNGs)
+        fingerprint = any(_parse(c) is not None for c in _code_cells(nb))
+
+    return reason, fingerprint, json.dumps(options, sort_keys=True, default=str)
+
+
+_SCREENED_RESULTS = {}
+
+
+def get_screened_results(key):
+    """
+    Return a copy of the results recorded for a screened notebook with ``record_screened_results``.
+
+    Args:
+        key (``tuple``): the key returned by ``screen_key`` for the notebook
+
+    Returns:
+        ``otter.test_files.GradingResults`` or ``None``: the results, if any have been recorded
+    """
+    results = _SCREENED_RESULTS.get(key)
+    if results is not None:
+        results = copy.deepcopy(results)
+    return results
+
+
+def record_screened_results(key, results):
+    """
+    Record the results of grading a screened notebook, so that later notebooks in this process (and
+    in processes forked from it) with the same key can be given them without being executed.
+
+    Args:
+        key (``tuple``): the key returned by ``screen_key`` for the notebook
+        results (``otter.test_files.GradingResults``): the results
+    """
+    _SCREENED_RESULTS[key] = copy.deepcopy(results)
+
+
+def get_all_screened_results():
+    """
+    Return all of the results recorded in this process with ``record_screened_results``, so that
+    they can be recorded in another process.
+
+    Returns:
+        ``dict``: a copy of the recorded results, keyed by the keys returned by ``screen_key``
+    """
+    return copy.deepcopy(_SCREENED_RESULTS)
@@ -0,0 +1,176 @@
+"""Snapshots of the environment after executing the cells that notebooks have in common"""
+
+import json
+import os
+import re
+
+from hashlib import sha256
+
+from .transforms import CELL_METADATA_KEY
+
+
+# matches calls to otter.Notebook.check and otter.Notebook.check_all
+CHECK_CALL_REGEX = re.compile(r"\.check(_all)?\s*\(")
+
+
+def cell_hash(cell):
+    """
+    Return a hash of the type, source, and Otter metadata of a cell.
+
+    Args:
+        cell (``nbformat.NotebookNode``): the cell
+
+    Returns:
+        ``str``: the hash
+    """
+    source = cell.get("source", "")
+    if not isinstance(source, str):
+        source = "".join(source)
+
+    data = {
+        "cell_type": cell.get("cell_type"),
+        "source": source,
+        "metadata": cell.get("metadata", {}).get(CELL_METADATA_KEY, {}),
+    }
+    return sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _runs_checks(cell):
+    """
+    Determine whether a cell runs any checks, either in its source or in its Otter metadata.
+    """
+    if cell.get("metadata", {}).get(CELL_METADATA_KEY, {}).get("tests", []):
+        return True
+
+    source = cell.get("source", "")
+    if not isinstance(source, str):
+        source = "".join(source)
+
+    return cell.get("cell_type") == "code" and bool(CHECK_CALL_REGEX.search(source))
+
+
+def common_prefix_length(notebooks):
+    """
+    Return the number of leading cells that are identical in all of ``notebooks`` and can be
+    executed once for all of them.
+
+    The prefix stops before the first cell that runs any checks, since the results of checks are
+    collected separately for each submission.
+
+    Args:
+        notebooks (``list`` of ``nbformat.NotebookNode``): the notebooks
+
+    Returns:
+        ``int``: the number of cells in the common prefix
+    """
+    if not notebooks:
+        return 0
+
+    num_cells = 0
+    for cells in zip(*(nb["cells"] for nb in notebooks)):
+        if len(set(cell_hash(c) for c in cells)) > 1 or _runs_checks(cells[0]):
+            break
+        num_cells += 1
+
+    return num_cells
+
+
+class PrefixSnapshot:
+    """
+    The global environment that results from executing the first ``num_cells`` cells of a notebook,
+    from which the execution of other notebooks that start with the same cells can be resumed.
+
+    A snapshot is empty until it is passed to ``otter.execute.execute_notebook``, which executes
+    the prefix and records the resulting environment in it. Later calls to ``execute_notebook``
+    with the snapshot in a process forked from the one that took it skip the prefix for notebooks
+    whose first ``num_cells`` cells have the same hashes and which are executed with the same 
+    options, starting instead from the recorded environment. The environment isn't copied, so the
+    objects in it are only protected from the notebook's execution by being inherited copy-on-write
+    by the forked process; notebooks executed in the process that took the snapshot are therefore
+    executed from the start.
+
+    Args:
+        num_cells (``int``): the number of cells in the prefix
+
+    Attributes:
+        num_cells (``int``): the number of cells in the prefix
+        cell_hashes (``list`` of ``str``): the hashes of the cells in the prefix, once taken
+        options (``dict``): the execution options with which the prefix was executed, once taken
+        pid (``int``): the ID of the process that took the snapshot, once taken
+        global_env (``dict``): the environment after executing the prefix, once taken
+        source (``str``): the source of the prefix cells that ran without error, to be included in
+            the second pass of two-pass execution, once taken
+        transformer (``otter.execute.check_wrapper.CheckCallWrapper``): the transformer that visited
+            the prefix cells in single-pass execution, once taken
+    """
+
+    def __init__(self, num_cells):
+        self.num_cells = num_cells
+        self.cell_hashes = None
+        self.options = None
+        self.global_env = None
+        self.source = None
+        self.transformer = None
+        self.pid = None
+
+    @property
+    def taken(self):
+        return self.global_env is not None
+
+    def record(self, nb, options, global_env, source, transformer):
+        """
+        Record the environment that results from executing the prefix of ``nb``.
+
+        Args:
+            nb (``nbformat.NotebookNode``): the notebook
+            options (``dict``): the execution options
+            global_env (``dict``): the environment after executing the prefix
+            source (``str``): the source of the prefix cells that ran without error
+            transformer (``otter.execute.check_wrapper.CheckCallWrapper``): the transformer that
+                visited the prefix cells, which knows the name of any ``otter.Notebook`` they create
+        """
+        self.cell_hashes = [cell_hash(c) for c in nb["cells"][:self.num_cells]]
+        self.options = options
+        self.global_env = global_env
+        self.source = source
+        self.transformer = transformer
+        self.pid = os.getpid()
+
+    def matches(self, nb, options):
+        """
+        Determine whether execution of ``nb`` with ``options`` can be resumed from this snapshot,
+        which is only possible in a process forked from the one that took it.
+
+        Args:
+            nb (``nbformat.NotebookNode``): the notebook
+            options (``dict``): the execution options
+
+        Returns:
+            ``bool``: whether the snapshot matches
+        """
+        return self.taken and os.getpid() != self.pid and options == self.options and \
+            [cell_hash(c) for c in nb["cells"][:self.num_cells]] == self.cell_hashes
+
+
+_SNAPSHOT = None
+
+
+def get_snapshot():
+    """
+    Return this process's current snapshot.
+
+    Returns:
+        ``PrefixSnapshot`` or ``None``: the snapshot, if one has been taken
+    """
+    return _SNAPSHOT
+
+
+def set_snapshot(snapshot):
+    """
+    Set this process's current snapshot, which is inherited by processes forked from it.
+
+    Args:
+        snapshot (``PrefixSnapshot`` or ``None``): the snapshot
+    """
+    global _SNAPSHOT
+    _SNAPSHOT = snapshot
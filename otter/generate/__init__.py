@@ -7,17 +7,16 @@ import pkg_resources
 import shutil
 import tempfile
 import yaml
-import zipfile
 
 from glob import glob
 from jinja2 import Template
 from subprocess import PIPE
 
 from .token import APIClient
-from .utils import zip_folder
+from .utils import DeterministicZipFile, zip_folder
 
 from ..plugins import PluginCollection
-from ..run.run_autograder.constants import DEFAULT_OPTIONS
+from ..run.run_autograder.constants import DEFAULT_OPTIONS, TEMPLATE_FILENAME
 from ..utils import load_default_file
 
 
@@ -30,7 +29,7 @@ OTTR_BRANCH = "1.1.3"  # this should match a release tag on GitHub
 def main(*, tests_dir="./tests", output_path="autograder.zip", config=None, no_config=False, 
          lang="python", requirements=None, no_requirements=False, overwrite_requirements=False, 
          environment=None, no_environment=False, username=None, password=None, token=None, files=[], 
-         assignment=None, plugin_collection=None):
+         assignment=None, plugin_collection=None, template=None):
     """
     Runs Otter Generate
 
@@ -51,6 +50,8 @@ def main(*, tests_dir="./tests", output_path="autograder.zip", config=None, no_c
         password (``str``): a password for Gradescope for generating a token
         token (``str``): a token for Gradescope
         files (``list[str]``): list of file paths to add to the zip file
+        template (``str``, optional): path to the notebook distributed to students, against which
+            submissions are compared if the ``prescreen`` configuration is true
         assignment (``otter.assign.assignment.Assignment``, optional): the assignment configurations
             if used with Otter Assign
         **kwargs: ignored kwargs (a remnant of how the argument parser is built)
@@ -160,7 +161,7 @@ def main(*, tests_dir="./tests", output_path="autograder.zip", config=None, no_c
         if os.path.exists(output_path):
             os.remove(output_path)
 
-        with zipfile.ZipFile(output_path, mode="w") as zf:
+        with DeterministicZipFile(output_path) as zf:
             for fn, contents in rendered.items():
                 zf.writestr(fn, contents)
 
@@ -169,7 +170,10 @@ def main(*, tests_dir="./tests", output_path="autograder.zip", config=None, no_c
             for file in glob(os.path.join(tests_dir, pattern)):
                 zf.write(file, arcname=os.path.join(test_dir, os.path.basename(file)))
             
-            zf.writestr("otter_config.json", json.dumps(otter_config, indent=2))
+            zf.writestr("otter_config.json", json.dumps(otter_config, indent=2, sort_keys=True))
+
+            if template is not None:
+                zf.write(template, arcname=TEMPLATE_FILENAME)
 
             # copy files into tmp
             if len(files) > 0:
@@ -4,8 +4,12 @@ Runs Otter on Gradescope
 
 import os
 import subprocess
+import sys
 
-from otter.run.run_autograder import main as run_autograder
+from otter.run.run_autograder import main as run_autograder, run_batch
 
 if __name__ == "__main__":
-    run_autograder('{{ autograder_dir }}')
+    if len(sys.argv) > 1:
+        run_batch('{{ autograder_dir }}', sys.argv[1])
+    else:
+        run_autograder('{{ autograder_dir }}')
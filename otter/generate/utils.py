@@ -1,7 +1,17 @@
 """
 """
 
+import json
 import os
+import zipfile
+
+from hashlib import sha256
+
+
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o644
+MANIFEST_FILENAME = "otter_manifest.json"
+
 
 def zip_folder(zf, path, prefix="", exclude=[]):
     """
@@ -9,7 +19,7 @@ def zip_folder(zf, path, prefix="", exclude=[]):
     if not os.path.isabs(path):
         raise ValueError("'path' must be absolute path")
     parent_basename = os.path.basename(path)
-    for file in os.listdir(path):
+    for file in sorted(os.listdir(path)):
         if file in exclude:
             continue
         child_path = os.path.join(path, file)
@@ -18,3 +28,83 @@ def zip_folder(zf, path, prefix="", exclude=[]):
             zf.write(child_path, arcname=arcname)
         elif os.path.isdir(child_path):
             zip_folder(zf, child_path, prefix=os.path.join(prefix, parent_basename))
+
+
+class DeterministicZipFile:
+    """
+    A write-only replacement for ``zipfile.ZipFile`` that writes the same bytes whenever it is given
+    the same file contents, regardless of file timestamps, permissions, or the order in which files
+    are added.
+
+    Entries are buffered in memory and written when the file is closed, sorted by name and with a
+    fixed timestamp and mode. A manifest mapping each entry to the SHA256 hash of its contents is
+    added to the zip file as ``otter_manifest.json``.
+
+    Args:
+        path (``str``): the path at which to write the zip file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    @staticmethod
+    def _normalize(arcname):
+        arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+        while arcname[0] in (os.sep, os.altsep):
+            arcname = arcname[1:]
+        return arcname.replace(os.sep, "/")
+
+    def write(self, filename, arcname=None):
+        """
+        Add the file at ``filename`` to the zip file.
+
+        Args:
+            filename (``str``): the path to the file
+            arcname (``str``, optional): the name of the file in the zip file; defaults to
+                ``filename``
+        """
+        with open(filename, "rb") as f:
+            self.writestr(arcname if arcname is not None else filename, f.read())
+
+    def writestr(self, arcname, data):
+        """
+        Add a file called ``arcname`` with contents ``data`` to the zip file.
+
+        Args:
+            arcname (``str``): the name of the file in the zip file
+            data (``str`` or ``bytes``): the contents of the file
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.entries[self._normalize(arcname)] = data
+
+    def manifest(self):
+        """
+        Return the manifest of the entries added to the zip file.
+
+        Returns:
+            ``dict[str, str]``: a mapping of entry names to the SHA256 hashes of their contents
+        """
+        return {name: sha256(data).hexdigest() for name, data in sorted(self.entries.items())}
+
+    def close(self):
+        """
+        Write the buffered entries and the manifest to the zip file.
+        """
+        entries = {
+            **self.entries,
+            MANIFEST_FILENAME: json.dumps(self.manifest(), indent=2, sort_keys=True).encode("utf-8"),
+        }
+        with zipfile.ZipFile(self.path, mode="w") as zf:
+            for name in sorted(entries):
+                info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+                info.external_attr = ZIP_FILE_MODE << 16
+                zf.writestr(info, entries[name])
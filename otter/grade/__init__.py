@@ -15,19 +15,29 @@ _ALLOWED_EXTENSIONS = ["ipynb", "py", "Rmd", "R", "r"]
 
 def main(*, path="./", output_dir="./", autograder="./autograder.zip", containers=None, 
          ext="ipynb", no_kill=False, debug=False, zips=False, image="ucbdsinfra/otter-grader", 
-         pdfs=False, verbose=False, prune=False, force=False, timeout=None, no_network=False):
+         pdfs=False, verbose=False, prune=False, force=False, timeout=None, no_network=False,
+         pool=False, jobs_per_container=None, batch_size=None, no_resume=False,
+         no_cache=False, invalidate_cache=False, cpus=None, memory=None, backend="docker"):
     """
     Runs Otter Grade
 
     Grades a directory of submissions in parallel Docker containers. Results are outputted as a CSV file
-    called ``final_grades.csv``. If ``prune`` is ``True``, Otter's dangling grading images are pruned 
-    and the program exits.
+    called ``final_grades.csv``, which is written to as each submission is graded. The progress of 
+    grading is recorded in a ledger in ``output_dir`` so that rerunning Otter Grade after an 
+    interrupted run skips submissions that were already graded, unless ``no_resume`` is ``True``. 
+    Grading results are also cached by the contents of the submission and the autograder, so that
+    identical submissions are only graded once, unless ``no_cache`` is ``True``. If ``prune`` is 
+    ``True``, Otter's dangling grading images are pruned and the program exits.
+
+    If ``backend`` is ``"local"``, submissions are graded in parallel worker processes in the 
+    current environment instead of in Docker containers.
 
     Args:
         path (``str``): path to directory of submissions
         output_dir (``str``): directory in which to write ``final_grades.csv``
         autograder (``str``): path to Otter autograder configuration zip file
-        containers (``int``): number of containers to run in parallel
+        containers (``int``): maximum number of containers to run in parallel; defaults to the
+            number of CPUs divided by ``cpus``
         ext (``str``): the submission file extension for globbing
         no_kill (``bool``): whether to keep containers after grading is finished
         debug (``bool``): whether to print the stdout of each container
@@ -39,6 +49,18 @@ def main(*, path="./", output_dir="./", autograder="./autograder.zip", container
         force (``bool``): whether to force-prune the images (do not ask for confirmation)
         timeout (``int``): timeout in seconds for each container
         no_network (``bool``): whether to disable networking in the containers
+        pool (``bool``): whether to stream submissions into a pool of long-lived containers instead
+            of starting a container per submission
+        jobs_per_container (``int``): number of submissions a pooled container grades before it is
+            replaced; ignored if ``pool`` is false
+        batch_size (``int``): number of submissions to grade in a single interpreter in each container;
+            cannot be used with ``pool``
+        no_resume (``bool``): whether to regrade submissions that were graded in a previous run
+        no_cache (``bool``): whether to disable the cache of grading results
+        invalidate_cache (``bool``): whether to clear the cache of grading results before grading
+        cpus (``float``): number of CPUs each container is limited to
+        memory (``str``): memory limit of each container (e.g. ``"2g"``)
+        backend (``str``): the backend to grade with, either ``"docker"`` or ``"local"``
 
     Raises:
         ``AssertionError``: if invalid arguments are provided
@@ -58,7 +80,7 @@ def main(*, path="./", output_dir="./", autograder="./autograder.zip", container
         raise ValueError(f"Invalid submission extension specified: {ext}")
 
     if verbose:
-        print("Launching docker containers...")
+        print("Launching docker containers..." if backend == "docker" else "Launching workers...")
 
     #Docker
     grade_dfs = launch_grade(autograder,
@@ -74,6 +96,15 @@ def main(*, path="./", output_dir="./", autograder="./autograder.zip", container
         pdfs=pdfs,
         timeout=timeout,
         network=not no_network,
+        pool=pool,
+        jobs_per_container=jobs_per_container,
+        batch_size=batch_size,
+        resume=not no_resume,
+        cache=not no_cache,
+        invalidate_cache=invalidate_cache,
+        cpus=cpus,
+        memory=memory,
+        backend=backend,
     )
 
     if verbose:
@@ -0,0 +1,134 @@
+"""Content-addressed cache of grading results for Otter Grade"""
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+from hashlib import sha256
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "otter",
+    "grade",
+)
+
+
+class ResultCache:
+    """
+    An on-disk cache of the ``GradingResults`` of submissions, keyed by the hashes of the contents of
+    the submission and of the autograder zip file it was graded with and by the grading options
+    that can affect its results.
+
+    Each entry is stored as a pickle file named after its key. When the total size of the entries
+    exceeds ``max_size`` bytes, the least recently used entries (as determined by their modification
+    times, which are updated whenever an entry is read) are evicted.
+
+    Args:
+        directory (``str``, optional): the directory in which to store the cache; defaults to
+            ``$XDG_CACHE_HOME/otter/grade``
+        max_size (``int``, optional): the maximum total size of the cached results in bytes
+    """
+
+    def __init__(self, directory=None, max_size=256 * 1024 ** 2):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(submission_hash, autograder_hash, options=None):
+        """
+        Return the cache key for a submission graded with an autograder.
+
+        Args:
+            submission_hash (``str``): the hash of the submission's contents
+            autograder_hash (``str``): the hash of the autograder zip file
+            options (``dict``, optional): the grading options that can affect the results (e.g. the
+                timeout and resource limits); these must be JSON-serializable or convertible to
+                strings
+
+        Returns:
+            ``str``: the key
+        """
+        options = json.dumps(options or {}, sort_keys=True, default=str)
+        return sha256(f"{submission_hash}:{autograder_hash}:{options}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """
+        Return the cached results for ``key``, marking the entry as recently used.
+
+        Args:
+            key (``str``): the cache key
+
+        Returns:
+            ``otter.test_files.GradingResults`` or ``None``: the cached results, or ``None`` if
+                there is no entry for ``key``
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                results = pickle.load(f)
+
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        os.utime(path)
+        return results
+
+    def put(self, key, results):
+        """
+        Store results in the cache and evict entries until the cache fits in ``max_size``.
+
+        Args:
+            key (``str``): the cache key
+            results (``otter.test_files.GradingResults``): the results to store
+        """
+        # write to a temporary file first so that other processes never read a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(results, f)
+
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in ``max_size``.
+        """
+        entries = []
+        for file in os.listdir(self.directory):
+            if not file.endswith(".pkl"):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, file))
+
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, file))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, file in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(os.path.join(self.directory, file))
+
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
@@ -1,24 +1,38 @@
 """Docker container management for Otter Grade"""
 import glob
 import os
-import pandas as pd
 import pickle
 import pkg_resources
+import queue
 import shutil
 import tempfile
+import threading
 import zipfile
 
-from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import as_completed, ThreadPoolExecutor
 from python_on_whales import docker
+from python_on_whales.exceptions import DockerException
 from typing import Optional
 
-from .utils import generate_hash, OTTER_DOCKER_IMAGE_TAG
+from .cache import ResultCache
+from .ledger import GradingLedger
+from .resources import ContainerResourceMonitor, RESOURCE_USAGE_FILENAME, ResourceUsageLog
+from .scheduler import AdaptiveScheduler, parse_memory
+from .utils import (
+    generate_environment_hash, generate_hash, order_by_expected_runtime, OTTER_DOCKER_IMAGE_TAG, 
+    results_to_dataframe)
 
 
 def build_image(zip_path, base_image, tag):
     """
     Creates a grading image based on the autograder zip file and attaches a tag.
 
+    The image is built in two stages. First, an environment image containing the assignment's
+    dependencies is built from ``base_image`` by running ``setup.sh``; this image is tagged with
+    a hash of only the files that affect the environment (see ``generate_environment_hash``), so
+    that it is reused by any autograder with the same environment. Then the tests, support files,
+    and configurations are added on top of the environment image to create the grading image.
+
     Args:
         zip_path (``str``): path to the autograder zip file
         base_image (``str``): base Docker image to build from
@@ -28,41 +42,85 @@ def build_image(zip_path, base_image, tag):
         ``str``: the tag of the newly-build Docker image
     """
     image = OTTER_DOCKER_IMAGE_TAG + ":" + tag
-    dockerfile = pkg_resources.resource_filename(__name__, "Dockerfile")
+    env_image = OTTER_DOCKER_IMAGE_TAG + ":env-" + generate_environment_hash(zip_path, base_image)
+    env_dockerfile = pkg_resources.resource_filename(__name__, "Dockerfile")
+    config_dockerfile = pkg_resources.resource_filename(__name__, "config-Dockerfile")
 
     if not docker.image.exists(image):
-        print(f"Building new image using {base_image} as base image")
-
         tmp_dir = tempfile.mkdtemp()
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(tmp_dir)
 
+        if not docker.image.exists(env_image):
+            print(f"Building new environment image using {base_image} as base image")
+            docker.build(tmp_dir, build_args={
+                "BASE_IMAGE": base_image
+            }, tags=[env_image], file=env_dockerfile, load=True)
+
+        print(f"Building new image using {env_image} as base image")
         docker.build(tmp_dir, build_args={
-            "BASE_IMAGE": base_image
-        }, tags=[image], file=dockerfile, load=True)
+            "ENV_IMAGE": env_image
+        }, tags=[image], file=config_dockerfile, load=True)
         shutil.rmtree(tmp_dir)
     return image
 
 
 def launch_grade(zip_path, submissions_dir, verbose=False, num_containers=None, ext="ipynb", 
                  no_kill=False, output_path="./", debug=False, zips=False,
-                 image="ucbdsinfra/otter-grader", pdfs=False, timeout=None, network=True):
+                 image="ucbdsinfra/otter-grader", pdfs=False, timeout=None, network=True,
+                 pool=False, jobs_per_container=None, batch_size=None, resume=True,
+                 cache=True, invalidate_cache=False, cache_dir=None, cpus=None, memory=None,
+                 backend="docker"):
     """
     Grades notebooks in parallel Docker containers
 
-    This function runs ``num_containers`` Docker containers in parallel to grade the student submissions
-    in ``submissions_dir`` using the autograder configuration file at ``zip_path``. It can additionally 
-    generate PDFs for the parts of the assignment needing manual grading.
+    This function runs up to ``num_containers`` Docker containers in parallel to grade the student 
+    submissions in ``submissions_dir`` using the autograder configuration file at ``zip_path``. It can
+    additionally generate PDFs for the parts of the assignment needing manual grading.
+
+    The number of containers running at once is controlled by an ``AdaptiveScheduler``, which
+    starts fewer containers when the host's memory or CPUs are under pressure. If ``num_containers``
+    is unspecified, it defaults to the number of CPUs on the host divided by ``cpus``. Each container
+    is limited to ``cpus`` CPUs and ``memory`` memory, if specified.
+
+    If ``pool`` is true, a ``ContainerPool`` of ``num_containers`` long-lived containers is started
+    and submissions are streamed into them one after another instead of starting a new container
+    for each submission. If ``batch_size`` is set, submissions are instead split into shards of
+    at most ``batch_size`` submissions and each shard is graded in a single container by a single
+    Python interpreter; a submission in a shard that can't be graded is marked as failed without
+    failing the rest of the shard.
+
+    If ``backend`` is ``"local"``, no Docker images are built and submissions are instead graded in
+    a ``LocalWorkerPool`` of ``num_containers`` worker processes in the current environment. Each
+    worker is limited to ``memory`` memory and each submission to ``timeout`` seconds. The local
+    backend cannot be used with ``pool`` or ``batch_size``.
+
+    The status, timings, and scores of each submission are recorded in a ``GradingLedger`` in
+    ``output_path`` as soon as they are available, and the scores are appended to 
+    ``final_grades.csv`` in ``output_path`` as they arrive. The resources used by each container
+    (see ``ContainerResourceMonitor``) are written to ``resource_usage.csv`` in ``output_path``. If
+    ``resume`` is true, submissions that the ledger shows were already graded with the same
+    autograder are not regraded and their rows in ``resource_usage.csv`` are kept. If any 
+    submission fails, the other submissions are still graded before the first error is raised.
+
+    Submissions are dispatched in order of their expected grading time, longest first (see 
+    ``order_by_expected_runtime``), using the grading times recorded in the ledger.
+
+    If ``cache`` is true, the results of each submission are stored in a ``ResultCache`` keyed by 
+    the hashes of the submission and the autograder and by the options that can affect its results
+    (e.g. ``timeout``, ``memory``, and ``backend``), and submissions whose results are already in 
+    the cache are not regraded unless PDFs are requested. Identical submissions are only graded
+    once.
 
     Args:
         zip_path(``str``): path to zip file used to set up container
         submissions_dir (``str``): path to directory of student submissions to be graded
         verbose (``bool``, optional): whether status messages should be printed to the command line
-        num_containers (``int``, optional): The number of parallel containers that will be run
+        num_containers (``int``, optional): the maximum number of parallel containers that will be run
         ext (``str``, optional): the submission file extension for globbing
         no_kill (``bool``, optional): whether the grading containers should be kept running after
             grading finishes
-        output_path (``str``, optional): path at which to write grades CSVs copied from the container
+        output_path (``str``, optional): directory in which to write the grades CSV and grading ledger
         debug (``bool``, optional): whether to run grading in debug mode (prints grading STDOUT and STDERR
             from each container to the command line)
         zips (``bool``, optional): whether the submissions are zip files formatted from ``Notebook.export``
@@ -70,17 +128,42 @@ def launch_grade(zip_path, submissions_dir, verbose=False, num_containers=None,
         pdfs (``bool``, optional): whether to copy PDFs out of the containers
         timeout (``int``): timeout in seconds for each container
         network (``bool``): whether to enable networking in the containers
+        pool (``bool``, optional): whether to grade submissions in a pool of long-lived containers
+        jobs_per_container (``int``, optional): the number of submissions a pooled container grades
+            before it is replaced with a fresh one; ignored if ``pool`` is false
+        batch_size (``int``, optional): the number of submissions to grade in each container; 
+            cannot be used with ``pool``
+        resume (``bool``, optional): whether to skip submissions that were already graded
+        cache (``bool``, optional): whether to use the result cache
+        invalidate_cache (``bool``, optional): whether to clear the result cache before grading
+        cache_dir (``str``, optional): the directory of the result cache; defaults to 
+            ``$XDG_CACHE_HOME/otter/grade``
+        cpus (``float``, optional): the number of CPUs each container is limited to
+        memory (``str`` or ``int``, optional): the memory limit of each container (e.g. ``"2g"``)
+        backend (``str``, optional): the backend to grade with, either ``"docker"`` or ``"local"``
 
     Returns:
-        ``list`` of ``pandas.core.frame.DataFrame``: the grades returned by each container spawned during
-            grading
+        ``list`` of ``pandas.core.frame.DataFrame``: the grades of each submission
+
+    Raises:
+        ``ValueError``: if both ``pool`` and ``batch_size`` are specified, or if either is specified
+            with the local backend
+        ``Exception``: the first error raised while grading a submission
     """
-    if not num_containers:
-        num_containers = 4
+    if pool and batch_size:
+        raise ValueError("Container pools and batch grading cannot be used together")
+
+    local = backend == "local"
+    if local and (pool or batch_size):
+        raise ValueError("Container pools and batch grading cannot be used with the local backend")
 
-    pool = ThreadPoolExecutor(num_containers)
-    futures = []
-    img = build_image(zip_path, image, generate_hash(zip_path))
+    scheduler = AdaptiveScheduler(num_containers, cpus=cpus, memory=memory)
+    num_containers = scheduler.max_containers
+
+    executor = ThreadPoolExecutor(num_containers)
+    futures = {}
+    autograder_hash = generate_hash(zip_path)
+    img = build_image(zip_path, image, autograder_hash) if not local else None
 
     if zips:
         pattern = "*.zip"
@@ -89,32 +172,285 @@ def launch_grade(zip_path, submissions_dir, verbose=False, num_containers=None,
 
     submissions = glob.glob(os.path.join(submissions_dir, pattern))
     pdf_dir = os.path.join(output_path, "submission_pdfs")
-
+    csv_writer = _GradesCSVWriter(os.path.join(output_path, "final_grades.csv"))
+    # when resuming, keep the usage of the submissions that were graded by previous runs
+    usage_log = ResourceUsageLog(os.path.join(output_path, RESOURCE_USAGE_FILENAME), append=resume)
+    ledger = GradingLedger.in_directory(output_path, autograder_hash)
+
+    # the options that can change the results of grading a submission, which are part of its cache key
+    cache_options = {
+        "backend": backend,
+        "cpus": float(cpus) if cpus else None,
+        "ext": ext,
+        "image": image if not local else None,
+        "memory": parse_memory(memory) if memory else None,
+        "network": bool(network),
+        "pdfs": bool(pdfs),
+        "timeout": timeout,
+        "zips": bool(zips),
+    }
+
+    result_cache = None
+    if cache:
+        result_cache = ResultCache(cache_dir)
+        if invalidate_cache:
+            result_cache.clear()
+
+    grade_dfs = []
+
+    def record_results(subm_path, results):
+        df = results_to_dataframe(results, subm_path)
+        ledger.mark_graded(subm_path, df)
+        csv_writer.write(df)
+        grade_dfs.append(df)
+
+    # get the previous grading times before the ledger entries are reset below
+    durations = {p: ledger.get_duration(p) for p in submissions}
+
+    # reuse the scores of submissions that were already graded with this autograder, either in a
+    # previous run on this directory or in the result cache, and only grade one copy of each set of
+    # identical submissions
+    to_grade = {}
+    num_reused, num_cached = 0, 0
     for subm_path in submissions:
-        futures += [
-            pool.submit(
-                grade_assignments,
+        subm_hash = generate_hash(subm_path)
+        df = ledger.get_graded(subm_path, subm_hash) if resume else None
+        if df is not None and (not pdfs or os.path.isfile(_pdf_path(subm_path, pdf_dir))):
+            grade_dfs.append(df)
+            csv_writer.write(df)
+            num_reused += 1
+            continue
+
+        ledger.add_pending(subm_path, subm_hash)
+
+        # PDFs aren't cached, so the cache can't be used if they're needed
+        results = None
+        if result_cache is not None and not pdfs:
+            results = result_cache.get(ResultCache.key(subm_hash, autograder_hash, cache_options))
+
+        if results is not None:
+            record_results(subm_path, results)
+            num_cached += 1
+            continue
+
+        to_grade.setdefault(subm_hash, []).append(subm_path)
+
+    if verbose and num_reused:
+        print(f"Skipping {num_reused} previously graded submissions...")
+    if verbose and num_cached:
+        print(f"Using cached results for {num_cached} submissions...")
+
+    # dispatch the submissions that are expected to take the longest first
+    unique_subms = order_by_expected_runtime(
+        [subm_paths[0] for subm_paths in to_grade.values()], durations)
+    duplicates = {subm_paths[0]: subm_paths[1:] for subm_paths in to_grade.values()}
+    unique_hashes = {subm_paths[0]: subm_hash for subm_hash, subm_paths in to_grade.items()}
+
+    grade_fn = grade_assignments
+    worker_pool = None
+    if local and unique_subms:
+        # the local backend relies on POSIX-only modules, so only import it when it's used
+        from .local import LocalWorkerPool
+        worker_pool = LocalWorkerPool(zip_path, num_containers, memory=memory)
+        grade_fn = worker_pool.grade
+
+    elif pool and unique_subms:
+        container_pool = ContainerPool(
+            img, num_containers, max_jobs=jobs_per_container, network=network, no_kill=no_kill,
+            cpus=cpus, memory=memory)
+        grade_fn = container_pool.grade
+
+    kwargs = dict(
+        verbose=verbose, pdf_dir=pdf_dir, debug=debug, pdfs=pdfs, timeout=timeout, usage_log=usage_log)
+    if not pool and not local:
+        kwargs.update(image=img, no_kill=no_kill, network=network, cpus=cpus, memory=memory)
+
+    if not local:
+        scheduler.start(img)
+
+    if batch_size:
+        for i in range(0, len(unique_subms), batch_size):
+            shard = unique_subms[i:i + batch_size]
+            future = executor.submit(
+                _run_grading_job,
+                ledger,
+                scheduler,
+                [p for subm_path in shard for p in [subm_path] + duplicates[subm_path]],
+                grade_assignment_batch,
+                submission_paths=shard,
+                **kwargs,
+            )
+            futures[future] = shard
+
+    else:
+        for subm_path in unique_subms:
+            future = executor.submit(
+                _run_grading_job,
+                ledger,
+                scheduler,
+                [subm_path] + duplicates[subm_path],
+                grade_fn,
                 submission_path=subm_path,
-                verbose=verbose,
-                image=img,
-                no_kill=no_kill,
-                pdf_dir=pdf_dir,
-                debug=debug,
-                pdfs=pdfs,
-                timeout=timeout,
-                network=network,
+                **kwargs,
             )
-        ]
+            futures[future] = [subm_path]
+
+    # record the results of each container as it finishes
+    errors = []
+    try:
+        for future in as_completed(futures):
+            subm_paths = futures[future]
+            try:
+                all_results = future.result()
+
+            except Exception as e:
+                for subm_path in subm_paths:
+                    for path in [subm_path] + duplicates[subm_path]:
+                        ledger.mark_failed(path, str(e))
+                errors.append(e)
+                continue
+
+            subm_errors = {}
+            if batch_size:
+                all_results, subm_errors = all_results
+            else:
+                all_results = {subm_paths[0]: all_results}
+
+            # only the submissions of a shard that couldn't be graded are marked as failed
+            for subm_path, e in subm_errors.items():
+                for path in [subm_path] + duplicates[subm_path]:
+                    ledger.mark_failed(path, str(e))
+                errors.append(e)
+
+            for subm_path, results in all_results.items():
+                if result_cache is not None:
+                    result_cache.put(
+                        ResultCache.key(unique_hashes[subm_path], autograder_hash, cache_options),
+                        results)
+
+                record_results(subm_path, results)
+                for dup_path in duplicates[subm_path]:
+                    if pdfs:
+                        shutil.copy(_pdf_path(subm_path, pdf_dir), _pdf_path(dup_path, pdf_dir))
+                    record_results(dup_path, results)
+
+    finally:
+        # if grading was interrupted, don't start any more containers
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        if pool and unique_subms:
+            container_pool.close()
+        if worker_pool is not None:
+            worker_pool.close()
+        scheduler.stop()
+        ledger.close()
 
-    # stop execution while containers are running
-    finished_futures = wait(futures)
+    if errors:
+        raise errors[0]
 
-    # return list of dataframes
-    return [df.result() for df in finished_futures[0]]
+    return grade_dfs
+
+
+def _run_grading_job(ledger, scheduler, subm_paths, grade_fn, **kwargs):
+    """
+    Wait for the scheduler to allow another container to run, record in the ledger that grading has
+    started for some submissions, and then grade them.
+
+    Args:
+        ledger (``otter.grade.ledger.GradingLedger``): the grading ledger
+        scheduler (``otter.grade.scheduler.AdaptiveScheduler``): the container scheduler
+        subm_paths (``list`` of ``str``): the paths to the submissions being graded, including
+            duplicates that aren't passed to ``grade_fn``
+        grade_fn (``callable``): the function that grades the submissions
+        **kwargs: keyword arguments passed to ``grade_fn``
+
+    Returns:
+        the return value of ``grade_fn``
+    """
+    scheduler.acquire()
+    try:
+        ledger.mark_running(subm_paths)
+        return grade_fn(**kwargs)
+
+    finally:
+        scheduler.release()
+
+
+def _container_args(network=True, cpus=None, memory=None):
+    """
+    Return the keyword arguments for ``docker.container.run`` or ``docker.container.create`` that
+    set the networking and resource limits of a grading container.
+
+    Args:
+        network (``bool``, optional): whether to enable networking in the container
+        cpus (``float``, optional): the number of CPUs the container is limited to
+        memory (``str`` or ``int``, optional): the memory limit of the container
+
+    Returns:
+        ``dict``: the keyword arguments
+    """
+    args = {}
+
+    if network is not None and not network:
+        args['networks'] = 'none'
+
+    if cpus:
+        args['cpus'] = cpus
+
+    if memory:
+        args['memory'] = memory
+
+    return args
+
+
+def _pdf_path(submission_path, pdf_dir):
+    """
+    Return the path at which the PDF of a submission is written.
+
+    Args:
+        submission_path (``str``): the path to the submission
+        pdf_dir (``str``): the directory containing the submission PDFs
+
+    Returns:
+        ``str``: the path to the PDF
+    """
+    nb_name = os.path.splitext(os.path.basename(submission_path))[0]
+    return os.path.join(pdf_dir, nb_name + ".pdf")
+
+
+class _GradesCSVWriter:
+    """
+    Writes rows of grades to a CSV file as they become available.
+
+    The file is overwritten by the first row written and all subsequent rows are appended to it. The
+    ``file`` column is always written first.
+
+    Args:
+        path (``str``): the path to the CSV file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+
+    def write(self, df):
+        """
+        Write the rows of a scores dataframe to the CSV file.
+
+        Args:
+            df (``pandas.core.frame.DataFrame``): the scores dataframe
+        """
+        if self.columns is None:
+            self.columns = ["file"] + [c for c in df.columns if c != "file"]
+            df[self.columns].to_csv(self.path, index=False)
+        else:
+            df.reindex(columns=self.columns).to_csv(self.path, mode="a", header=False, index=False)
 
 
 def grade_assignments(submission_path, image, verbose=False, no_kill=False, pdf_dir=None, 
-                      debug=False, pdfs=False, timeout: Optional[int] = None, network=True):
+                      debug=False, pdfs=False, timeout: Optional[int] = None, network=True,
+                      cpus=None, memory=None, usage_log=None):
     """
     Grades multiple submissions in a directory using a single docker container. If no PDF assignment is
     wanted, set all three PDF params (``unfiltered_pdfs``, ``tag_filter``, and ``html_filter``) to ``False``.
@@ -131,9 +467,13 @@ def grade_assignments(submission_path, image, verbose=False, no_kill=False, pdf_
         pdfs (``bool``, optional): whether to copy PDFs out of the containers
         timeout (``int``): timeout in seconds for each container
         network (``bool``): whether to enable networking in the containers
+        cpus (``float``, optional): the number of CPUs the container is limited to
+        memory (``str`` or ``int``, optional): the memory limit of the container
+        usage_log (``otter.grade.resources.ResourceUsageLog``, optional): a log to which to write
+            the resources used by the container
 
     Returns:
-        ``pandas.core.frame.DataFrame``: A dataframe of file to grades information
+        ``otter.test_files.GradingResults``: the results of grading the submission
     """
     temp_subm_file, temp_subm_path = tempfile.mkstemp()
     shutil.copyfile(submission_path, temp_subm_path)
@@ -154,17 +494,15 @@ def grade_assignments(submission_path, image, verbose=False, no_kill=False, pdf_
         if pdfs:
             volumes.append((pdf_path, f"/autograder/submission/{nb_name}.pdf"))
 
-        args = {}
-
-        if network is not None and not network:
-            args['networks'] = 'none'
+        args = _container_args(network=network, cpus=cpus, memory=memory)
 
         container = docker.container.run(image, command=["/autograder/run_autograder"], volumes=volumes, detach=True, **args)
+        monitor = ContainerResourceMonitor(container)
+        monitor.start()
 
         if timeout:
-            import threading
-
             def kill_container():
+                monitor.timed_out = True
                 docker.container.kill(container)
 
             timer = threading.Timer(timeout, kill_container)
@@ -179,6 +517,10 @@ def grade_assignments(submission_path, image, verbose=False, no_kill=False, pdf_
         if timeout:
             timer.cancel()
 
+        monitor.stop()
+        if usage_log is not None:
+            usage_log.record(monitor.usage(nb_basename, exit))
+
         if debug:
             print(docker.container.logs(container))
 
@@ -191,11 +533,6 @@ def grade_assignments(submission_path, image, verbose=False, no_kill=False, pdf_
         with open(results_path, "rb") as f:
             scores = pickle.load(f)
 
-        scores = scores.to_dict()
-        scores = {t: [scores[t]["score"]] if type(scores[t]) == dict else scores[t] for t in scores}
-        scores["file"] = os.path.split(submission_path)[1]
-        df = pd.DataFrame(scores)
-
         if pdfs:
             os.makedirs(pdf_dir, exist_ok=True)
 
@@ -211,4 +548,356 @@ def grade_assignments(submission_path, image, verbose=False, no_kill=False, pdf_
             os.close(pdf_file)
             os.remove(pdf_path)
 
-    return df
+    return scores
+
+
+def grade_assignment_batch(submission_paths, image, verbose=False, no_kill=False, pdf_dir=None,
+                           debug=False, pdfs=False, timeout: Optional[int] = None, network=True,
+                           cpus=None, memory=None, usage_log=None):
+    """
+    Grades a shard of submissions in a single Docker container.
+
+    The submissions are copied into ``/autograder/batch`` in the container and graded one after
+    another by ``otter.run.run_autograder.run_batch`` in a single Python interpreter, so that the 
+    cost of starting the interpreter and importing Otter and the assignment's dependencies is only
+    paid once per shard. If ``timeout`` is set, the container is killed after ``timeout`` seconds
+    per submission in the shard.
+
+    Args:
+        submission_paths (``list`` of ``str``): paths to the submissions to be graded; these must 
+            have distinct basenames
+        image (``str``): a Docker image tag to be used for grading environment
+        verbose (``bool``, optional): whether status messages should be printed to the command line
+        no_kill (``bool``, optional): whether the grading container should be kept after grading
+            finishes
+        pdf_dir (``str``, optional): directory in which to put notebook PDFs, if applicable
+        debug (``bool``, False): whether to run grading in debug mode (prints grading STDOUT and STDERR
+            from the container to the command line)
+        pdfs (``bool``, optional): whether to copy PDFs out of the container
+        timeout (``int``): timeout in seconds for each submission in the shard
+        network (``bool``): whether to enable networking in the container
+        cpus (``float``, optional): the number of CPUs the container is limited to
+        memory (``str`` or ``int``, optional): the memory limit of the container
+        usage_log (``otter.grade.resources.ResourceUsageLog``, optional): a log to which to write
+            the resources used by the container; the ``file`` column of the row contains the names
+            of all of the submissions in the shard, separated by semicolons
+
+    Returns:
+        ``tuple`` of ``dict``: a dictionary mapping the path of each submission that was graded to
+            its ``otter.test_files.GradingResults`` and a dictionary mapping the path of each
+            submission that could not be graded to an ``Exception`` describing the error
+
+    Raises:
+        ``Exception``: if the container exits with a non-zero exit code
+    """
+    batch_dir = tempfile.mkdtemp()
+    results_parent_dir = tempfile.mkdtemp()
+
+    try:
+        for subm_path in submission_paths:
+            shutil.copy(subm_path, batch_dir)
+
+        args = _container_args(network=network, cpus=cpus, memory=memory)
+
+        container = docker.container.create(
+            image, command=["/autograder/run_autograder", "/autograder/batch"], **args)
+        docker.container.copy(batch_dir, (container, "/autograder/batch"))
+        docker.container.start(container)
+        monitor = ContainerResourceMonitor(container)
+        monitor.start()
+
+        if timeout:
+            def kill_container():
+                monitor.timed_out = True
+                docker.container.kill(container)
+
+            timer = threading.Timer(timeout * len(submission_paths), kill_container)
+            timer.start()
+
+        container_id = container.id[:12]
+        if verbose:
+            print(f"Grading {len(submission_paths)} submissions in container {container_id}...")
+
+        exit = docker.container.wait(container)
+
+        if timeout:
+            timer.cancel()
+
+        monitor.stop()
+        if usage_log is not None:
+            usage_log.record(monitor.usage(
+                ";".join(os.path.basename(p) for p in submission_paths), exit))
+
+        if debug:
+            print(docker.container.logs(container))
+
+        if exit == 0:
+            results_dir = os.path.join(results_parent_dir, "results")
+            docker.container.copy((container, "/autograder/batch/results"), results_dir)
+
+        if not no_kill:
+            container.remove()
+
+        if exit != 0:
+            raise Exception(
+                f"Executing batch of {len(submission_paths)} submissions in docker container failed! "
+                f"Exit code: {exit}")
+
+        all_scores, errors = {}, {}
+        for subm_path in submission_paths:
+            nb_basename = os.path.basename(subm_path)
+            nb_name = os.path.splitext(nb_basename)[0]
+
+            # a submission that couldn't be graded shouldn't lose the grades of the rest of the shard
+            error_path = os.path.join(results_dir, f"{nb_basename}.error")
+            if os.path.isfile(error_path):
+                with open(error_path) as f:
+                    errors[subm_path] = Exception(
+                        f"Executing '{subm_path}' in docker container failed!\n{f.read()}")
+                continue
+
+            with open(os.path.join(results_dir, f"{nb_basename}.pkl"), "rb") as f:
+                all_scores[subm_path] = pickle.load(f)
+
+            if pdfs:
+                os.makedirs(pdf_dir, exist_ok=True)
+                shutil.copy(os.path.join(results_dir, f"{nb_name}.pdf"), pdf_dir)
+
+    finally:
+        shutil.rmtree(batch_dir)
+        shutil.rmtree(results_parent_dir)
+
+    return all_scores, errors
+
+
+class ContainerPool:
+    """
+    A pool of long-lived grading containers into which submissions are streamed one after another.
+
+    Each container in the pool is started from the grading image and kept alive between
+    submissions. Before each submission is graded, the container's ``/autograder/submission`` and 
+    ``/autograder/results`` directories are emptied, the submission is copied in, and
+    ``/autograder/run_autograder`` is executed in the container. Containers are started lazily and
+    are replaced with a fresh container after ``max_jobs`` submissions or when grading a submission
+    fails.
+
+    ``ContainerPool.grade`` blocks until a container is free, so it is safe to call it from as many
+    threads as there are containers in the pool.
+
+    Args:
+        image (``str``): the Docker image tag to start containers from
+        size (``int``): the number of containers in the pool
+        max_jobs (``int``, optional): the number of submissions a container grades before it is
+            recycled; if ``None``, containers are only recycled when grading fails
+        network (``bool``, optional): whether to enable networking in the containers
+        no_kill (``bool``, optional): whether to keep containers after they are retired
+        cpus (``float``, optional): the number of CPUs each container is limited to
+        memory (``str`` or ``int``, optional): the memory limit of each container
+
+    Attributes:
+        image (``str``): the Docker image tag to start containers from
+        max_jobs (``int``): the number of submissions a container grades before it is recycled
+        network (``bool``): whether networking is enabled in the containers
+        no_kill (``bool``): whether containers are kept after they are retired
+        cpus (``float``): the number of CPUs each container is limited to
+        memory (``str`` or ``int``): the memory limit of each container
+    """
+
+    def __init__(self, image, size, max_jobs=None, network=True, no_kill=False, cpus=None, 
+                 memory=None):
+        self.image = image
+        self.max_jobs = max_jobs
+        self.network = network
+        self.no_kill = no_kill
+        self.cpus = cpus
+        self.memory = memory
+
+        self._slots = queue.Queue()
+        for _ in range(size):
+            self._slots.put(_PooledContainer())
+
+    def _start_container(self):
+        """
+        Starts a new idle container from the grading image.
+
+        Returns:
+            ``python_on_whales.Container``: the running container
+        """
+        args = _container_args(network=self.network, cpus=self.cpus, memory=self.memory)
+
+        # keep the container alive without doing anything so that jobs can be exec'ed into it
+        return docker.container.run(
+            self.image, command=["tail", "-f", "/dev/null"], detach=True, **args)
+
+    def _retire(self, slot):
+        """
+        Stops the container in ``slot`` (removing it unless ``no_kill`` is true) so that the next job
+        run in that slot starts a fresh container.
+
+        Args:
+            slot (``_PooledContainer``): the slot whose container should be retired
+        """
+        if slot.container is not None:
+            try:
+                if self.no_kill:
+                    docker.container.kill(slot.container)
+                else:
+                    docker.container.remove(slot.container, force=True)
+
+            except DockerException:
+                pass
+
+        slot.container = None
+        slot.jobs_run = 0
+
+    def grade(self, submission_path, verbose=False, pdf_dir=None, debug=False, pdfs=False, 
+              timeout: Optional[int] = None, usage_log=None):
+        """
+        Grades a single submission in the next available container in the pool.
+
+        Args:
+            submission_path (``str``): path to the submission to be graded
+            verbose (``bool``, optional): whether status messages should be printed to the command line
+            pdf_dir (``str``, optional): directory in which to put notebook PDFs, if applicable
+            debug (``bool``, False): whether to run grading in debug mode (prints grading STDOUT and 
+                STDERR from each container to the command line)
+            pdfs (``bool``, optional): whether to copy PDFs out of the containers
+            timeout (``int``): timeout in seconds for grading the submission
+            usage_log (``otter.grade.resources.ResourceUsageLog``, optional): a log to which to 
+                write the resources used to grade the submission
+
+        Returns:
+            ``otter.test_files.GradingResults``: the results of grading the submission
+        """
+        slot = self._slots.get()
+
+        try:
+            if slot.container is None:
+                slot.container = self._start_container()
+
+            try:
+                scores = self._grade_in_container(
+                    slot.container, submission_path, verbose=verbose, pdf_dir=pdf_dir, debug=debug,
+                    pdfs=pdfs, timeout=timeout, usage_log=usage_log, fresh=slot.jobs_run == 0)
+
+            except:
+                self._retire(slot)
+                raise
+
+            slot.jobs_run += 1
+            if self.max_jobs and slot.jobs_run >= self.max_jobs:
+                self._retire(slot)
+
+        finally:
+            self._slots.put(slot)
+
+        return scores
+
+    def _grade_in_container(self, container, submission_path, verbose=False, pdf_dir=None, 
+                            debug=False, pdfs=False, timeout=None, usage_log=None, fresh=True):
+        """
+        Resets the grading directories of ``container``, copies the submission into it, and runs
+        the autograder.
+
+        Args:
+            container (``python_on_whales.Container``): the container to grade in
+            submission_path (``str``): path to the submission to be graded
+            verbose (``bool``, optional): whether status messages should be printed to the command line
+            pdf_dir (``str``, optional): directory in which to put notebook PDFs, if applicable
+            debug (``bool``, False): whether to print grading STDOUT and STDERR to the command line
+            pdfs (``bool``, optional): whether to copy PDFs out of the container
+            timeout (``int``): timeout in seconds for grading the submission
+            usage_log (``otter.grade.resources.ResourceUsageLog``, optional): a log to which to 
+                write the resources used to grade the submission
+            fresh (``bool``, optional): whether this is the first job run in the container
+
+        Returns:
+            ``otter.test_files.GradingResults``: the results of grading the submission
+        """
+        nb_basename = os.path.basename(submission_path)
+        nb_name = os.path.splitext(nb_basename)[0]
+
+        # clear out everything left behind by the previous job
+        docker.container.execute(container, [
+            "find", "/autograder/submission", "/autograder/results", "-mindepth", "1", "-delete"])
+        docker.container.copy(submission_path, (container, f"/autograder/submission/{nb_basename}"))
+
+        monitor = ContainerResourceMonitor(container, fresh=fresh)
+        monitor.start()
+
+        if timeout:
+            def kill_container():
+                monitor.timed_out = True
+                docker.container.kill(container)
+
+            timer = threading.Timer(timeout, kill_container)
+            timer.start()
+
+        container_id = container.id[:12]
+        if verbose:
+            print(f"Grading {submission_path} in container {container_id}...")
+
+        exit = 0
+        try:
+            output = docker.container.execute(container, ["/autograder/run_autograder"])
+
+        except DockerException as e:
+            exit = e.return_code
+            output = "".join(
+                o.decode("utf-8", errors="replace") for o in (e.stdout, e.stderr) if o is not None)
+
+        finally:
+            if timeout:
+                timer.cancel()
+
+            monitor.stop()
+            if usage_log is not None:
+                usage_log.record(monitor.usage(nb_basename, exit))
+
+        if debug:
+            print(output)
+
+        if exit != 0:
+            raise Exception(f"Executing '{submission_path}' in docker container failed! Exit code: {exit}")
+
+        results_file, results_path = tempfile.mkstemp(suffix=".pkl")
+
+        try:
+            docker.container.copy((container, "/autograder/results/results.pkl"), results_path)
+            with open(results_path, "rb") as f:
+                scores = pickle.load(f)
+
+        finally:
+            os.close(results_file)
+            os.remove(results_path)
+
+        if pdfs:
+            os.makedirs(pdf_dir, exist_ok=True)
+
+            local_pdf_path = os.path.join(pdf_dir, f"{nb_name}.pdf")
+            docker.container.copy(
+                (container, f"/autograder/submission/{nb_name}.pdf"), local_pdf_path)
+
+        return scores
+
+    def close(self):
+        """
+        Retires every container in the pool.
+        """
+        while True:
+            try:
+                slot = self._slots.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(slot)
+
+
+class _PooledContainer:
+    """
+    A slot in a ``ContainerPool`` tracking its (possibly not yet started) container and the number
+    of jobs that container has run.
+    """
+
+    def __init__(self):
+        self.container = None
+        self.jobs_run = 0
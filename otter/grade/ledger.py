@@ -0,0 +1,169 @@
+"""Persistent record of grading progress for Otter Grade"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+LEDGER_FILENAME = ".OTTER_GRADE_LEDGER.db"
+
+
+class GradingLedger:
+    """
+    A SQLite-backed record of the status, timings, and scores of each submission graded by Otter
+    Grade.
+
+    Each submission is keyed by its absolute path and stored with hashes of the submission and of
+    the autograder zip file it was graded with, so that a rerun of Otter Grade can skip submissions
+    that have already been graded with the same autograder. Every write is committed immediately, so
+    the ledger survives crashes and interrupted grading runs. The ledger can be shared between the
+    threads managing the grading containers.
+
+    Args:
+        path (``str``): the path to the SQLite database
+        autograder_hash (``str``): the hash of the autograder zip file being used for grading
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    GRADED = "graded"
+    FAILED = "failed"
+
+    def __init__(self, path, autograder_hash):
+        self.path = path
+        self.autograder_hash = autograder_hash
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                file TEXT PRIMARY KEY,
+                submission_hash TEXT,
+                autograder_hash TEXT,
+                status TEXT,
+                started REAL,
+                finished REAL,
+                scores BLOB,
+                error TEXT
+            )
+        """)
+
+    @classmethod
+    def in_directory(cls, directory, autograder_hash):
+        """
+        Open the ledger stored in ``directory``, creating it if it does not exist.
+
+        Args:
+            directory (``str``): the directory containing the ledger
+            autograder_hash (``str``): the hash of the autograder zip file being used for grading
+
+        Returns:
+            ``GradingLedger``: the ledger
+        """
+        return cls(os.path.join(directory, LEDGER_FILENAME), autograder_hash)
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def get_graded(self, submission_path, submission_hash):
+        """
+        Return the scores of a submission if it has already been graded with the current autograder.
+
+        Args:
+            submission_path (``str``): the path to the submission
+            submission_hash (``str``): the hash of the submission's contents
+
+        Returns:
+            ``pandas.core.frame.DataFrame`` or ``None``: the scores dataframe, or ``None`` if there
+                is no matching graded entry in the ledger
+        """
+        rows = self._execute(
+            "SELECT scores FROM submissions WHERE file = ? AND submission_hash = ? "
+            "AND autograder_hash = ? AND status = ?",
+            (os.path.abspath(submission_path), submission_hash, self.autograder_hash, self.GRADED),
+        )
+        if not rows:
+            return None
+        return pickle.loads(rows[0][0])
+
+    def get_duration(self, submission_path):
+        """
+        Return how long the last successful grading of a submission took.
+
+        Args:
+            submission_path (``str``): the path to the submission
+
+        Returns:
+            ``float`` or ``None``: the duration in seconds, or ``None`` if the submission has not
+                been graded
+        """
+        rows = self._execute(
+            "SELECT finished - started FROM submissions WHERE file = ? AND status = ?",
+            (os.path.abspath(submission_path), self.GRADED),
+        )
+        if not rows:
+            return None
+        return rows[0][0]
+
+    def add_pending(self, submission_path, submission_hash):
+        """
+        Record that a submission has been queued for grading, discarding any previous entry for it.
+
+        Args:
+            submission_path (``str``): the path to the submission
+            submission_hash (``str``): the hash of the submission's contents
+        """
+        self._execute(
+            "INSERT OR REPLACE INTO submissions (file, submission_hash, autograder_hash, status) "
+            "VALUES (?, ?, ?, ?)",
+            (os.path.abspath(submission_path), submission_hash, self.autograder_hash, self.PENDING),
+        )
+
+    def mark_running(self, submission_paths):
+        """
+        Record that grading has started for the specified submissions.
+
+        Args:
+            submission_paths (``list`` of ``str``): the paths to the submissions
+        """
+        now = time.time()
+        for subm_path in submission_paths:
+            self._execute(
+                "UPDATE submissions SET status = ?, started = ? WHERE file = ?",
+                (self.RUNNING, now, os.path.abspath(subm_path)),
+            )
+
+    def mark_graded(self, submission_path, df):
+        """
+        Record the scores of a submission that was graded successfully.
+
+        Args:
+            submission_path (``str``): the path to the submission
+            df (``pandas.core.frame.DataFrame``): the scores dataframe
+        """
+        self._execute(
+            "UPDATE submissions SET status = ?, finished = ?, scores = ?, error = NULL WHERE file = ?",
+            (self.GRADED, time.time(), pickle.dumps(df), os.path.abspath(submission_path)),
+        )
+
+    def mark_failed(self, submission_path, error):
+        """
+        Record that grading a submission failed.
+
+        Args:
+            submission_path (``str``): the path to the submission
+            error (``str``): a description of the error
+        """
+        self._execute(
+            "UPDATE submissions SET status = ?, finished = ?, scores = NULL, error = ? WHERE file = ?",
+            (self.FAILED, time.time(), error, os.path.abspath(submission_path)),
+        )
+
+    def close(self):
+        """
+        Close the connection to the database.
+        """
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,282 @@
+"""Docker-free grading of submissions in local worker processes for Otter Grade"""
+
+import contextlib
+import io
+import json
+import os
+import pickle
+import resource
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import traceback
+import zipfile
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from .resources import ResourceUsage
+from .scheduler import parse_memory
+from ..run.run_autograder import load_runner, run_submission
+from ..run.zygote import run_in_fork, ZygoteError
+from ..utils import time_limit
+
+
+# the number of seconds past its timeout after which a child still grading a submission is killed
+KILL_GRACE_PERIOD = 5
+
+
+class GradingTimeout(Exception):
+    """
+    Raised in a worker process when grading a submission exceeds its timeout.
+    """
+
+
+class LocalWorkerPool:
+    """
+    A pool of worker processes that grade submissions in the current Python environment without
+    Docker.
+
+    Each worker process extracts the autograder zip file into its own temporary directory with the
+    same layout as ``/autograder`` in a grading container, and grades each submission it is given
+    in that directory as ``otter run`` does, emptying the ``submission`` and ``results`` directories
+    between submissions. Each submission is graded in a fresh child forked from the worker, so that
+    nothing a submission does (e.g. to imported modules or global state) affects the next one, and
+    the resources used by that child are recorded as the submission's usage. Because nothing is
+    installed for the workers, the assignment's dependencies must already be installed in the
+    current environment.
+
+    If ``memory`` is set, the address space of each worker is limited with ``resource.setrlimit``,
+    so that allocations past the limit raise a ``MemoryError``. A ``GradingTimeout`` is raised in the
+    child grading a submission when it exceeds its timeout, and the child is killed by the worker if
+    it is still running ``KILL_GRACE_PERIOD`` seconds later (e.g. because the submission catches the
+    exception or is stuck in a call into C). If a worker dies, the pool's processes are replaced and
+    grading continues.
+
+    ``LocalWorkerPool.grade`` blocks until its submission is graded, so it should be called from
+    as many threads as there are workers in the pool.
+
+    Args:
+        zip_path (``str``): the path to the autograder zip file
+        size (``int``): the number of worker processes in the pool
+        memory (``str`` or ``int``, optional): the memory limit of each worker (e.g. ``"2g"``)
+
+    Attributes:
+        zip_path (``str``): the path to the autograder zip file
+        size (``int``): the number of worker processes in the pool
+        memory (``int``): the memory limit of each worker in bytes
+    """
+
+    def __init__(self, zip_path, size, memory=None):
+        self.zip_path = os.path.abspath(zip_path)
+        self.size = size
+        self.memory = parse_memory(memory) if memory is not None else None
+
+        self._root = tempfile.mkdtemp()
+        self._lock = threading.Lock()
+        self._executor = self._start_executor()
+
+    def _start_executor(self):
+        return ProcessPoolExecutor(
+            self.size, initializer=_init_worker, initargs=(self.zip_path, self._root, self.memory))
+
+    def _restart(self, executor):
+        """
+        Replaces ``executor`` with a new set of worker processes, unless another thread already has.
+
+        Args:
+            executor (``concurrent.futures.ProcessPoolExecutor``): the broken executor
+        """
+        with self._lock:
+            if self._executor is executor:
+                executor.shutdown(wait=False)
+                self._executor = self._start_executor()
+
+    def grade(self, submission_path, verbose=False, pdf_dir=None, debug=False, pdfs=False,
+              timeout: Optional[int] = None, usage_log=None):
+        """
+        Grades a single submission in the next available worker process.
+
+        Args:
+            submission_path (``str``): path to the submission to be graded
+            verbose (``bool``, optional): whether status messages should be printed to the command line
+            pdf_dir (``str``, optional): directory in which to put notebook PDFs, if applicable
+            debug (``bool``, False): whether to run grading in debug mode (prints grading STDOUT and
+                STDERR to the command line)
+            pdfs (``bool``, optional): whether to copy the PDFs of the submissions into ``pdf_dir``
+            timeout (``int``): timeout in seconds for grading the submission
+            usage_log (``otter.grade.resources.ResourceUsageLog``, optional): a log to which to
+                write the resources used to grade the submission
+
+        Returns:
+            ``otter.test_files.GradingResults``: the results of grading the submission
+        """
+        if verbose:
+            print(f"Grading {submission_path} in a local worker...")
+
+        with self._lock:
+            executor = self._executor
+
+        try:
+            scores, output, error, usage = executor.submit(
+                _grade_in_worker, os.path.abspath(submission_path),
+                pdf_dir=os.path.abspath(pdf_dir) if pdf_dir else None, pdfs=pdfs,
+                timeout=timeout).result()
+
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise Exception(f"Grading '{submission_path}' failed: the worker process died")
+
+        if usage_log is not None:
+            usage_log.record(usage)
+
+        if debug:
+            print(output)
+
+        if error is not None:
+            raise Exception(f"Grading '{submission_path}' in a local worker failed:\n{error}")
+
+        return scores
+
+    def close(self):
+        """
+        Stops the worker processes and removes their autograder directories.
+        """
+        with self._lock:
+            self._executor.shutdown(wait=True)
+        shutil.rmtree(self._root, ignore_errors=True)
+
+
+# the autograder directory of the current worker process
+_autograder_dir = None
+
+
+def _init_worker(zip_path, root, memory):
+    """
+    Sets up a worker process of a ``LocalWorkerPool`` by creating its autograder directory in
+    ``root`` and setting its resource limits.
+
+    Args:
+        zip_path (``str``): the path to the autograder zip file
+        root (``str``): the directory in which to create the autograder directory
+        memory (``int``): the memory limit of the worker in bytes
+    """
+    global _autograder_dir
+
+    _autograder_dir = os.path.join(tempfile.mkdtemp(dir=root), "autograder")
+    for subdir in ["source", "submission", "results"]:
+        os.makedirs(os.path.join(_autograder_dir, subdir))
+
+    with open(os.path.join(_autograder_dir, "submission_metadata.json"), "w+") as f:
+        json.dump({}, f)
+
+    with zipfile.ZipFile(zip_path) as zf:
+        zf.extractall(os.path.join(_autograder_dir, "source"))
+
+    if memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def _grade_in_worker(submission_path, pdf_dir=None, pdfs=False, timeout=None):
+    """
+    Grades a submission in the autograder directory of the current worker process, in a child forked
+    from the worker.
+
+    Args:
+        submission_path (``str``): the absolute path to the submission
+        pdf_dir (``str``, optional): directory in which to put notebook PDFs, if applicable
+        pdfs (``bool``, optional): whether to copy the PDF of the submission into ``pdf_dir``
+        timeout (``int``, optional): timeout in seconds for grading the submission
+
+    Returns:
+        ``tuple``: the ``GradingResults`` (or ``None`` if grading failed), the output of the
+            autograder, the traceback of the error raised while grading (or ``None``), and the
+            ``ResourceUsage`` of the job
+    """
+    nb_basename = os.path.basename(submission_path)
+
+    # clear out everything left behind by the previous job
+    for subdir in ["submission", "results"]:
+        path = os.path.join(_autograder_dir, subdir)
+        shutil.rmtree(path)
+        os.makedirs(path)
+
+    shutil.copy(submission_path, os.path.join(_autograder_dir, "submission"))
+
+    start_time = time.monotonic()
+    try:
+        (scores, output, error, oom_killed, timed_out), rusage = run_in_fork(
+            _grade_submission, submission_path, pdf_dir=pdf_dir, pdfs=pdfs, timeout=timeout,
+            kill_after=timeout + KILL_GRACE_PERIOD if timeout else None)
+
+    except ZygoteError as e:
+        scores, output, rusage, timed_out = None, "", e.rusage, e.timed_out
+        error = traceback.format_exc()
+        if timed_out:
+            error = f"GradingTimeout: Grading the submission timed out and it was killed\n{error}"
+
+        # the kernel kills processes that run out of memory with SIGKILL
+        oom_killed = not timed_out and e.exitcode == -signal.SIGKILL
+
+    usage = ResourceUsage(
+        file=nb_basename,
+        wall_time=time.monotonic() - start_time,
+        cpu_time=rusage.ru_utime + rusage.ru_stime if rusage is not None else 0,
+        # ru_maxrss is in kilobytes
+        peak_memory=rusage.ru_maxrss * 1024 if rusage is not None else 0,
+        oom_killed=oom_killed,
+        timed_out=timed_out,
+        exit_code=0 if error is None else 1,
+    )
+
+    return scores, output, error, usage
+
+
+def _grade_submission(submission_path, pdf_dir=None, pdfs=False, timeout=None):
+    """
+    Grades the submission copied into the autograder directory of the current worker process.
+
+    Args:
+        submission_path (``str``): the absolute path to the submission
+        pdf_dir (``str``, optional): directory in which to put notebook PDFs, if applicable
+        pdfs (``bool``, optional): whether to copy the PDF of the submission into ``pdf_dir``
+        timeout (``int``, optional): timeout in seconds for grading the submission
+
+    Returns:
+        ``tuple``: the ``GradingResults`` (or ``None`` if grading failed), the output of the
+            autograder, the traceback of the error raised while grading (or ``None``), whether
+            grading ran out of memory, and whether it timed out
+    """
+    nb_name = os.path.splitext(os.path.basename(submission_path))[0]
+
+    scores, error, oom_killed = None, None, False
+    output = io.StringIO()
+
+    # errors raised in the cells of the notebook are swallowed while it is executed, so the timeout
+    # is raised every second until grading stops
+    limit = time_limit(timeout, GradingTimeout, interval=1)
+    try:
+        with limit, contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            run_submission(load_runner(_autograder_dir, logo=False))
+
+        if limit.expired:
+            raise GradingTimeout("Grading the submission timed out")
+
+        with open(os.path.join(_autograder_dir, "results", "results.pkl"), "rb") as f:
+            scores = pickle.load(f)
+
+        if pdfs:
+            os.makedirs(pdf_dir, exist_ok=True)
+            shutil.copy(
+                os.path.join(_autograder_dir, "submission", f"{nb_name}.pdf"),
+                os.path.join(pdf_dir, f"{nb_name}.pdf"),
+            )
+
+    except Exception as e:
+        oom_killed = isinstance(e, MemoryError)
+        error = traceback.format_exc()
+
+    return scores, output.getvalue(), error, oom_killed, limit.expired
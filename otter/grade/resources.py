@@ -0,0 +1,285 @@
+"""Resource accounting for grading containers in Otter Grade"""
+
+import csv
+import os
+import threading
+import time
+
+from collections import namedtuple
+from python_on_whales import docker
+from python_on_whales.exceptions import DockerException
+
+
+ResourceUsage = namedtuple("ResourceUsage", [
+    "file", "wall_time", "cpu_time", "peak_memory", "oom_killed", "timed_out", "exit_code"])
+
+RESOURCE_USAGE_FILENAME = "resource_usage.csv"
+
+
+class _CgroupReader:
+    """
+    Reads the resource usage of a container from its cgroup on the host, supporting both cgroup v1
+    and v2 and the ``systemd`` and ``cgroupfs`` cgroup drivers. Each method returns ``None`` if the
+    value is unavailable (e.g. if the cgroup can't be found or the container has exited).
+
+    Args:
+        container_id (``str``): the full ID of the container
+    """
+
+    ROOT = "/sys/fs/cgroup"
+
+    def __init__(self, container_id):
+        self.v2_dir = self._find_dir("", container_id)
+        self.cpu_dir = self._find_dir("cpuacct", container_id)
+        self.memory_dir = self._find_dir("memory", container_id)
+
+    @classmethod
+    def _find_dir(cls, controller, container_id):
+        for parent in [os.path.join("system.slice", f"docker-{container_id}.scope"),
+                       os.path.join("docker", container_id)]:
+            path = os.path.join(cls.ROOT, controller, parent)
+            if os.path.isdir(path):
+                return path
+
+    @staticmethod
+    def _read(directory, file):
+        if directory is None:
+            return None
+
+        try:
+            with open(os.path.join(directory, file)) as f:
+                return f.read()
+
+        except OSError:
+            return None
+
+    @classmethod
+    def _read_int(cls, directory, file):
+        contents = cls._read(directory, file)
+        if contents is None or not contents.strip().isdigit():
+            return None
+        return int(contents)
+
+    @classmethod
+    def _read_key(cls, directory, file, key):
+        contents = cls._read(directory, file)
+        if contents is None:
+            return None
+
+        for line in contents.splitlines():
+            k, _, v = line.partition(" ")
+            if k == key and v.strip().isdigit():
+                return int(v)
+
+    @property
+    def available(self):
+        return self.v2_dir is not None or self.cpu_dir is not None or self.memory_dir is not None
+
+    def cpu_time(self):
+        """
+        Returns the CPU time used by the container in seconds.
+        """
+        usage = self._read_key(self.v2_dir, "cpu.stat", "usage_usec")
+        if usage is not None:
+            return usage / 1e6
+
+        usage = self._read_int(self.cpu_dir, "cpuacct.usage")
+        if usage is not None:
+            return usage / 1e9
+
+    def memory(self):
+        """
+        Returns the current memory usage of the container in bytes.
+        """
+        usage = self._read_int(self.v2_dir, "memory.current")
+        if usage is None:
+            usage = self._read_int(self.memory_dir, "memory.usage_in_bytes")
+        return usage
+
+    def peak_memory(self):
+        """
+        Returns the peak memory usage over the lifetime of the container in bytes.
+        """
+        usage = self._read_int(self.v2_dir, "memory.peak")
+        if usage is None:
+            usage = self._read_int(self.memory_dir, "memory.max_usage_in_bytes")
+        return usage
+
+    def oom_kills(self):
+        """
+        Returns the number of processes in the container that have been killed by the OOM killer.
+        """
+        kills = self._read_key(self.v2_dir, "memory.events", "oom_kill")
+        if kills is None:
+            kills = self._read_key(self.memory_dir, "memory.oom_control", "oom_kill")
+        return kills
+
+
+class ContainerResourceMonitor:
+    """
+    Tracks the resources used by a grading container while it runs a job.
+
+    While started, the monitor samples the container's CPU time and memory usage every ``interval``
+    seconds from its cgroup if it can be found on the host, and from ``docker stats`` otherwise. The
+    wall time of the job is measured between ``start`` and ``stop``. Jobs that are killed for
+    exceeding their timeout should be marked by setting ``timed_out`` to ``True``.
+
+    If ``fresh`` is false (i.e. the container has run other jobs before this one), the CPU time and
+    OOM kills are counted relative to the start of the job and the peak memory is taken from the
+    samples rather than from the container's lifetime peak.
+
+    Args:
+        container (``python_on_whales.Container``): the container
+        fresh (``bool``, optional): whether the container was started for this job
+        interval (``float``, optional): the number of seconds between samples
+
+    Attributes:
+        timed_out (``bool``): whether the job was killed for exceeding its timeout
+    """
+
+    def __init__(self, container, fresh=True, interval=0.5):
+        self.container = container
+        self.fresh = fresh
+        self.interval = interval
+        self.timed_out = False
+
+        self._cgroup = _CgroupReader(container.id)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = self._end_time = self._last_sample = None
+        self._start_cpu = self._cpu = None
+        self._start_oom_kills = self._oom_kills = None
+        self._peak_memory = None
+
+    def _sample(self):
+        if self._cgroup.available:
+            cpu = self._cgroup.cpu_time()
+            if cpu is not None:
+                self._cpu = cpu
+
+            oom_kills = self._cgroup.oom_kills()
+            if oom_kills is not None:
+                self._oom_kills = oom_kills
+
+            memories = [self._cgroup.memory()]
+            if self.fresh:
+                memories.append(self._cgroup.peak_memory())
+
+        else:
+            try:
+                stats = docker.container.stats(self.container)[0]
+
+            except (DockerException, IndexError):
+                return
+
+            # docker stats only reports the CPU usage as a percentage, so integrate it over time
+            now = time.monotonic()
+            self._cpu = (self._cpu or 0) + stats.cpu_percentage / 100 * (now - self._last_sample)
+            self._last_sample = now
+            memories = [stats.memory_used]
+
+        memories = [m for m in memories if m is not None]
+        if memories:
+            self._peak_memory = max([self._peak_memory or 0] + memories)
+
+    def start(self):
+        """
+        Starts monitoring the container.
+        """
+        self._start_time = self._last_sample = time.monotonic()
+        if self._cgroup.available:
+            self._start_cpu = self._cgroup.cpu_time() if not self.fresh else 0
+            self._start_oom_kills = self._cgroup.oom_kills() if not self.fresh else 0
+
+        def monitor():
+            while True:
+                self._sample()
+                if self._stop.wait(self.interval):
+                    break
+
+        self._thread = threading.Thread(target=monitor, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops monitoring the container.
+        """
+        self._end_time = time.monotonic()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        # the container's cgroup may still be readable, but docker stats are meaningless once the job
+        # has finished
+        if self._cgroup.available:
+            self._sample()
+
+    def usage(self, file, exit_code):
+        """
+        Returns the resources used by the job.
+
+        Args:
+            file (``str``): the name of the submission(s) graded by the job
+            exit_code (``int``): the exit code of the job
+
+        Returns:
+            ``ResourceUsage``: the resource usage
+        """
+        cpu_time = None
+        if self._cpu is not None:
+            cpu_time = self._cpu - (self._start_cpu or 0)
+
+        oom_killed = False
+        if self._oom_kills is not None and self._start_oom_kills is not None:
+            oom_killed = self._oom_kills > self._start_oom_kills
+
+        if self.fresh and not oom_killed:
+            try:
+                oom_killed = bool(docker.container.inspect(self.container).state.oom_killed)
+
+            except DockerException:
+                pass
+
+        return ResourceUsage(
+            file=file,
+            wall_time=self._end_time - self._start_time,
+            cpu_time=cpu_time,
+            peak_memory=self._peak_memory,
+            oom_killed=oom_killed,
+            timed_out=self.timed_out,
+            exit_code=exit_code,
+        )
+
+
+class ResourceUsageLog:
+    """
+    Writes the resource usage of grading jobs to a CSV file as the jobs finish. Unless ``append`` is
+    true, the file is overwritten when the first row is written; otherwise, rows are appended to it
+    and the header is only written if the file is empty. It is safe to record usage from multiple
+    threads.
+
+    Args:
+        path (``str``): the path to the CSV file
+        append (``bool``, optional): whether to append to the rows already in the file
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._started = append and os.path.isfile(path) and os.path.getsize(path) > 0
+
+    def record(self, usage):
+        """
+        Writes a row to the CSV file.
+
+        Args:
+            usage (``ResourceUsage``): the resource usage of the job
+        """
+        with self._lock:
+            with open(self.path, "a" if self._started else "w", newline="") as f:
+                writer = csv.writer(f)
+                if not self._started:
+                    writer.writerow(ResourceUsage._fields)
+                writer.writerow(usage)
+
+            self._started = True
@@ -0,0 +1,187 @@
+"""Resource-aware scheduling of grading containers for Otter Grade"""
+
+import os
+import re
+import threading
+
+from python_on_whales import docker
+from python_on_whales.exceptions import DockerException
+
+
+MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def parse_memory(memory):
+    """
+    Converts a Docker memory limit (e.g. ``"512m"`` or ``"2g"``) into a number of bytes.
+
+    Args:
+        memory (``int`` or ``str``): the memory limit
+
+    Returns:
+        ``int``: the number of bytes
+
+    Raises:
+        ``ValueError``: if ``memory`` is not a valid memory limit
+    """
+    if isinstance(memory, int):
+        return memory
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([bkmg]?)b?\s*", str(memory), flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid memory limit: {memory}")
+
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()])
+
+
+def read_meminfo():
+    """
+    Reads the total and available memory of the host from ``/proc/meminfo``.
+
+    Returns:
+        ``tuple[int, int]`` or ``None``: the total and available memory in bytes, or ``None`` if
+            they could not be determined
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            info = dict(line.split(":", 1) for line in f if ":" in line)
+        return (
+            parse_memory(info["MemTotal"].strip().split()[0] + "k"),
+            parse_memory(info["MemAvailable"].strip().split()[0] + "k"),
+        )
+
+    except (OSError, KeyError, IndexError, ValueError):
+        return None
+
+
+def read_loadavg():
+    """
+    Returns the 1-minute load average of the host.
+
+    Returns:
+        ``float`` or ``None``: the load average, or ``None`` if it could not be determined
+    """
+    try:
+        return os.getloadavg()[0]
+
+    except (AttributeError, OSError):
+        return None
+
+
+class AdaptiveScheduler:
+    """
+    Limits the number of grading containers that run at once based on the resources of the host.
+
+    Before a container is started, ``acquire`` blocks until the scheduler decides that another
+    container can run. A container may start if fewer than ``max_containers`` are running, the host
+    isn't overloaded (i.e. its load average doesn't exceed its number of CPUs), and there is enough
+    available memory (less a headroom of ``memory_headroom`` of the host's total memory) for a
+    container using as much memory as the largest peak observed so far or the per-container memory
+    limit, whichever is larger. At least one container is always allowed to run.
+
+    While started, the scheduler polls ``docker stats`` for the running containers created from
+    ``image`` to track their peak memory usage.
+
+    Args:
+        max_containers (``int``, optional): the maximum number of containers to run at once;
+            defaults to the number of CPUs divided by ``cpus``
+        cpus (``float``, optional): the number of CPUs each container is limited to
+        memory (``int`` or ``str``, optional): the memory limit of each container
+        interval (``float``, optional): the number of seconds between resource checks
+        memory_headroom (``float``, optional): the fraction of the host's memory to keep free
+    """
+
+    def __init__(self, max_containers=None, cpus=None, memory=None, interval=5, memory_headroom=0.1):
+        self.cpu_count = os.cpu_count() or 1
+        if not max_containers:
+            max_containers = max(1, int(self.cpu_count // (cpus or 1)))
+
+        self.max_containers = max_containers
+        self.memory = parse_memory(memory) if memory is not None else None
+        self.interval = interval
+        self.memory_headroom = memory_headroom
+        self.peak_memory = 0
+        self.running = 0
+
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def limit(self):
+        """
+        Returns the number of containers that may currently run at once.
+
+        Returns:
+            ``int``: the number of containers
+        """
+        limit = self.max_containers
+
+        load = read_loadavg()
+        if load is not None and load > self.cpu_count:
+            limit = min(limit, self.running)
+
+        meminfo = read_meminfo()
+        container_memory = max(self.peak_memory, self.memory or 0)
+        if meminfo is not None and container_memory:
+            total, available = meminfo
+            free = available - total * self.memory_headroom
+            limit = min(limit, self.running + int(free // container_memory))
+
+        return max(1, limit)
+
+    def acquire(self):
+        """
+        Blocks until another container may be started.
+        """
+        with self._condition:
+            while self.running >= self.limit():
+                self._condition.wait(self.interval)
+            self.running += 1
+
+    def release(self):
+        """
+        Records that a container has finished.
+        """
+        with self._condition:
+            self.running -= 1
+            self._condition.notify_all()
+
+    def record_memory(self, memory):
+        """
+        Records the memory usage of a container, in bytes.
+
+        Args:
+            memory (``int``): the memory usage
+        """
+        with self._condition:
+            self.peak_memory = max(self.peak_memory, memory)
+
+    def start(self, image):
+        """
+        Starts polling the memory usage of the running containers created from ``image``.
+
+        Args:
+            image (``str``): the tag of the grading image
+        """
+        def monitor():
+            while not self._stop.wait(self.interval):
+                try:
+                    containers = docker.container.list(filters={"ancestor": image})
+                    if containers:
+                        for stats in docker.container.stats(containers):
+                            if stats.memory_used:
+                                self.record_memory(stats.memory_used)
+
+                except DockerException:
+                    pass
+
+        self._monitor = threading.Thread(target=monitor, daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        """
+        Stops polling the memory usage of the containers.
+        """
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
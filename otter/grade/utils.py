@@ -1,15 +1,23 @@
 """Utilities for Otter Grade"""
 
 from python_on_whales import docker
+import fnmatch
+import json
 import os
 import pandas as pd
 import re
+import zipfile
 
 from hashlib import md5
 
 
 OTTER_DOCKER_IMAGE_TAG = "otter-grade"
 
+ENVIRONMENT_FILE_PATTERNS = ["setup.sh", "environment.yml", "requirements.*"]
+
+# the number of bytes of a submission treated as equivalent to a code cell when estimating its cost
+BYTES_PER_CELL = 64 * 1024
+
 
 def list_files(path):
     """
@@ -38,6 +46,23 @@ def merge_csv(dataframes):
     final_dataframe = pd.concat(dataframes, axis=0, join='inner').sort_index()
     return final_dataframe
 
+def results_to_dataframe(results, submission_path):
+    """
+    Converts a ``GradingResults`` object unpickled from a grading container into a single-row
+    dataframe of scores, including a ``file`` column with the basename of the submission.
+
+    Args:
+        results (``otter.test_files.GradingResults``): the grading results
+        submission_path (``str``): path to the submission that was graded
+
+    Returns:
+        ``pandas.core.frame.DataFrame``: the scores dataframe
+    """
+    scores = results.to_dict()
+    scores = {t: [scores[t]["score"]] if type(scores[t]) == dict else scores[t] for t in scores}
+    scores["file"] = os.path.split(submission_path)[1]
+    return pd.DataFrame(scores)
+
 def prune_images(force=False):
     """
     Prunes all Docker images named ``otter-grade``
@@ -72,3 +97,101 @@ def generate_hash(path):
         m.update(data)
         zip_hash = m.hexdigest()
     return zip_hash
+
+def generate_environment_hash(zip_path, base_image):
+    """
+    Returns an MD5 hash of the files in an autograder zip file that determine the grading
+    environment (``setup.sh``, ``environment.yml``, and ``requirements.*``) and of the base image
+    the environment is built on.
+
+    Args:
+        zip_path (``str``): path to the autograder zip file
+        base_image (``str``): the base Docker image
+
+    Returns:
+        ``str``: the hash value of the environment
+    """
+    m = md5()
+    m.update(base_image.encode())
+    with zipfile.ZipFile(zip_path) as zf:
+        for name in sorted(zf.namelist()):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in ENVIRONMENT_FILE_PATTERNS):
+                m.update(name.encode())
+                m.update(zf.read(name))
+    return m.hexdigest()
+
+def count_code_cells(path):
+    """
+    Returns the number of code cells in a notebook submission, or in the first notebook in a zip file
+    submission. Submissions that aren't notebooks, or that can't be parsed, have no code cells.
+
+    Args:
+        path (``str``): path to the submission
+
+    Returns:
+        ``int``: the number of code cells
+    """
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                nb_names = [n for n in zf.namelist() if n.endswith(".ipynb")]
+                if not nb_names:
+                    return 0
+                nb = json.loads(zf.read(nb_names[0]))
+
+        elif path.endswith(".ipynb"):
+            with open(path, encoding="utf-8") as f:
+                nb = json.load(f)
+
+        else:
+            return 0
+
+        return sum(cell.get("cell_type") == "code" for cell in nb.get("cells", []))
+
+    except (OSError, ValueError, AttributeError, zipfile.BadZipFile):
+        return 0
+
+def estimate_submission_cost(path):
+    """
+    Estimates the relative cost of grading a submission from the number of code cells it contains 
+    and its size, measured in code cells (with every ``BYTES_PER_CELL`` bytes counting as a cell).
+
+    Args:
+        path (``str``): path to the submission
+
+    Returns:
+        ``float``: the estimated cost
+    """
+    return 1 + count_code_cells(path) + os.path.getsize(path) / BYTES_PER_CELL
+
+def order_by_expected_runtime(submission_paths, durations):
+    """
+    Sorts submissions by their predicted grading time, longest first, so that slow submissions
+    don't stretch the end of a grading run.
+
+    The predicted time of a submission that was graded before is its previous grading time. The
+    time of any other submission is predicted from its estimated cost (see
+    ``estimate_submission_cost``) using the average time per unit of cost of the submissions that
+    have been graded before; if none have, submissions are sorted by their estimated cost.
+
+    Args:
+        submission_paths (``list`` of ``str``): paths to the submissions
+        durations (``dict``): a mapping of submission paths to the number of seconds it took to
+            grade them previously, or ``None`` if they haven't been graded
+
+    Returns:
+        ``list`` of ``str``: the sorted submission paths
+    """
+    costs = {p: estimate_submission_cost(p) for p in submission_paths}
+    known = [p for p in submission_paths if durations.get(p) is not None]
+
+    seconds_per_cost = 1
+    if known:
+        seconds_per_cost = sum(durations[p] for p in known) / sum(costs[p] for p in known)
+
+    def predicted_time(path):
+        if durations.get(path) is not None:
+            return durations[path]
+        return costs[path] * seconds_per_cost
+
+    return sorted(submission_paths, key=predicted_time, reverse=True)
@@ -8,9 +8,11 @@ import tempfile
 import zipfile
 
 from .run_autograder import main as run_autograder
+from .zygote import get_zygote
 
 
-def main(submission, *, autograder="./autograder.zip", output_dir="./", no_logo=False, debug=False):
+def main(submission, *, autograder="./autograder.zip", output_dir="./", no_logo=False, debug=False,
+         zygote=False):
     """
     Grades a single submission using the autograder configuration ``autograder`` without containrization
 
@@ -24,6 +26,9 @@ def main(submission, *, autograder="./autograder.zip", output_dir="./", no_logo=
         output_dir (``str``): directory at which to copy the results JSON file
         no_logo (``bool``): whether to suppress the Otter logo from being printed to stdout
         debug (``bool``); whether to run in debug mode (without ignoring errors)
+        zygote (``bool``, optional): whether to grade the submission in a process forked from this
+            process's zygote (see ``otter.run.zygote.get_zygote``), which imports Otter and the
+            modules in the autograder's ``preload_modules`` configuration only once
         **kwargs: ignored kwargs (a remnant of how the argument parser is built)
 
     Returns:
@@ -54,7 +59,17 @@ def main(submission, *, autograder="./autograder.zip", output_dir="./", no_logo=
             shutil.copy(submission, os.path.join(ag_dir, "submission"))
 
         logo = not no_logo
-        run_autograder(ag_dir, logo=logo, debug=debug)
+        if zygote:
+            config_path = os.path.join(ag_dir, "source", "otter_config.json")
+            preload_modules = []
+            if os.path.isfile(config_path):
+                with open(config_path, encoding="utf-8") as f:
+                    preload_modules = json.load(f).get("preload_modules", [])
+
+            get_zygote(preload_modules).run(run_autograder, ag_dir, logo=logo, debug=debug)
+
+        else:
+            run_autograder(ag_dir, logo=logo, debug=debug)
 
         results_path = os.path.join(ag_dir, "results", "results.json")
         shutil.copy(results_path, output_dir)
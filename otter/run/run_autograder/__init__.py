@@ -1,17 +1,24 @@
 """Autograding process internals for Otter-Grader"""
 
 import os
+import functools
+import io
 import json
 import pandas as pd
 import pickle
+import shutil
+import traceback
 import zipfile
 
+from contextlib import redirect_stdout
 from glob import glob
 
+from .constants import TEMPLATE_FILENAME
 from .runners import create_runner
 from .utils import OtterRuntimeError
+from ..zygote import get_zygote
 from ...version import LOGO_WITH_VERSION
-from ...utils import chdir
+from ...utils import chdir, print_full_width
 
 
 def main(autograder_dir, **kwargs):
@@ -25,6 +32,217 @@ def main(autograder_dir, **kwargs):
             ``otter.run.run_autograder.constants.DEFAULT_OPTIONS``; these values override anything
             present in ``otter_config.json``
     """
+    runner = load_runner(autograder_dir, **kwargs)
+
+    if runner.get_option("logo"):
+        # ASCII 8207 is an invisible non-whitespace character; this should prevent gradescope from
+        # incorrectly left-stripping the whitespace at the beginning of the logo
+        print(f"{chr(8207)}\n", LOGO_WITH_VERSION, "\n", sep="")
+
+    run_submission(runner)
+
+
+def run_batch(autograder_dir, batch_dir, **kwargs):
+    """
+    Run the autograding process on every submission in ``batch_dir`` in a single interpreter.
+
+    The configurations are loaded and the runner is created once for the whole batch. Each file in
+    ``batch_dir`` is then copied in turn into an emptied ``submission`` directory in 
+    ``autograder_dir`` and graded as in ``main``. The pickled ``GradingResults`` for each submission 
+    are written to ``{batch_dir}/results/{submission basename}.pkl``, along with the PDF of the 
+    submission if one was generated. If grading a submission fails, the traceback is written to 
+    ``{batch_dir}/results/{submission basename}.error`` instead and grading continues with the next
+    submission.
+
+    If the ``zygote`` configuration is true, each submission is graded in a fresh process forked
+    from a zygote process (see ``otter.run.zygote.Zygote``) that has imported the modules in the
+    ``preload_modules`` configuration, so that no state is shared between submissions. If the
+    ``prefix_snapshot`` configuration is also true, the leading cells that all of the notebooks in
+    the batch have in common (e.g. imports and data loading) are executed once in the zygote, and
+    the execution of each submission is resumed from the resulting environment.
+
+    If the ``prescreen`` configuration is true, submissions that are unchanged from the notebook
+    distributed to students or that have no code that can be executed are given the results of the
+    first such submission in the batch instead of being executed. When a zygote is used, the
+    distributed notebook is graded before the batch, if it is included in the autograder zip file,
+    and its results are recorded in the zygote so that they are inherited by every process forked 
+    from it.
+
+    Args:
+        autograder_dir (``str``): the absolute path of the directory in which autograding is occurring
+        batch_dir (``str``): the path to a directory of submissions to grade
+        **kwargs: keyword arguments for updating configurations in the default configurations 
+            ``otter.run.run_autograder.constants.DEFAULT_OPTIONS``; these values override anything
+            present in ``otter_config.json``
+    """
+    runner = load_runner(autograder_dir, **kwargs)
+
+    if runner.get_option("logo"):
+        print(f"{chr(8207)}\n", LOGO_WITH_VERSION, "\n", sep="")
+
+    batch_dir = os.path.abspath(batch_dir)
+    results_dir = os.path.join(batch_dir, "results")
+    os.makedirs(results_dir, exist_ok=True)
+
+    abs_ag_path = os.path.abspath(runner.get_option("autograder_dir"))
+    submissions = sorted(f for f in os.listdir(batch_dir) if os.path.isfile(os.path.join(batch_dir, f)))
+
+    grade = run_submission
+    if runner.get_option("zygote"):
+        zygote = get_zygote(runner.get_option("preload_modules"))
+        grade = functools.partial(zygote.run, run_submission)
+
+        if runner.get_option("prefix_snapshot"):
+            take_prefix_snapshot(runner, zygote, [os.path.join(batch_dir, f) for f in submissions])
+
+        if runner.get_option("prescreen"):
+            grade_template(runner, zygote)
+
+    for subm in submissions:
+        _reset_submission(abs_ag_path, os.path.join(batch_dir, subm))
+
+        print_full_width("=", mid_text=subm)
+
+        try:
+            grade(runner)
+
+        except:
+            with open(os.path.join(results_dir, f"{subm}.error"), "w+") as f:
+                f.write(traceback.format_exc())
+
+            continue
+
+        with chdir(abs_ag_path):
+            shutil.copy("results/results.pkl", os.path.join(results_dir, f"{subm}.pkl"))
+
+            pdf_path = os.path.join("submission", os.path.splitext(subm)[0] + ".pdf")
+            if os.path.isfile(pdf_path):
+                shutil.copy(pdf_path, results_dir)
+
+
+def _reset_submission(autograder_dir, submission_path):
+    """
+    Empty the ``submission`` and ``results`` directories in ``autograder_dir`` and copy the file at 
+    ``submission_path`` into the ``submission`` directory.
+    """
+    with chdir(autograder_dir):
+        for subdir in ["submission", "results"]:
+            if os.path.exists(subdir):
+                shutil.rmtree(subdir)
+            os.makedirs(subdir)
+
+        shutil.copy(submission_path, "submission")
+
+
+def _take_snapshot(runner, num_cells):
+    with chdir(os.path.abspath(runner.get_option("autograder_dir"))):
+        runner.prepare_files()
+        runner.take_snapshot(num_cells)
+
+
+def take_prefix_snapshot(runner, zygote, submission_paths):
+    """
+    Execute the leading cells that all of the notebooks in ``submission_paths`` have in common in 
+    ``zygote``, so that the execution of the submissions graded in processes forked from it can be
+    resumed from the resulting environment. Nothing is executed if there are fewer than two 
+    notebooks or they have no cells in common. Errors raised while executing the cells are printed
+    and grading continues without the snapshot.
+
+    Args:
+        runner (``otter.run.run_autograder.runners.abstract_runner.AbstractLanguageRunner``): the
+            runner for the assignment
+        zygote (``otter.run.zygote.Zygote``): the zygote from which submissions will be graded
+        submission_paths (``list`` of ``str``): the paths to the submissions
+    """
+    import nbformat
+    from ...execute import NBFORMAT_VERSION
+    from ...execute.snapshot import common_prefix_length
+    from ...execute.transforms import filter_ignored_cells
+
+    notebooks, nb_paths = [], []
+    for path in submission_paths:
+        if os.path.splitext(path)[1] != ".ipynb":
+            continue
+
+        try:
+            notebooks.append(filter_ignored_cells(nbformat.read(path, as_version=NBFORMAT_VERSION)))
+            nb_paths.append(path)
+
+        except Exception:
+            continue
+
+    num_cells = common_prefix_length(notebooks) if len(notebooks) > 1 else 0
+    if not num_cells:
+        return
+
+    _reset_submission(os.path.abspath(runner.get_option("autograder_dir")), nb_paths[0])
+
+    try:
+        zygote.call(_take_snapshot, runner, num_cells)
+
+    except Exception:
+        print(f"Could not execute the cells shared by the submissions:\n{traceback.format_exc()}")
+
+
+def _grade_template(runner):
+    from ...execute.screen import get_all_screened_results
+
+    with chdir(os.path.abspath(runner.get_option("autograder_dir"))):
+        runner.prepare_files()
+        runner.grade_template()
+
+    return get_all_screened_results()
+
+
+def _record_screened_results(screened_results):
+    from ...execute.screen import record_screened_results
+
+    for key, results in screened_results.items():
+        record_screened_results(key, results)
+
+
+def grade_template(runner, zygote):
+    """
+    Grade the notebook distributed to students in a process forked from ``zygote``, if it is 
+    included in the autograder zip file, and record its results in ``zygote``, so that submissions
+    graded in processes forked from it that are unchanged from it can be given its results without
+    being executed. The notebook isn't executed in ``zygote`` itself so that it can't change the
+    state (e.g. a prefix snapshot) inherited by the submissions. Errors raised while grading it are
+    printed and grading continues without its results.
+
+    Args:
+        runner (``otter.run.run_autograder.runners.abstract_runner.AbstractLanguageRunner``): the
+            runner for the assignment
+        zygote (``otter.run.zygote.Zygote``): the zygote from which submissions will be graded
+    """
+    abs_ag_path = os.path.abspath(runner.get_option("autograder_dir"))
+    template_path = os.path.join(abs_ag_path, "source", TEMPLATE_FILENAME)
+    if not os.path.isfile(template_path):
+        return
+
+    _reset_submission(abs_ag_path, template_path)
+
+    try:
+        with redirect_stdout(io.StringIO()):
+            screened_results = zygote.run(_grade_template, runner)
+
+        zygote.call(_record_screened_results, screened_results)
+
+    except Exception:
+        print(f"Could not grade the distributed notebook:\n{traceback.format_exc()}")
+
+
+def load_runner(autograder_dir, **kwargs):
+    """
+    Load the configurations in ``autograder_dir`` and create a runner for the assignment.
+
+    Args:
+        autograder_dir (``str``): the absolute path of the directory in which autograding is occurring
+        **kwargs: keyword arguments for updating configurations in the default configurations 
+
+    Returns:
+        ``otter.run.run_autograder.runners.abstract_runner.AbstractLanguageRunner``: the runner
+    """
     config_fp = os.path.join(autograder_dir, "source", "otter_config.json")
     if os.path.isfile(config_fp):
         with open(config_fp, encoding="utf-8") as f:
@@ -34,13 +252,18 @@ def main(autograder_dir, **kwargs):
 
     config["autograder_dir"] = autograder_dir
 
-    runner = create_runner(config, **kwargs)
+    return create_runner(config, **kwargs)
 
-    if runner.get_option("logo"):
-        # ASCII 8207 is an invisible non-whitespace character; this should prevent gradescope from
-        # incorrectly left-stripping the whitespace at the beginning of the logo
-        print(f"{chr(8207)}\n", LOGO_WITH_VERSION, "\n", sep="")
 
+def run_submission(runner):
+    """
+    Grade the submission in the ``submission`` directory of the runner's autograder directory, write
+    the results files, and print the grading summary.
+
+    Args:
+        runner (``otter.run.run_autograder.runners.abstract_runner.AbstractLanguageRunner``): the
+            runner for the assignment
+    """
     abs_ag_path = os.path.abspath(runner.get_option("autograder_dir"))
     with chdir(abs_ag_path):
         try:
@@ -45,6 +45,51 @@ DEFAULT_OPTIONS_WITH_DESCRIPTIONS = [
         "description": "whether to re-assemble the student's environment from the log rather than by re-executing their submission",
         "default": False,
     },
+    {
+        "key": "single_pass",
+        "description": "whether to execute each cell of the submission once, collecting check results as cells run, instead of re-executing the submission to collect them",
+        "default": False,
+    },
+    {
+        "key": "cell_cache_dir",
+        "description": "a directory in which to cache the compiled cells of submissions so that they can be reused across grading processes",
+        "default": None,
+    },
+    {
+        "key": "test_workers",
+        "description": "the number of forked processes in which to run tests that aren't checked in the submission; if unspecified, they are run one after another",
+        "default": None,
+    },
+    {
+        "key": "cell_timeout",
+        "description": "the number of seconds each cell of the submission may run for before it is interrupted and skipped",
+        "default": None,
+    },
+    {
+        "key": "test_timeout",
+        "description": "the number of seconds each test case may run for before it is interrupted and marked as failed",
+        "default": None,
+    },
+    {
+        "key": "zygote",
+        "description": "whether to grade each submission of a batch in a process forked from a zygote process that has already imported Otter and the modules in preload_modules",
+        "default": False,
+    },
+    {
+        "key": "preload_modules",
+        "description": "a list of modules (e.g. the assignment's libraries) to import in the zygote process before it forks a process for each submission",
+        "default": [],
+    },
+    {
+        "key": "prefix_snapshot",
+        "description": "whether to execute the leading cells that all notebooks in a batch have in common once in the zygote process and resume each submission's execution from there",
+        "default": False,
+    },
+    {
+        "key": "prescreen",
+        "description": "whether to give submissions that are unchanged from the distributed notebook (included with otter generate --template) or that have no code that can be executed the results of an identical submission that was already graded instead of executing them",
+        "default": False,
+    },
     {
         "key": "serialized_variables",
         "description": "a mapping of variable names to type strings for validating a deserialized student environment",
@@ -133,3 +178,6 @@ DEFAULT_OPTIONS_WITH_DESCRIPTIONS = [
 ]
 
 DEFAULT_OPTIONS = convert_config_description_dict(DEFAULT_OPTIONS_WITH_DESCRIPTIONS)
+
+# the name of the notebook distributed to students in the autograder zip file
+TEMPLATE_FILENAME = "template.ipynb"
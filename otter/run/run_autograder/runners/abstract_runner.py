@@ -67,6 +67,33 @@ class AbstractLanguageRunner(ABC):
             shutil.rmtree("./submission/tests")
         shutil.copytree("./source/tests", "./submission/tests")
 
+    def take_snapshot(self, num_cells):
+        """
+        Execute the first ``num_cells`` cells of the submission and keep the resulting environment
+        in this process, so that the execution of submissions graded in processes forked from it
+        can resume from there if they start with the same cells. Does nothing unless the runner 
+        supports snapshots.
+
+        When this method is invoked, the working directory is assumed to already be 
+        ``self.options["autograder_dir"]``.
+
+        Args:
+            num_cells (``int``): the number of cells to execute
+        """
+        pass
+
+    def grade_template(self):
+        """
+        Grade the notebook distributed to students, if it is included in the autograder zip file,
+        and keep its results in this process, so that submissions graded in processes forked from it
+        that are unchanged from it can be given its results without being executed. Does nothing 
+        unless the runner supports pre-screening submissions.
+
+        When this method is invoked, the working directory is assumed to already be 
+        ``self.options["autograder_dir"]``.
+        """
+        pass
+
     @abstractmethod
     def resolve_submission_path(self):
         """
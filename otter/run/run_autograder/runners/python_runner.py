@@ -10,10 +10,12 @@ import zipfile
 from glob import glob
 
 from .abstract_runner import AbstractLanguageRunner
+from ..constants import TEMPLATE_FILENAME
 from ..utils import OtterRuntimeError
 from ....check.logs import Log
 from ....check.notebook import _OTTER_LOG_FILENAME
-from ....execute import grade_notebook
+from ....execute import grade_notebook, snapshot_notebook
+from ....execute.snapshot import get_snapshot, set_snapshot
 from ....export import export_notebook
 from ....generate.token import APIClient
 from ....plugins import PluginCollection
@@ -99,6 +101,67 @@ class PythonRunner(AbstractLanguageRunner):
         except Exception as e:
             print(f"\n\nError encountered while generating and submitting PDF:\n{e}")
 
+    def get_execution_options(self):
+        """
+        Return the arguments with which submissions are executed by ``grade_notebook``.
+
+        When this method is invoked, the working directory is assumed to already be 
+        ``{self.options["autograder_dir"]}/submission``.
+
+        Returns:
+            ``dict``: the arguments
+        """
+        return {
+            "name": "submission",
+            "cwd": os.getcwd(),
+            "test_dir": "./tests",
+            "ignore_errors": not self.options["debug"],
+            "seed": self.options["seed"],
+            "seed_variable": self.options["seed_variable"],
+            "single_pass": self.options["single_pass"],
+            "cell_cache_dir": self.options["cell_cache_dir"],
+            "cell_timeout": self.options["cell_timeout"],
+        }
+
+    def take_snapshot(self, num_cells):
+        with chdir("./submission"):
+            subm_path = self.resolve_submission_path()
+            if os.path.splitext(subm_path)[1] != ".ipynb":
+                return
+
+            set_snapshot(snapshot_notebook(subm_path, num_cells, **self.get_execution_options()))
+
+    def get_template_path(self):
+        """
+        Return the path to the notebook distributed to students, if it is included in the autograder
+        zip file.
+
+        When this method is invoked, the working directory is assumed to already be 
+        ``{self.options["autograder_dir"]}/submission``.
+
+        Returns:
+            ``str`` or ``None``: the path to the notebook
+        """
+        template_path = os.path.join("..", "source", TEMPLATE_FILENAME)
+        return template_path if os.path.isfile(template_path) else None
+
+    def grade_template(self):
+        with chdir("./submission"):
+            template_path = self.get_template_path()
+            if template_path is None or self.options["plugins"]:
+                return
+
+            grade_notebook(
+                template_path,
+                tests_glob = glob("./tests/*.py"),
+                test_workers = self.options["test_workers"],
+                test_timeout = self.options["test_timeout"],
+                snapshot = get_snapshot(),
+                prescreen = True,
+                template = template_path,
+                **self.get_execution_options(),
+            )
+
     def run(self):
         os.environ["PATH"] = f"{self.options['miniconda_path']}/bin:" + os.environ.get("PATH")
 
@@ -153,16 +216,16 @@ class PythonRunner(AbstractLanguageRunner):
             scores = grade_notebook(
                 subm_path, 
                 tests_glob = glob("./tests/*.py"), 
-                name = "submission", 
-                cwd = os.getcwd(), 
-                test_dir = "./tests",
-                ignore_errors = not self.options["debug"], 
-                seed = self.options["seed"],
-                seed_variable = self.options["seed_variable"],
                 log = log if self.options["grade_from_log"] else None,
                 variables = self.options["serialized_variables"],
                 plugin_collection = plugin_collection,
                 script = os.path.splitext(subm_path)[1] == ".py",
+                test_workers = self.options["test_workers"],
+                test_timeout = self.options["test_timeout"],
+                snapshot = get_snapshot(),
+                prescreen = self.options["prescreen"],
+                template = self.get_template_path(),
+                **self.get_execution_options(),
             )
 
             if self.options["print_summary"]:
@@ -0,0 +1,407 @@
+"""A fork server for grading submissions in fresh processes without re-importing modules"""
+
+import importlib
+import io
+import multiprocessing
+import os
+import pickle
+import select
+import signal
+import sys
+import threading
+import time
+import traceback
+import warnings
+
+from contextlib import redirect_stderr, redirect_stdout
+
+
+# modules imported by every zygote before it starts forking
+DEFAULT_PRELOAD_MODULES = [
+    "IPython",
+    "nbformat",
+    "numpy",
+    "pandas",
+    "otter.execute",
+    "otter.run.run_autograder",
+]
+
+
+class ZygoteError(Exception):
+    """
+    Raised when a zygote or one of its forked children dies without returning a result.
+
+    Args:
+        message (``str``): the error message
+        exitcode (``int``, optional): the exit code of the child that died (negative if it was
+            killed by a signal), if known
+        rusage (``resource.struct_rusage``, optional): the resources used by the child that died,
+            if known
+        timed_out (``bool``, optional): whether the child was killed for running for too long
+    """
+
+    def __init__(self, message, exitcode=None, rusage=None, timed_out=False):
+        super().__init__(message)
+        self.exitcode = exitcode
+        self.rusage = rusage
+        self.timed_out = timed_out
+
+
+class _RemoteTraceback(Exception):
+    """
+    Holds the formatted traceback of an exception raised in a forked child, so that it can be
+    attached as the cause of the exception re-raised in the parent.
+    """
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class Zygote:
+    """
+    A long-lived process that imports a list of modules once and then forks a fresh child process
+    for every function it is asked to run.
+
+    Each child inherits the zygote's imported modules copy-on-write, so starting it takes
+    milliseconds instead of the seconds needed to import Otter, IPython, and the assignment's
+    libraries in a new interpreter, and nothing the function does (e.g. to global state or imported
+    modules) leaks into the next child. Calls to ``Zygote.run`` are serialized.
+
+    The zygote is forked from the current process when it is started, so it should be started
+    before any threads are. The function and its arguments are pickled to send them to the child
+    and the child's return value is pickled to send it back, so they must all be picklable. The
+    child runs in the caller's working directory and its ``sys.stdout`` and ``sys.stderr`` are
+    captured and written to the caller's when it finishes.
+
+    Args:
+        preload_modules (``list`` of ``str``, optional): the names of modules to import in the zygote
+            in addition to ``DEFAULT_PRELOAD_MODULES``
+    """
+
+    def __init__(self, preload_modules=None):
+        self.preload_modules = DEFAULT_PRELOAD_MODULES + list(preload_modules or [])
+        self._conn = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        """
+        Starts the zygote process, if it isn't already running.
+        """
+        if self.alive:
+            return
+
+        ctx = multiprocessing.get_context("fork")
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_serve, args=(child_conn, self._conn, self.preload_modules), daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def _request(self, request):
+        """
+        Sends a request to the zygote and returns its response, restarting the zygote if it died.
+        """
+        with self._lock:
+            self.start()
+            try:
+                self._conn.send(request)
+                return self._conn.recv()
+
+            except (EOFError, OSError):
+                self.close()
+                raise ZygoteError("The zygote process died")
+
+    def preload(self, modules):
+        """
+        Imports more modules in the zygote, so that they're available to the children it forks from
+        now on. Modules that can't be imported raise a warning.
+
+        Args:
+            modules (``list`` of ``str``): the names of the modules to import
+        """
+        modules = [m for m in modules if m not in self.preload_modules]
+        if not modules:
+            return
+
+        self.preload_modules += modules
+        if self.alive:
+            for message in self._request(("import", modules)):
+                warnings.warn(message)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls ``fn(*args, **kwargs)`` in the zygote itself and returns its result, so that any state
+        it sets up (e.g. a snapshot of an environment) is inherited by the children forked after it.
+
+        Args:
+            fn (``callable``): the function to call; must be picklable
+            *args: positional arguments for ``fn``
+            **kwargs: keyword arguments for ``fn``
+
+        Returns:
+            ``object``: the return value of ``fn``
+        """
+        return self._handle_response(self._request(("call", self._payload(fn, args, kwargs))))
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Calls ``fn(*args, **kwargs)`` in a child forked from the zygote and returns its result.
+
+        Exceptions raised by ``fn`` are re-raised in the caller, with the child's traceback attached
+        as their cause.
+
+        Args:
+            fn (``callable``): the function to call; must be picklable
+            *args: positional arguments for ``fn``
+            **kwargs: keyword arguments for ``fn``
+
+        Returns:
+            ``object``: the return value of ``fn``
+
+        Raises:
+            ``ZygoteError``: if the child or the zygote dies without returning a result
+        """
+        exitcode, data = self._request(("run", self._payload(fn, args, kwargs)))
+
+        if not data:
+            raise ZygoteError(f"The forked process exited with code {exitcode}", exitcode=exitcode)
+
+        return self._handle_response(data)
+
+    @staticmethod
+    def _payload(fn, args, kwargs):
+        return pickle.dumps((os.getcwd(), fn, args, kwargs))
+
+    @staticmethod
+    def _handle_response(data):
+        """
+        Writes the output captured in a response from the zygote and returns its value or raises its
+        exception.
+        """
+        status, value, tb, stdout, stderr = pickle.loads(data)
+        sys.stdout.write(stdout)
+        sys.stderr.write(stderr)
+
+        if status == "error":
+            if value is None:
+                value = ZygoteError("The forked process raised an exception")
+            raise value from _RemoteTraceback(tb)
+
+        return value
+
+    def close(self):
+        """
+        Stops the zygote process.
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+        if self._process is not None:
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            self._process = None
+
+
+_zygote = None
+
+
+def get_zygote(preload_modules=None):
+    """
+    Returns the zygote shared by this process, starting it if necessary and importing any modules
+    in ``preload_modules`` that it hasn't already imported.
+
+    Args:
+        preload_modules (``list`` of ``str``, optional): the names of modules to import in the zygote
+
+    Returns:
+        ``Zygote``: the zygote
+    """
+    global _zygote
+    if _zygote is None:
+        _zygote = Zygote(preload_modules)
+    else:
+        _zygote.preload(preload_modules or [])
+
+    _zygote.start()
+    return _zygote
+
+
+def _import_modules(modules):
+    """
+    Imports ``modules`` and returns a message for each one that couldn't be imported.
+    """
+    messages = []
+    for module in modules:
+        try:
+            importlib.import_module(module)
+
+        except Exception as e:
+            messages.append(f"Could not preload module '{module}': {e}")
+
+    return messages
+
+
+def _serve(conn, parent_conn, preload_modules):
+    """
+    The main loop of a zygote process, which handles requests from ``conn`` until it is closed.
+    """
+    # close the zygote's copy of the parent's end of the pipe so that it sees when the parent closes it
+    parent_conn.close()
+
+    for message in _import_modules(preload_modules):
+        print(message, file=sys.stderr)
+
+    while True:
+        try:
+            kind, payload = conn.recv()
+
+        except (EOFError, OSError):
+            break
+
+        if kind == "import":
+            conn.send(_import_modules(payload))
+
+        elif kind == "call":
+            conn.send(_run_request(payload))
+
+        elif kind == "run":
+            conn.send(_fork_and_run(payload, conn)[:2])
+
+
+def run_in_fork(fn, *args, kill_after=None, **kwargs):
+    """
+    Calls ``fn(*args, **kwargs)`` in a child forked from the current process, so that nothing it
+    does (e.g. to imported modules or global state) affects this process or the next child, and
+    returns its result and the resources used by the child.
+
+    As with ``Zygote.run``, the child's return value is pickled to send it back, its output is
+    written to the caller's ``sys.stdout`` and ``sys.stderr`` when it finishes, and exceptions raised
+    by ``fn`` are re-raised in the caller. If ``kill_after`` is set, the child is killed with 
+    ``SIGKILL`` if it hasn't returned a result after ``kill_after`` seconds, so that code that 
+    catches or blocks the exceptions used to interrupt it (e.g. a long call into C) can't run forever.
+
+    Args:
+        fn (``callable``): the function to call; its return value must be picklable
+        *args: positional arguments for ``fn``
+        kill_after (``float``, optional): the number of seconds after which to kill the child
+        **kwargs: keyword arguments for ``fn``
+
+    Returns:
+        ``tuple`` of (``object``, ``resource.struct_rusage``): the return value of ``fn`` and the
+            resources used by the child
+
+    Raises:
+        ``ZygoteError``: if the child dies without returning a result or is killed because it ran
+            for longer than ``kill_after`` seconds
+    """
+    exitcode, data, rusage = _fork_and_run(
+        Zygote._payload(fn, args, kwargs), kill_after=kill_after)
+
+    if data is None:
+        raise ZygoteError(
+            f"The forked process was killed after running for {kill_after} seconds", 
+            exitcode=exitcode, rusage=rusage, timed_out=True)
+
+    if not data:
+        raise ZygoteError(
+            f"The forked process exited with code {exitcode}", exitcode=exitcode, rusage=rusage)
+
+    return Zygote._handle_response(data), rusage
+
+
+def _fork_and_run(payload, conn=None, kill_after=None):
+    """
+    Runs the pickled request ``payload`` in a forked child and returns its exit code, its pickled
+    response, and the resources it used. ``conn`` is closed in the child, if given. If the child 
+    hasn't finished writing its response after ``kill_after`` seconds, it is killed and the
+    response is ``None``.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(r)
+        if conn is not None:
+            conn.close()
+        try:
+            with os.fdopen(w, "wb") as f:
+                f.write(_run_request(payload))
+
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0)
+
+    os.close(w)
+    try:
+        data = _read_response(r, kill_after)
+
+    finally:
+        os.close(r)
+
+    if data is None:
+        os.kill(pid, signal.SIGKILL)
+
+    _, status, rusage = os.wait4(pid, 0)
+    exitcode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return exitcode, data, rusage
+
+
+def _read_response(fd, timeout=None):
+    """
+    Reads from ``fd`` until the end of the file and returns the data read, or ``None`` if the end
+    isn't reached within ``timeout`` seconds.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    chunks = []
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+
+        chunk = os.read(fd, 64 * 1024)
+        if not chunk:
+            return b"".join(chunks)
+
+        chunks.append(chunk)
+
+
+def _run_request(payload):
+    """
+    Runs the pickled request ``payload`` and returns its pickled response.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            cwd, fn, args, kwargs = pickle.loads(payload)
+            os.chdir(cwd)
+            response = ("ok", fn(*args, **kwargs), None)
+
+    except BaseException as e:
+        response = ("error", e, traceback.format_exc())
+
+    try:
+        data = pickle.dumps(response + (stdout.getvalue(), stderr.getvalue()))
+
+        # some exceptions can be pickled but not unpickled (e.g. if they require arguments)
+        if response[0] == "error":
+            pickle.loads(data)
+
+        return data
+
+    # the return value or exception may not be picklable
+    except Exception:
+        tb = response[2] or traceback.format_exc()
+        return pickle.dumps(("error", None, tb, stdout.getvalue(), stderr.getvalue()))
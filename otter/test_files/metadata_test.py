@@ -13,7 +13,7 @@ from contextlib import redirect_stderr, redirect_stdout
 from textwrap import dedent
 
 from .abstract_test import TestCase
-from .ok_test import OKTestFile
+from .ok_test import OKTestFile, PARSED_TEST_FILES
 
 
 NOTEBOOK_METADATA_KEY = "otter"
@@ -64,19 +64,28 @@ class NotebookMetadataOKTestFile(OKTestFile):
         """
         Parse an ok test file & return an ``OKTest``
 
+        The tests in the notebook's metadata are cached until the notebook is modified, so the
+        notebook is only loaded once no matter how many of its tests are checked.
+
         Args:
             path (``str``): path to ok test file
+            test_name (``str``): the name of the test in the notebook's metadata
 
         Returns:
             ``otter.ok_parser.OKTest``: new ``OKTest`` object created from the given file
         """
-        with open(path, encoding="utf-8") as f:
-            nb = json.load(f)
-        
-        test_spec = nb["metadata"][NOTEBOOK_METADATA_KEY]["tests"]
+        def load_specs():
+            with open(path, encoding="utf-8") as f:
+                nb = json.load(f)
+
+            return nb["metadata"][NOTEBOOK_METADATA_KEY]["tests"]
+
+        key = (cls, path, os.path.abspath(path))
+        test_spec = PARSED_TEST_FILES.get(key, path, load_specs)
         if test_name not in test_spec:
             raise ValueError(f"Test {test_name} not found")
-        
-        test_spec = test_spec[test_name]
 
-        return cls.from_spec(test_spec, path=path)
+        test_file = PARSED_TEST_FILES.get(
+            key + (test_name,), path, lambda: cls.from_spec(test_spec[test_name], path=path))
+
+        return test_file.copy()
@@ -4,15 +4,93 @@ Support for OK-formatted test files
 
 import os
 import io
+import contextvars
 import doctest
+import threading
 import warnings
 import pathlib
 
 from contextlib import redirect_stderr, redirect_stdout
+from functools import lru_cache
 from textwrap import dedent
 
 from .abstract_test import TestFile, TestCase, TestCaseResult
-from ..utils import hide_outputs
+from ..utils import ExecutionTimeout, hide_outputs, time_limit
+
+
+# the default timeout of each test case in seconds, used for limiting test cases during grading
+_TIMEOUT_OVERRIDE = contextvars.ContextVar("timeout_override", default=None)
+
+
+class ParsedFileCache:
+    """
+    A process-level cache of values parsed from files, invalidated when a file's modification time or
+    size changes.
+
+    Each entry is keyed by ``key``, which must include the path to the file, and is stored with the
+    modification time and size of the file when it was parsed. If the file has changed when the 
+    entry is next requested, it is parsed again.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, path, parse):
+        """
+        Return the value parsed from the file at ``path``, calling ``parse`` to parse it if it isn't
+        cached or the file has changed.
+
+        Args:
+            key (hashable): the cache key
+            path (``str``): the path to the file
+            parse (callable): a function with no arguments that parses the file
+
+        Returns:
+            the parsed value
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        value = parse()
+        with self._lock:
+            self._entries[key] = (stamp, value)
+
+        return value
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+# parsed test files shared by every test file class
+PARSED_TEST_FILES = ParsedFileCache()
+
+
+@lru_cache(maxsize=4096)
+def _parse_doctest(name, doctest_string):
+    """
+    Parse the examples in a doctest, caching the results so that test cases run many times (e.g. 
+    against each submission) are only parsed once.
+
+    Args:
+        name (``str``): name of doctest
+        doctest_string (``str``): doctest in string form
+
+    Returns:
+        ``tuple`` of ``doctest.Example``: the examples in the doctest
+    """
+    examples = doctest.DocTestParser().parse(doctest_string, name)
+    return tuple(e for e in examples if isinstance(e, doctest.Example))
 
 
 def run_doctest(name, doctest_string, global_environment):
@@ -29,31 +107,67 @@ def run_doctest(name, doctest_string, global_environment):
     Returns:
         ``tuple`` of (``bool``, ``str``): results from running the test
     """
-    examples = doctest.DocTestParser().parse(
-        doctest_string,
-        name
-    )
-    test = doctest.DocTest(
-        [e for e in examples if isinstance(e, doctest.Example)],
-        global_environment,
-        name,
-        None,
-        None,
-        doctest_string
-    )
+    return run_doctests([(name, doctest_string)], global_environment)[0]
+
+
+def run_doctests(doctests, global_environment, timeout=None):
+    """
+    Run several doctests with given ``global_environment`` using a single doctest runner and a single
+    output-capturing context. The result of each doctest is the same as if it were run with 
+    ``run_doctest``: ``(True, '')`` if the doctest passes and ``(False, failure_message)`` if it
+    fails.
+
+    If ``timeout`` is set, a doctest that runs for longer than ``timeout`` seconds is interrupted and
+    fails, and the remaining doctests are still run.
+
+    Args:
+        doctests (``list`` of ``tuple`` of (``str``, ``str``)): the name and string form of each 
+            doctest
+        global_environment (``dict``): global environment resulting from the execution of a python 
+            script/notebook
+        timeout (``float``, optional): the number of seconds each doctest may run for
+
+    Returns:
+        ``list`` of ``tuple`` of (``bool``, ``str``): results from running each test
+    """
+    tests = [
+        doctest.DocTest(
+            list(_parse_doctest(name, doctest_string)),
+            global_environment,
+            name,
+            None,
+            None,
+            doctest_string
+        )
+        for name, doctest_string in doctests
+    ]
 
     doctestrunner = doctest.DocTestRunner(verbose=True)
 
+    results = []
     runresults = io.StringIO()
     with redirect_stdout(runresults), redirect_stderr(runresults), hide_outputs():
-        doctestrunner.run(test, clear_globs=False)
-    with open(os.devnull, 'w') as f, redirect_stderr(f), redirect_stdout(f):
-        result = doctestrunner.summarize(verbose=True)
-    # An individual test can only pass or fail
-    if result.failed == 0:
-        return (True, '')
-    else:
-        return False, runresults.getvalue()
+        for test in tests:
+            start = runresults.tell()
+            limit = time_limit(timeout)
+            try:
+                with limit:
+                    failed = doctestrunner.run(test, clear_globs=False).failed
+
+            # the timeout may be raised outside of the examples, where the runner doesn't catch it
+            except ExecutionTimeout:
+                failed = 1
+
+            # An individual test can only pass or fail
+            if failed == 0 and not limit.expired:
+                results.append((True, ''))
+            else:
+                message = runresults.getvalue()[start:]
+                if limit.expired:
+                    message += f"Test case timed out after {timeout} seconds\n"
+                results.append((False, message))
+
+    return results
 
 
 class OKTestFile(TestFile):
@@ -81,19 +195,25 @@ class OKTestFile(TestFile):
         grade (``float``): the percentage of ``points`` earned for this test file as a decimal
     """
 
-    def run(self, global_environment):
+    def run(self, global_environment, timeout=None):
         """
         Runs tests on a given ``global_environment``
 
         Arguments:
             ``global_environment`` (``dict``): result of executing a Python notebook/script
+            ``timeout`` (``float``, optional): the number of seconds each test case may run for;
+                defaults to the timeout set for the current grading call
 
         Returns:
             ``tuple`` of (``bool``, ``float`` ``otter.ok_parser.OKTest``): whether the test passed,
                 the percentage score on this test, and a pointer to the current ``otter.ok_parser.OKTest`` object
         """
-        for i, test_case in enumerate(self.test_cases):
-            passed, result = run_doctest(self.name + ' ' + str(i), test_case.body, global_environment)
+        results = run_doctests(
+            [(self.name + ' ' + str(i), test_case.body) for i, test_case in enumerate(self.test_cases)],
+            global_environment,
+            timeout=timeout if timeout is not None else _TIMEOUT_OVERRIDE.get(),
+        )
+        for test_case, (passed, result) in zip(self.test_cases, results):
             if passed:
                 result = 'Test case passed!'
 
@@ -143,22 +263,38 @@ class OKTestFile(TestFile):
 
         return cls(test_spec['name'], path, test_cases, all_or_nothing)
 
+    def copy(self):
+        """
+        Return a copy of this test file without any results.
+
+        Returns:
+            ``OKTestFile``: the copy
+        """
+        return type(self)(self.name, self.path, list(self.test_cases), self.all_or_nothing)
+
     @classmethod
     def from_file(cls, path):
         """
         Parse an ok test file & return an ``OKTest``
 
+        The parsed test file is cached until the file is modified, so the file is only executed 
+        once no matter how many times it is checked.
+
         Args:
             path (``str``): path to ok test file
 
         Returns:
             ``otter.ok_parser.OKTest``: new ``OKTest`` object created from the given file
         """
-        # ok test files are python files, with a global 'test' defined
-        test_globals = {}
-        with open(path) as f:
-            exec(f.read(), test_globals)
+        def parse():
+            # ok test files are python files, with a global 'test' defined
+            test_globals = {}
+            with open(path) as f:
+                exec(f.read(), test_globals)
+
+            test_spec = test_globals['test']
 
-        test_spec = test_globals['test']
+            return cls.from_spec(test_spec, path=path)
 
-        return cls.from_spec(test_spec, path=path)        
+        key = (cls, path, os.path.abspath(path))
+        return PARSED_TEST_FILES.get(key, path, parse).copy()
@@ -5,9 +5,12 @@ import sys
 import pathlib
 import random
 import re
+import signal
 import string
 import shutil
 import tempfile
+import threading
+import time
 
 from contextlib import contextmanager, redirect_stdout
 from IPython import get_ipython
@@ -137,6 +140,90 @@ def nullcontext():
     yield
 
 
+class ExecutionTimeout(Exception):
+    """
+    Raised by ``time_limit`` when a block of code runs for too long.
+    """
+
+
+class time_limit:
+    """
+    Context manager that raises ``exception`` in its body if the body runs for more than ``seconds``
+    seconds, using ``SIGALRM``. Because student code can catch the exception, it is raised again
+    every ``interval`` seconds until the body exits. Whether the time limit was exceeded is stored
+    in the ``expired`` attribute.
+
+    Time limits can be nested: if an enclosing time limit expires while this one is active, the
+    enclosing time limit's handler is called instead, and the enclosing timer is resumed when the 
+    body exits. If ``seconds`` is falsey, or the time limit can't be enforced because ``SIGALRM`` 
+    is unavailable or the current thread isn't the main thread, the body is run without a limit.
+
+    Args:
+        seconds (``float``): the time limit in seconds
+        exception (``type``, optional): the exception to raise
+        interval (``float``, optional): the number of seconds between raising the exception again
+
+    Attributes:
+        expired (``bool``): whether the time limit was exceeded
+    """
+
+    def __init__(self, seconds, exception=ExecutionTimeout, interval=0.1):
+        self.seconds = seconds
+        self.exception = exception
+        self.interval = interval
+        self.expired = False
+        self._active = False
+
+    def __enter__(self):
+        if not self.seconds or not hasattr(signal, "SIGALRM") or \
+                threading.current_thread() is not threading.main_thread():
+            return self
+
+        now = time.monotonic()
+        self._deadline = now + self.seconds
+        self._outer_handler = signal.signal(signal.SIGALRM, self._handle)
+
+        outer_delay, self._outer_interval = signal.getitimer(signal.ITIMER_REAL)
+        self._outer_deadline = now + outer_delay if outer_delay > 0 else None
+
+        delay = self.seconds
+        if self._outer_deadline is not None:
+            delay = min(delay, outer_delay)
+
+        signal.setitimer(signal.ITIMER_REAL, delay, self.interval)
+        self._active = True
+        return self
+
+    def _handle(self, signum, frame):
+        # never raise while the timer is being set up or torn down, which would leave it running
+        if frame is not None and frame.f_code in (self.__enter__.__code__, self.__exit__.__code__):
+            return
+
+        now = time.monotonic()
+        if self._outer_deadline is not None and now >= self._outer_deadline and \
+                callable(self._outer_handler):
+            self._outer_handler(signum, frame)
+
+        # allow for the timer firing slightly before the deadline
+        if now >= self._deadline - 1e-3:
+            self.expired = True
+            raise self.exception(f"Execution timed out after {self.seconds} seconds")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._active:
+            return
+
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._outer_handler)
+        self._active = False
+
+        # resume the enclosing timer, which fires immediately if it has already expired
+        if self._outer_deadline is not None:
+            signal.setitimer(
+                signal.ITIMER_REAL, max(self._outer_deadline - time.monotonic(), 1e-6),
+                self._outer_interval)
+
+
 @contextmanager
 def load_default_file(provided_fn, default_fn, default_disabled=False):
     """
@@ -40,6 +40,6 @@ setuptools.setup(
 	package_data={
 		"otter.export.exporters": ["templates/*", "templates/*/*"],
 		"otter.generate": ["templates/*", "templates/*/*"],
-		"otter.grade": ["Dockerfile"],
+		"otter.grade": ["Dockerfile", "config-Dockerfile"],
 	},
 )
@@ -2,11 +2,13 @@
 ##### Tests for otter generate #####
 ####################################
 
+import hashlib
 import json
 import os
 import shutil
 import subprocess
 import unittest
+import zipfile
 
 from glob import glob
 from subprocess import PIPE
@@ -87,3 +89,40 @@ class TestAutograder(TestCase):
 
         with self.unzip_to_temp(TEST_FILES_PATH + "autograder.zip", delete=True) as unzipped_dir:
             self.assertDirsEqual(unzipped_dir, TEST_FILES_PATH + "autograder-r-correct")
+
+    def test_deterministic(self):
+        """
+        Check that generating an autograder from unchanged inputs produces an identical zip file
+        """
+        kwargs = dict(
+            tests_dir = TEST_FILES_PATH + "tests",
+            requirements = TEST_FILES_PATH + "requirements.txt",
+            config = TEST_FILES_PATH + "otter_config.json",
+            files = [TEST_FILES_PATH + "data/test-df.csv"],
+            no_environment = True,
+        )
+
+        zip_paths = [TEST_FILES_PATH + "autograder.zip", TEST_FILES_PATH + "autograder-2.zip"]
+        try:
+            generate(output_path = zip_paths[0], **kwargs)
+
+            # update the modification times of the inputs
+            for test_file in glob(TEST_FILES_PATH + "tests/*.py") + [TEST_FILES_PATH + "data/test-df.csv"]:
+                st = os.stat(test_file)
+                os.utime(test_file, (st.st_atime + 60, st.st_mtime + 60))
+
+            generate(output_path = zip_paths[1], **kwargs)
+
+            with open(zip_paths[0], "rb") as f1, open(zip_paths[1], "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+            with zipfile.ZipFile(zip_paths[0]) as zf:
+                names = zf.namelist()
+                self.assertEqual(names, sorted(names))
+
+                manifest = json.loads(zf.read("otter_manifest.json"))
+                self.assertEqual(sorted(manifest), [n for n in names if n != "otter_manifest.json"])
+                self.assertEqual(manifest["tests/q1.py"], hashlib.sha256(zf.read("tests/q1.py")).hexdigest())
+
+        finally:
+            self.deletePaths(zip_paths)
@@ -6,15 +6,26 @@ import pandas as pd
 import os
 import re
 import shutil
+import json
 import subprocess
+import tempfile
 import zipfile
 
 from glob import glob
 from subprocess import PIPE
+from unittest import mock
 
 from otter.generate import main as generate
 from otter.generate import utils
 from otter.grade import main as grade
+from otter.grade.cache import ResultCache
+from otter.grade.containers import launch_grade
+from otter.grade.ledger import GradingLedger, LEDGER_FILENAME
+from otter.grade.resources import (
+    ContainerResourceMonitor, RESOURCE_USAGE_FILENAME, ResourceUsage, ResourceUsageLog)
+from otter.grade.scheduler import AdaptiveScheduler, parse_memory
+from otter.grade.utils import generate_environment_hash, order_by_expected_runtime
+from otter.run import main as run
 
 from . import TestCase
 
@@ -137,8 +148,42 @@ class TestGrade(TestCase):
             verbose = True
         )
 
+        self.assertNotebookGradesCorrect()
+
+        self.assertTrue(os.path.exists("test/submission_pdfs"), "PDF folder is missing")
+
+        # check that an pdf exists for each submission
+        dir1_contents, dir2_contents = (
+            [os.path.splitext(f)[0] for f in os.listdir(TEST_FILES_PATH + "notebooks/") if not (os.path.isdir(os.path.join(TEST_FILES_PATH + "notebooks/", f)))],
+            [os.path.splitext(f)[0] for f in os.listdir("test/submission_pdfs") if not (os.path.isdir(os.path.join("test/submission_pdfs", f)))],
+        )
+        self.assertEqual(sorted(dir1_contents), sorted(dir2_contents), f"'{TEST_FILES_PATH}notebooks/' and 'test/submission_pdfs' have different contents")
+
+    def test_notebooks_in_pool(self):
+        """
+        Check that the example of 100 notebooks is graded correctly in a pool of containers.
+        """
+        grade(
+            path = TEST_FILES_PATH + "notebooks/", 
+            output_dir = "test/",
+            autograder = TEST_FILES_PATH + "autograder.zip",
+            containers = 5,
+            image = "otter-test",
+            pool = True,
+            jobs_per_container = 7,
+            no_cache = True,
+        )
+
+        self.assertNotebookGradesCorrect()
+
+    def assertNotebookGradesCorrect(self):
+        """
+        Check the scores in ``test/final_grades.csv`` against the failures encoded in the names of
+        the notebooks in ``notebooks/``.
+        """
         # read the output and expected output
         df_test = pd.read_csv("test/final_grades.csv")
+        self.assertEqual(len(df_test), len(glob(TEST_FILES_PATH + "notebooks/*.ipynb")))
 
         # sort by filename
         df_test = df_test.sort_values("file").reset_index(drop=True)
@@ -161,18 +206,9 @@ class TestGrade(TestCase):
                 else:
                     self.assertEqual(row[test], self.test_points[test], "{} supposed to pass {} but failed".format(row["file"], test))
 
-        self.assertTrue(os.path.exists("test/submission_pdfs"), "PDF folder is missing")
-
-        # check that an pdf exists for each submission
-        dir1_contents, dir2_contents = (
-            [os.path.splitext(f)[0] for f in os.listdir(TEST_FILES_PATH + "notebooks/") if not (os.path.isdir(os.path.join(TEST_FILES_PATH + "notebooks/", f)))],
-            [os.path.splitext(f)[0] for f in os.listdir("test/submission_pdfs") if not (os.path.isdir(os.path.join("test/submission_pdfs", f)))],
-        )
-        self.assertEqual(sorted(dir1_contents), sorted(dir2_contents), f"'{TEST_FILES_PATH}notebooks/' and 'test/submission_pdfs' have different contents")
-
     def tearDown(self) -> None:
         # remove the extra output
-        cleanup_command = ["rm", "-rf", "test/final_grades.csv", "test/submission_pdfs", "test/final_grades.csv"]
+        cleanup_command = ["rm", "-rf", "test/final_grades.csv", "test/submission_pdfs", "test/final_grades.csv", "test/" + LEDGER_FILENAME, "test/resource_usage.csv"]
         cleanup = subprocess.run(cleanup_command, stdout=PIPE, stderr=PIPE)
         self.assertEqual(len(cleanup.stderr), 0, cleanup.stderr.decode("utf-8"))
 
@@ -188,3 +224,574 @@ class TestGrade(TestCase):
             os.remove(TEST_FILES_PATH + "autograder.zip")
         # prune images
         grade(prune=True, force=True)
+
+
+class FakeResults:
+    """
+    A picklable stand-in for ``GradingResults`` with a single test.
+    """
+
+    def __init__(self, score):
+        self.score = score
+
+    def to_dict(self):
+        return {"q1": {"score": self.score}}
+
+
+class TestGradingLedger(TestCase):
+    """
+    Tests for the grading ledger and result cache that don't require Docker.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.subms_dir = os.path.join(self.tempdir, "submissions")
+        os.makedirs(self.subms_dir)
+        for i in range(3):
+            with open(os.path.join(self.subms_dir, f"nb{i}.ipynb"), "w") as f:
+                f.write(f"notebook {i}")
+
+        self.zip_path = os.path.join(self.tempdir, "autograder.zip")
+        with open(self.zip_path, "w") as f:
+            f.write("autograder")
+
+        return super().setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        return super().tearDown()
+
+    @staticmethod
+    def fake_grade(submission_path, **kwargs):
+        if os.path.basename(submission_path) == "nb1.ipynb":
+            raise Exception(f"Executing '{submission_path}' in docker container failed! Exit code: 1")
+        return FakeResults(1.0)
+
+    def launch_grade(self, side_effect, **kwargs):
+        kwargs.setdefault("cache", False)
+        kwargs.setdefault("cache_dir", os.path.join(self.tempdir, "cache"))
+        with mock.patch("otter.grade.containers.build_image") as mocked_build, \
+                mock.patch("otter.grade.containers.grade_assignments") as mocked_grade:
+            mocked_build.return_value = "otter-grade:test"
+            mocked_grade.side_effect = side_effect
+            try:
+                return launch_grade(
+                    self.zip_path, self.subms_dir, output_path=self.tempdir, **kwargs), mocked_grade
+            except Exception as e:
+                return e, mocked_grade
+
+    def test_resume(self):
+        """
+        Checks that failures don't lose the grades of other submissions and that a rerun only grades
+        submissions that weren't already graded.
+        """
+        e, mocked_grade = self.launch_grade(self.fake_grade)
+        self.assertIsInstance(e, Exception)
+        self.assertIn("nb1.ipynb' in docker container failed! Exit code: 1", str(e))
+        self.assertEqual(mocked_grade.call_count, 3)
+
+        # the grades of the other submissions should have been streamed to the CSV
+        df = pd.read_csv(os.path.join(self.tempdir, "final_grades.csv"))
+        self.assertEqual(df.columns.tolist(), ["file", "q1"])
+        self.assertEqual(sorted(df["file"]), ["nb0.ipynb", "nb2.ipynb"])
+
+        ledger = GradingLedger.in_directory(self.tempdir, "")
+        rows = ledger._execute("SELECT file, status, started <= finished FROM submissions ORDER BY file")
+        ledger.close()
+        self.assertEqual(
+            [(os.path.basename(f), status, ordered) for f, status, ordered in rows],
+            [("nb0.ipynb", "graded", 1), ("nb1.ipynb", "failed", 1), ("nb2.ipynb", "graded", 1)],
+        )
+
+        # rerunning should only grade the failed submission
+        grade_dfs, mocked_grade = self.launch_grade(lambda **kwargs: FakeResults(0.0))
+        self.assertEqual(mocked_grade.call_count, 1)
+        self.assertEqual(mocked_grade.call_args.kwargs["submission_path"], os.path.join(self.subms_dir, "nb1.ipynb"))
+        self.assertEqual(sorted(df["file"].item() for df in grade_dfs), ["nb0.ipynb", "nb1.ipynb", "nb2.ipynb"])
+
+        df = pd.read_csv(os.path.join(self.tempdir, "final_grades.csv"))
+        self.assertEqual(sorted(df["file"]), ["nb0.ipynb", "nb1.ipynb", "nb2.ipynb"])
+
+        # changing a submission should cause it to be regraded
+        with open(os.path.join(self.subms_dir, "nb2.ipynb"), "w") as f:
+            f.write("changed")
+
+        _, mocked_grade = self.launch_grade(self.fake_grade)
+        self.assertEqual(mocked_grade.call_count, 1)
+
+        # nothing should be skipped if resume is false
+        _, mocked_grade = self.launch_grade(self.fake_grade, resume=False)
+        self.assertEqual(mocked_grade.call_count, 3)
+
+    def test_batch_errors(self):
+        """
+        Checks that a submission that can't be graded in a batch doesn't fail the rest of its shard.
+        """
+        def fake_grade_batch(submission_paths, **kwargs):
+            results, errors = {}, {}
+            for subm_path in submission_paths:
+                try:
+                    results[subm_path] = self.fake_grade(subm_path)
+                except Exception as e:
+                    errors[subm_path] = e
+            return results, errors
+
+        with mock.patch("otter.grade.containers.grade_assignment_batch") as mocked_batch:
+            mocked_batch.side_effect = fake_grade_batch
+            e, _ = self.launch_grade(None, batch_size=3)
+
+        self.assertIsInstance(e, Exception)
+        self.assertIn("nb1.ipynb' in docker container failed! Exit code: 1", str(e))
+        self.assertEqual(mocked_batch.call_count, 1)
+
+        df = pd.read_csv(os.path.join(self.tempdir, "final_grades.csv"))
+        self.assertEqual(sorted(df["file"]), ["nb0.ipynb", "nb2.ipynb"])
+
+        ledger = GradingLedger.in_directory(self.tempdir, "")
+        rows = ledger._execute("SELECT file, status FROM submissions ORDER BY file")
+        ledger.close()
+        self.assertEqual(
+            [(os.path.basename(f), status) for f, status in rows],
+            [("nb0.ipynb", "graded"), ("nb1.ipynb", "failed"), ("nb2.ipynb", "graded")],
+        )
+
+        # rerunning should only grade the failed submission
+        with mock.patch("otter.grade.containers.grade_assignment_batch") as mocked_batch:
+            mocked_batch.side_effect = lambda submission_paths, **kwargs: \
+                ({p: FakeResults(0.0) for p in submission_paths}, {})
+            self.launch_grade(None, batch_size=3)
+
+        self.assertEqual(
+            mocked_batch.call_args.kwargs["submission_paths"],
+            [os.path.join(self.subms_dir, "nb1.ipynb")])
+
+    def test_cache(self):
+        """
+        Checks that cached results are reused across directories and that identical submissions are
+        only graded once.
+        """
+        shutil.copy(os.path.join(self.subms_dir, "nb0.ipynb"), os.path.join(self.subms_dir, "nb3.ipynb"))
+
+        e, mocked_grade = self.launch_grade(self.fake_grade, cache=True)
+        self.assertIsInstance(e, Exception)
+        self.assertEqual(mocked_grade.call_count, 3)
+
+        df = pd.read_csv(os.path.join(self.tempdir, "final_grades.csv"))
+        self.assertEqual(sorted(df["file"]), ["nb0.ipynb", "nb2.ipynb", "nb3.ipynb"])
+
+        # grading the same submissions under different names in a different directory should only
+        # grade the submission that failed
+        new_subms_dir = os.path.join(self.tempdir, "new-submissions")
+        os.makedirs(new_subms_dir)
+        for i in range(4):
+            shutil.copy(os.path.join(self.subms_dir, f"nb{i}.ipynb"), os.path.join(new_subms_dir, f"new{i}.ipynb"))
+
+        shutil.rmtree(self.subms_dir)
+        shutil.move(new_subms_dir, self.subms_dir)
+
+        grade_dfs, mocked_grade = self.launch_grade(lambda **kwargs: FakeResults(0.0), cache=True)
+        self.assertEqual(mocked_grade.call_count, 1)
+        self.assertEqual(
+            sorted((df["file"].item(), df["q1"].item()) for df in grade_dfs),
+            [("new0.ipynb", 1.0), ("new1.ipynb", 0.0), ("new2.ipynb", 1.0), ("new3.ipynb", 1.0)],
+        )
+
+        # invalidating the cache should regrade everything but the duplicate
+        _, mocked_grade = self.launch_grade(
+            lambda **kwargs: FakeResults(0.0), cache=True, invalidate_cache=True, resume=False)
+        self.assertEqual(mocked_grade.call_count, 3)
+
+        # results graded with different options shouldn't be reused, but equivalent options should
+        _, mocked_grade = self.launch_grade(
+            lambda **kwargs: FakeResults(0.0), cache=True, resume=False, timeout=10, memory="1g")
+        self.assertEqual(mocked_grade.call_count, 3)
+
+        _, mocked_grade = self.launch_grade(
+            lambda **kwargs: FakeResults(0.0), cache=True, resume=False, timeout=10,
+            memory=1024 ** 3)
+        self.assertEqual(mocked_grade.call_count, 0)
+
+    def test_cache_eviction(self):
+        """
+        Checks that the least recently used entries are evicted from the result cache.
+        """
+        cache = ResultCache(os.path.join(self.tempdir, "cache"))
+        for i in range(3):
+            cache.put(str(i), FakeResults(i))
+            os.utime(os.path.join(cache.directory, f"{i}.pkl"), (i, i))
+
+        self.assertEqual(cache.get("0").score, 0)
+        self.assertIsNone(cache.get("3"))
+
+        entry_size = os.path.getsize(os.path.join(cache.directory, "0.pkl"))
+        cache.max_size = 3 * entry_size
+        cache.put("3", FakeResults(3))
+
+        # entry 1 is the least recently used since entry 0 was just read
+        self.assertEqual(sorted(os.listdir(cache.directory)), ["0.pkl", "2.pkl", "3.pkl"])
+
+
+class TestGradeUtils(TestCase):
+    """
+    Tests for utilities of Otter Grade that don't require Docker.
+    """
+
+    def test_environment_hash(self):
+        """
+        Checks that the environment hash only depends on the environment files and base image.
+        """
+        tempdir = tempfile.mkdtemp()
+        zip_path = os.path.join(tempdir, "autograder.zip")
+
+        def make_zip(files):
+            with zipfile.ZipFile(zip_path, "w") as zf:
+                for name, contents in files.items():
+                    zf.writestr(name, contents)
+            return generate_environment_hash(zip_path, "ucbdsinfra/otter-grader")
+
+        try:
+            files = {
+                "setup.sh": "conda env create",
+                "environment.yml": "name: otter-env",
+                "requirements.txt": "numpy",
+                "otter_config.json": "{}",
+                "tests/q1.py": "test = {}",
+            }
+            env_hash = make_zip(files)
+
+            self.assertEqual(make_zip({**files, "tests/q1.py": "test = {'name': 'q1'}"}), env_hash)
+            self.assertEqual(make_zip({**files, "otter_config.json": '{"pdf": true}'}), env_hash)
+            self.assertEqual(make_zip({**files, "files/data.csv": "a,b"}), env_hash)
+            self.assertNotEqual(make_zip({**files, "requirements.txt": "pandas"}), env_hash)
+            self.assertNotEqual(make_zip({**files, "requirements.r": "install.packages('x')"}), env_hash)
+            self.assertNotEqual(make_zip({**files, "setup.sh": "conda env update"}), env_hash)
+
+            make_zip(files)
+            self.assertNotEqual(generate_environment_hash(zip_path, "otter-test"), env_hash)
+
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_order_by_expected_runtime(self):
+        """
+        Checks that submissions are sorted by their predicted grading time, longest first.
+        """
+        tempdir = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(tempdir, f"nb{i}.ipynb") for i in range(4)]
+            for path, num_cells in zip(paths, [2, 10, 5, 1]):
+                write_notebook(path, num_cells)
+
+            # with no history, sort by the number of cells
+            self.assertEqual(
+                order_by_expected_runtime(paths, {}), [paths[1], paths[2], paths[0], paths[3]])
+
+            # previous grading times take precedence, and are used to scale the cost of the others;
+            # nb3 and nb2 took 100s for ~8 units of cost, so nb1 (~11 units) is predicted to take
+            # ~140s and nb0 (~3 units) ~38s, which is less than nb3 actually took
+            durations = {paths[3]: 40, paths[2]: 60}
+            self.assertEqual(
+                order_by_expected_runtime(paths, durations), [paths[1], paths[2], paths[3], paths[0]])
+
+        finally:
+            shutil.rmtree(tempdir)
+
+
+def write_notebook(path, num_code_cells):
+    """
+    Writes a notebook with ``num_code_cells`` code cells and a Markdown cell to ``path``.
+    """
+    cells = [{"cell_type": "markdown", "metadata": {}, "source": "# Title"}]
+    cells += [{"cell_type": "code", "metadata": {}, "source": f"x = {i}", "outputs": [], "execution_count": None}
+              for i in range(num_code_cells)]
+    with open(path, "w") as f:
+        json.dump({"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}, f)
+
+
+class TestAdaptiveScheduler(TestCase):
+    """
+    Tests for the resource-aware container scheduler.
+    """
+
+    GB = 1024 ** 3
+
+    def scheduler_limit(self, scheduler, meminfo, loadavg):
+        with mock.patch("otter.grade.scheduler.read_meminfo") as mocked_meminfo, \
+                mock.patch("otter.grade.scheduler.read_loadavg") as mocked_loadavg:
+            mocked_meminfo.return_value = meminfo
+            mocked_loadavg.return_value = loadavg
+            return scheduler.limit()
+
+    def test_parse_memory(self):
+        """
+        Checks that Docker memory limits are converted to bytes.
+        """
+        self.assertEqual(parse_memory("512m"), 512 * 1024 ** 2)
+        self.assertEqual(parse_memory("2g"), 2 * self.GB)
+        self.assertEqual(parse_memory("1.5GB"), int(1.5 * self.GB))
+        self.assertEqual(parse_memory("100"), 100)
+        self.assertEqual(parse_memory(100), 100)
+        self.assertRaises(ValueError, lambda: parse_memory("lots"))
+
+    def test_limit(self):
+        """
+        Checks that the number of containers is limited by CPUs, memory, and load.
+        """
+        with mock.patch("os.cpu_count", return_value=16):
+            self.assertEqual(AdaptiveScheduler(cpus=2).max_containers, 8)
+            self.assertEqual(AdaptiveScheduler().max_containers, 16)
+            scheduler = AdaptiveScheduler(8, memory="2g")
+
+        # no memory information or per-container usage: only the maximum applies
+        self.assertEqual(self.scheduler_limit(AdaptiveScheduler(8), None, None), 8)
+        self.assertEqual(self.scheduler_limit(AdaptiveScheduler(8), (64 * self.GB, self.GB), 0), 8)
+
+        # 10 GB free after keeping 10% of 20 GB free, so 5 containers of 2 GB fit
+        self.assertEqual(self.scheduler_limit(scheduler, (20 * self.GB, 12 * self.GB), 0), 5)
+
+        # an observed peak larger than the limit is used instead
+        scheduler.record_memory(5 * self.GB)
+        self.assertEqual(self.scheduler_limit(scheduler, (20 * self.GB, 12 * self.GB), 0), 2)
+
+        # running containers are already accounted for in the available memory
+        scheduler.running = 3
+        self.assertEqual(self.scheduler_limit(scheduler, (20 * self.GB, 12 * self.GB), 0), 5)
+
+        # don't start new containers if the host is overloaded
+        self.assertEqual(self.scheduler_limit(scheduler, (20 * self.GB, 12 * self.GB), 100), 3)
+
+        # always allow at least one container
+        scheduler.running = 0
+        self.assertEqual(self.scheduler_limit(scheduler, (20 * self.GB, self.GB), 100), 1)
+
+
+class TestResourceAccounting(TestCase):
+    """
+    Tests for the accounting of the resources used by grading containers.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.container = mock.Mock(id="abc123")
+        self.cgroup_dir = os.path.join(self.tempdir, "system.slice", "docker-abc123.scope")
+        os.makedirs(self.cgroup_dir)
+        return super().setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        return super().tearDown()
+
+    def write_cgroup(self, usage_usec, current, peak, oom_kill):
+        files = {
+            "cpu.stat": f"usage_usec {usage_usec}\nuser_usec 0\nsystem_usec 0\n",
+            "memory.current": f"{current}\n",
+            "memory.peak": f"{peak}\n",
+            "memory.events": f"low 0\nhigh 0\nmax 0\noom 0\noom_kill {oom_kill}\n",
+        }
+        for name, contents in files.items():
+            with open(os.path.join(self.cgroup_dir, name), "w") as f:
+                f.write(contents)
+
+    def monitor_job(self, before, after, fresh=True, exit_code=0, timed_out=False):
+        with mock.patch("otter.grade.resources._CgroupReader.ROOT", self.tempdir), \
+                mock.patch("otter.grade.resources.docker") as mocked_docker:
+            mocked_docker.container.inspect.return_value.state.oom_killed = False
+            self.write_cgroup(*before)
+            monitor = ContainerResourceMonitor(self.container, fresh=fresh, interval=60)
+            monitor.start()
+            self.write_cgroup(*after)
+            monitor.stop()
+            monitor.timed_out = timed_out
+            return monitor.usage("nb.ipynb", exit_code)
+
+    def test_fresh_container(self):
+        """
+        Checks the usage of a container started for a single job.
+        """
+        usage = self.monitor_job((1_000_000, 100, 200, 0), (3_500_000, 100, 5000, 0))
+        self.assertEqual(usage.file, "nb.ipynb")
+        self.assertEqual(usage.cpu_time, 3.5)
+        self.assertEqual(usage.peak_memory, 5000)
+        self.assertFalse(usage.oom_killed)
+        self.assertFalse(usage.timed_out)
+        self.assertEqual(usage.exit_code, 0)
+        self.assertGreaterEqual(usage.wall_time, 0)
+
+    def test_reused_container(self):
+        """
+        Checks that the usage of a job in a reused container doesn't include earlier jobs.
+        """
+        usage = self.monitor_job(
+            (1_000_000, 100, 9000, 1), (3_500_000, 300, 9000, 2), fresh=False, exit_code=137,
+            timed_out=True)
+        self.assertEqual(usage.cpu_time, 2.5)
+        self.assertEqual(usage.peak_memory, 300)
+        self.assertTrue(usage.oom_killed)
+        self.assertTrue(usage.timed_out)
+
+    def test_usage_log(self):
+        """
+        Checks that the usage log writes and appends to a CSV file.
+        """
+        path = os.path.join(self.tempdir, "resource_usage.csv")
+        log = ResourceUsageLog(path)
+        log.record(ResourceUsage("nb0.ipynb", 1.5, 1.0, 1024, False, False, 0))
+        log.record(ResourceUsage("nb1.ipynb", 40.0, 39.0, 2048, False, True, 137))
+
+        df = pd.read_csv(path)
+        self.assertEqual(df.columns.tolist(), list(ResourceUsage._fields))
+        self.assertEqual(df["file"].tolist(), ["nb0.ipynb", "nb1.ipynb"])
+        self.assertEqual(df["timed_out"].tolist(), [False, True])
+
+        # appending to the log should keep its rows and not repeat the header
+        log = ResourceUsageLog(path, append=True)
+        log.record(ResourceUsage("nb2.ipynb", 2.0, 1.0, 1024, False, False, 0))
+
+        df = pd.read_csv(path)
+        self.assertEqual(df["file"].tolist(), ["nb0.ipynb", "nb1.ipynb", "nb2.ipynb"])
+
+        log = ResourceUsageLog(path)
+        log.record(ResourceUsage("nb3.ipynb", 2.0, 1.0, 1024, False, False, 0))
+
+        df = pd.read_csv(path)
+        self.assertEqual(df["file"].tolist(), ["nb3.ipynb"])
+
+
+class TestDispatchOrder(TestCase):
+    """
+    Tests for the order in which submissions are dispatched to containers.
+    """
+
+    def test_longest_first(self):
+        """
+        Checks that the submissions expected to take the longest are graded first.
+        """
+        tempdir = tempfile.mkdtemp()
+        try:
+            subms_dir = os.path.join(tempdir, "submissions")
+            os.makedirs(subms_dir)
+            for name, num_cells in [("a", 1), ("b", 20), ("c", 5)]:
+                write_notebook(os.path.join(subms_dir, f"{name}.ipynb"), num_cells)
+
+            zip_path = os.path.join(tempdir, "autograder.zip")
+            with open(zip_path, "w") as f:
+                f.write("autograder")
+
+            with mock.patch("otter.grade.containers.build_image") as mocked_build, \
+                    mock.patch("otter.grade.containers.grade_assignments") as mocked_grade:
+                mocked_build.return_value = "otter-grade:test"
+                mocked_grade.side_effect = lambda **kwargs: FakeResults(1.0)
+                launch_grade(zip_path, subms_dir, num_containers=1, output_path=tempdir, cache=False)
+
+            self.assertEqual(
+                [os.path.basename(c.kwargs["submission_path"]) for c in mocked_grade.call_args_list],
+                ["b.ipynb", "c.ipynb", "a.ipynb"],
+            )
+
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class TestLocalBackend(TestCase):
+    """
+    Tests for grading submissions in local worker processes without Docker.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tempdir, "autograder.zip")
+        generate(
+            tests_dir = TEST_FILES_PATH + "tests",
+            requirements = TEST_FILES_PATH + "requirements.txt",
+            output_path = self.zip_path,
+            no_environment = True,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_notebooks(self):
+        """
+        Checks that the local backend gives the same grades as ``otter run``.
+        """
+        subms_dir = os.path.join(self.tempdir, "submissions")
+        os.makedirs(subms_dir)
+        for nb in ["passesAll.ipynb", "fails1and4.ipynb", "fails2and6H.ipynb"]:
+            shutil.copy(os.path.join(TEST_FILES_PATH, "notebooks", nb), subms_dir)
+
+        grade(
+            path = subms_dir,
+            output_dir = self.tempdir,
+            autograder = self.zip_path,
+            containers = 2,
+            backend = "local",
+            no_cache = True,
+        )
+
+        df_test = pd.read_csv(os.path.join(self.tempdir, "final_grades.csv"))
+        self.assertEqual(len(df_test), 3)
+
+        for _, row in df_test.iterrows():
+            results = run(
+                os.path.join(subms_dir, row["file"]), autograder=self.zip_path,
+                output_dir=self.tempdir, no_logo=True)
+            for test, score in results.to_dict().items():
+                self.assertEqual(row[test], score["score"], f"{row['file']} has the wrong score for {test}")
+
+        usage = pd.read_csv(os.path.join(self.tempdir, RESOURCE_USAGE_FILENAME))
+        self.assertEqual(sorted(usage["file"]), sorted(df_test["file"]))
+        self.assertTrue((usage["exit_code"] == 0).all())
+
+    def test_timeout(self):
+        """
+        Checks that a submission is stopped when it exceeds the timeout.
+        """
+        with self.assertRaises(Exception) as e:
+            grade(
+                path = TEST_FILES_PATH + "timeout/",
+                output_dir = self.tempdir,
+                autograder = self.zip_path,
+                backend = "local",
+                timeout = 2,
+                no_cache = True,
+            )
+
+        self.assertIn("GradingTimeout", str(e.exception))
+
+        usage = pd.read_csv(os.path.join(self.tempdir, RESOURCE_USAGE_FILENAME))
+        self.assertTrue(usage["timed_out"].all())
+
+    def test_uninterruptible_timeout(self):
+        """
+        Checks that a submission that prevents the timeout from being raised is killed.
+        """
+        subms_dir = os.path.join(self.tempdir, "submissions")
+        os.makedirs(subms_dir)
+        with open(os.path.join(subms_dir, "spin.ipynb"), "w") as f:
+            json.dump({"cells": [{
+                "cell_type": "code", "metadata": {}, "outputs": [], "execution_count": None,
+                "source": "import signal\nsignal.signal(signal.SIGALRM, signal.SIG_IGN)\nwhile True:\n    pass",
+            }], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}, f)
+
+        with self.assertRaises(Exception) as e:
+            grade(
+                path = subms_dir,
+                output_dir = self.tempdir,
+                autograder = self.zip_path,
+                backend = "local",
+                timeout = 1,
+                no_cache = True,
+            )
+
+        self.assertIn("timed out and it was killed", str(e.exception))
+
+        usage = pd.read_csv(os.path.join(self.tempdir, RESOURCE_USAGE_FILENAME))
+        self.assertTrue(usage["timed_out"].all())
+        self.assertFalse(usage["oom_killed"].any())
+
+    def test_invalid_options(self):
+        """
+        Checks that the local backend can't be used with container pools or batches.
+        """
+        with self.assertRaises(ValueError):
+            launch_grade(self.zip_path, self.tempdir, backend="local", pool=True)
@@ -4,14 +4,21 @@
 
 import numpy as np
 import os
+import pickle
 import sys
 import unittest
 
+from unittest import mock
+
 from sklearn.linear_model import LinearRegression
 
-from otter.check.logs import Log
-from otter.check.notebook import Notebook, _OTTER_LOG_FILENAME
 from otter.check.logs import LogEntry, EventType, Log
+from otter.check.notebook import Notebook, _OTTER_LOG_FILENAME
+from otter.check import compression as compression_module
+from otter.check import log_file
+from otter.check.compression import LogCompression
+from otter.check.log_file import compact_log, is_indexed_log, read_generation, read_index
+from otter.check.log_writer import LogWriter
 from . import TestCase
 
 
@@ -95,7 +102,7 @@ class TestLogs(TestCase):
             self.assertEqual(repr(logged_result), repr(actual_result), f"Logged results for {question} are not correct")
 
     def test_shelve(self):
-        # tests shelve() and unshelve() which call shelve_environment()
+        # tests shelve() and unshelve() which call serialize_environment()
 
         def square(x):
             return x**2
@@ -192,6 +199,229 @@ class TestLogs(TestCase):
 
         self.assertEqual(nextLogEntry.question, entry3.question)
 
+    def test_indexed_log(self):
+        entries = [
+            LogEntry(event_type=EventType.INIT),
+            LogEntry(event_type=EventType.CHECK, question="q1"),
+            LogEntry(event_type=EventType.CHECK, question="q2"),
+            LogEntry(event_type=EventType.CHECK, question="q1"),
+        ]
+        for entry in entries:
+            entry.flush_to_file(_OTTER_LOG_FILENAME)
+
+        self.assertTrue(is_indexed_log(_OTTER_LOG_FILENAME))
+        self.assertEqual(
+            [(ie.event_type, ie.question) for ie in read_index(_OTTER_LOG_FILENAME)],
+            [("INIT", None), ("CHECK", "q1"), ("CHECK", "q2"), ("CHECK", "q1")],
+        )
+
+        # only the index and the requested entries are read
+        log = Log.from_file(_OTTER_LOG_FILENAME, ascending=False)
+        self.assertEqual(log.get_questions(), ["q1", "q2"])
+        self.assertEqual(log.get_question_entry("q1").timestamp, entries[3].timestamp)
+        self.assertIsNone(log._entries)
+
+        self.assertEqual([e.timestamp for e in log], [e.timestamp for e in entries[::-1]])
+
+        # a log whose index was not written is rebuilt from its entries
+        with open(_OTTER_LOG_FILENAME, "rb+") as f:
+            f.truncate(os.path.getsize(_OTTER_LOG_FILENAME) - 5)
+
+        self.assertEqual(len(Log.from_file(_OTTER_LOG_FILENAME).entries), 4)
+
+        LogEntry(event_type=EventType.CHECK, question="q3").flush_to_file(_OTTER_LOG_FILENAME)
+        self.assertEqual(Log.from_file(_OTTER_LOG_FILENAME).get_questions(), ["q1", "q2", "q3"])
+
+    def test_index_deltas(self):
+        def append(question):
+            LogEntry(event_type=EventType.CHECK, question=question).flush_to_file(_OTTER_LOG_FILENAME)
+
+        questions = [f"q{i}" for i in range(20)]
+        for question in questions:
+            with open(_OTTER_LOG_FILENAME, "ab+") as f:
+                f.seek(0)
+                before = f.read()
+
+            append(question)
+
+            # appends only write over the footer, so the index isn't rewritten
+            with open(_OTTER_LOG_FILENAME, "rb") as f:
+                self.assertEqual(f.read(max(len(before) - 16, 0)), before[:-16])
+
+        # the index is read from its chain of index records by other processes
+        log_file._INDEXES.clear()
+        self.assertEqual([ie.question for ie in read_index(_OTTER_LOG_FILENAME)], questions)
+
+        # logs written before index records were chained are still read and appended to
+        log_file.write_entries(_OTTER_LOG_FILENAME, Log.from_file(_OTTER_LOG_FILENAME).entries)
+        with open(_OTTER_LOG_FILENAME, "rb+") as f:
+            f.seek(8)
+            f.write(b"\x00\x03")
+
+        log_file._INDEXES.clear()
+        append("q20")
+        with open(_OTTER_LOG_FILENAME, "rb") as f:
+            self.assertEqual(f.read(10)[8:], b"\x00\x04")
+
+        log_file._INDEXES.clear()
+        self.assertEqual(
+            [ie.question for ie in read_index(_OTTER_LOG_FILENAME)], questions + ["q20"])
+
+    def test_unindexed_log(self):
+        # logs written as a stream of pickled entries can still be read and appended to
+        entries = [
+            LogEntry(event_type=EventType.CHECK, question="q1"),
+            LogEntry(event_type=EventType.CHECK, question="q2"),
+        ]
+        with open(_OTTER_LOG_FILENAME, "wb") as f:
+            pickle.dump(entries[0], f)
+
+        entries[1].flush_to_file(_OTTER_LOG_FILENAME)
+        self.assertFalse(is_indexed_log(_OTTER_LOG_FILENAME))
+
+        log = Log.from_file(_OTTER_LOG_FILENAME)
+        self.assertEqual(log.get_questions(), ["q1", "q2"])
+        self.assertEqual(log.get_question_entry("q2").timestamp, entries[1].timestamp)
+
+        # deleting old environments rewrites the log in the indexed format
+        entry = LogEntry(event_type=EventType.CHECK, question="q1")
+        entry.shelve({"x": 1}, delete=True, filename=_OTTER_LOG_FILENAME)
+        entry.flush_to_file(_OTTER_LOG_FILENAME)
+
+        entry = LogEntry(event_type=EventType.CHECK, question="q1")
+        entry.shelve({"x": 2, "y": 3}, delete=True, filename=_OTTER_LOG_FILENAME)
+        entry.flush_to_file(_OTTER_LOG_FILENAME)
+
+        self.assertTrue(is_indexed_log(_OTTER_LOG_FILENAME))
+
+        log = Log.from_file(_OTTER_LOG_FILENAME)
+        self.assertEqual([e.shelf is not None for e in log], [False, False, False, True])
+        self.assertEqual(log.get_question_entry("q1").unshelve(), {"x": 2})
+
+    def test_tombstones(self):
+        def shelve(question, env):
+            entry = LogEntry(event_type=EventType.CHECK, question=question)
+            entry.shelve(env, delete=True, filename=_OTTER_LOG_FILENAME)
+            entry.flush_to_file(_OTTER_LOG_FILENAME)
+
+        shelve("q1", {"x": 1})
+        shelve("q2", {"y": 1})
+        shelve("q1", {"x": 2})
+        log = Log.from_file(_OTTER_LOG_FILENAME, ascending=False)
+
+        # old shelves are marked obsolete instead of rewriting the log
+        self.assertEqual(
+            [(ie.shelved, ie.obsolete) for ie in read_index(_OTTER_LOG_FILENAME)],
+            [(None, True), (("y",), False), (("x",), False)],
+        )
+        self.assertEqual([e.shelf is not None for e in log], [True, True, False])
+        self.assertEqual(read_generation(_OTTER_LOG_FILENAME), 0)
+
+        # the log is compacted once enough of it is obsolete
+        log = Log.from_file(_OTTER_LOG_FILENAME, ascending=False)
+        with mock.patch("otter.check.log_file.COMPACTION_MIN_BYTES", 0):
+            shelve("q2", {"y": 2})
+
+        self.assertEqual(read_generation(_OTTER_LOG_FILENAME), 1)
+        self.assertFalse(any(ie.obsolete for ie in read_index(_OTTER_LOG_FILENAME)))
+
+        # logs read before the log was compacted still find their entries
+        self.assertEqual(log.get_question_entry("q1").unshelve(), {"x": 2})
+        self.assertEqual(log.get_question_entry("q2").shelf, None)
+        self.assertEqual(Log.from_file(_OTTER_LOG_FILENAME).get_question_entry("q2").unshelve(), {"y": 2})
+
+        # compacting a log without obsolete shelves does nothing
+        compact_log(_OTTER_LOG_FILENAME)
+        self.assertEqual(read_generation(_OTTER_LOG_FILENAME), 1)
+
+    def test_shelf_blobs(self):
+        def shelve(env):
+            entry = LogEntry(event_type=EventType.CHECK, question="q1")
+            entry.shelve(env, delete=True, filename=_OTTER_LOG_FILENAME)
+            entry.flush_to_file(_OTTER_LOG_FILENAME)
+
+        big = np.arange(100000)
+        shelve({"big": big, "x": 1})
+        size = os.path.getsize(_OTTER_LOG_FILENAME)
+        self.assertGreater(size, big.nbytes)
+
+        # unchanged variables are stored once, even though the old shelf is obsolete
+        shelve({"big": big, "x": 2})
+        self.assertLess(os.path.getsize(_OTTER_LOG_FILENAME) - size, big.nbytes / 10)
+
+        index = read_index(_OTTER_LOG_FILENAME)
+        self.assertEqual([ie.obsolete for ie in index], [True, False])
+        self.assertEqual(len(index[1].blobs), 2)
+        self.assertIn(index[0].blobs[0], index[1].blobs)
+
+        env = Log.from_file(_OTTER_LOG_FILENAME).get_question_entry("q1").unshelve()
+        self.assertEqual(env["x"], 2)
+        self.assertTrue((env["big"] == big).all())
+
+        # compaction removes the blobs that are only used by obsolete shelves
+        compact_log(_OTTER_LOG_FILENAME)
+        index = read_index(_OTTER_LOG_FILENAME)
+        self.assertEqual(index[0].blobs, None)
+        env = Log.from_file(_OTTER_LOG_FILENAME).get_question_entry("q1").unshelve()
+        self.assertEqual(env["x"], 2)
+        self.assertTrue((env["big"] == big).all())
+
+    def test_compression(self):
+        big = np.zeros(1000000)
+        sizes = {}
+        for codec in [None, "zlib", "lzma"]:
+            compression = LogCompression(codec, level=1, entries=True) if codec else None
+            entry = LogEntry(event_type=EventType.CHECK, question="q1")
+            entry.shelve({"big": big, "x": 1})
+            entry.flush_to_file(_OTTER_LOG_FILENAME, compression=compression)
+            sizes[codec] = os.path.getsize(_OTTER_LOG_FILENAME)
+
+            env = Log.from_file(_OTTER_LOG_FILENAME).get_question_entry("q1").unshelve()
+            self.assertEqual(env["x"], 1)
+            self.assertTrue((env["big"] == big).all())
+
+            os.remove(_OTTER_LOG_FILENAME)
+
+        self.assertLess(sizes["zlib"], sizes[None] / 100)
+        self.assertLess(sizes["lzma"], sizes[None] / 100)
+
+        with self.assertRaises(ValueError):
+            LogCompression("bz2")
+
+        if compression_module.zstandard is None:
+            with self.assertRaises(ValueError):
+                LogCompression("zstd")
+
+    def test_log_writer(self):
+        writer = LogWriter()
+
+        def submit(question, env):
+            entry = LogEntry(event_type=EventType.CHECK, question=question)
+            entry.shelve(env)
+            writer.submit(entry, _OTTER_LOG_FILENAME, replace_shelves=True)
+
+        submit("q1", {"x": 1})
+        submit("q2", {"y": 1})
+        submit("q1", {"x": 2, "z": 3})
+        writer.flush()
+
+        # later entries replace the shelves of earlier ones, keeping only their variables
+        self.assertEqual(
+            [(ie.question, ie.shelved, ie.obsolete) for ie in read_index(_OTTER_LOG_FILENAME)],
+            [("q1", None, True), ("q2", ("y",), False), ("q1", ("x",), False)],
+        )
+        entry = Log.from_file(_OTTER_LOG_FILENAME).get_question_entry("q1")
+        self.assertEqual(entry.unshelve(), {"x": 2})
+        self.assertEqual(entry.unshelved, ["z"])
+
+        # errors raised while writing are raised by the next flush
+        writer.submit(LogEntry(event_type=EventType.INIT), "nonexistent/.OTTER_LOG")
+        with self.assertRaises(Exception):
+            writer.flush()
+
+        writer.close()
+        self.assertFalse(writer._thread.is_alive())
+
     def tearDown(self):
         if os.path.isfile(_OTTER_LOG_FILENAME):
             os.remove(_OTTER_LOG_FILENAME)
@@ -10,6 +10,7 @@ import subprocess
 import json
 import requests
 import nbformat
+import tempfile
 
 from glob import glob
 from subprocess import PIPE
@@ -20,11 +21,29 @@ from otter import Notebook
 from otter.check.logs import LogEntry, EventType, Log
 from otter.check.notebook import _OTTER_LOG_FILENAME
 from otter.check import notebook
+from otter.test_files.ok_test import run_doctest, run_doctests
 
 from . import TestCase
 
 TEST_FILES_PATH = "test/test-notebook/"
 
+OK_TEST_TEMPLATE = """test = {{
+    "name": "q1",
+    "points": 1,
+    "suites": [
+        {{
+            "cases": [
+                {{
+                    "code": ">>> square(3)\\n{expected}",
+                    "hidden": False,
+                }},
+            ],
+            "type": "doctest",
+        }},
+    ],
+}}
+"""
+
 
 # functions used in one of the tests below
 def square(x):
@@ -308,6 +327,59 @@ class TestNotebook(TestCase):
             with self.assertRaises(RuntimeError, msg="This method is not compatible with Google Colab"):
                 grader.export()
 
+    def test_check_caches_tests(self):
+        """
+        Checks that test files are only parsed once and are reparsed when they change
+        """
+        tests_dir = tempfile.mkdtemp()
+        test_path = os.path.join(tests_dir, "q1.py")
+
+        def write_test(expected):
+            with open(test_path, "w") as f:
+                f.write(OK_TEST_TEMPLATE.format(expected=expected))
+
+        try:
+            write_test(9)
+            grader = Notebook(tests_dir=tests_dir)
+
+            with mock.patch("otter.test_files.ok_test.exec", create=True, side_effect=exec) as mocked_exec:
+                for _ in range(3):
+                    result = grader.check("q1", global_env={"square": square})
+                    self.assertEqual(result.grade, 1)
+                    self.assertEqual(len(result.test_case_results), 1)
+
+                self.assertEqual(mocked_exec.call_count, 1)
+
+                # make sure the modification time changes even on filesystems with coarse timestamps
+                write_test(10)
+                stat = os.stat(test_path)
+                os.utime(test_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+                result = grader.check("q1", global_env={"square": square})
+                self.assertEqual(result.grade, 0)
+                self.assertEqual(mocked_exec.call_count, 2)
+
+        finally:
+            shutil.rmtree(tests_dir)
+
+    def test_run_doctests(self):
+        """
+        Checks that running doctests in a batch gives the same results as running them one by one
+        """
+        doctests = [
+            ("q1 0", ">>> square(3)\n9\n"),
+            ("q1 1", ">>> square(3)\n10\n>>> print('hi')\nhi\n"),
+            ("q1 2", ">>> 1 / 0\n"),
+            ("q1 3", ">>> negate(True)\nFalse\n"),
+        ]
+        global_env = {"square": square, "negate": negate}
+
+        results = run_doctests(doctests, global_env)
+        self.assertEqual([passed for passed, _ in results], [True, False, False, True])
+        self.assertEqual(results, [run_doctest(name, body, global_env) for name, body in doctests])
+        self.assertIn("Line 1, in q1 1", results[1][1])
+        self.assertNotIn("q1 0", results[1][1])
+
     def tearDown(self):
         for i in range(1, 7):
             file = "demofile{}.otter".format(i)
@@ -2,6 +2,7 @@
 ##### Tests for otter run #####
 ###############################
 
+import ast
 import os
 import unittest
 import subprocess
@@ -9,13 +10,27 @@ import json
 import shutil
 import nbformat
 import nbconvert
+import pickle
+import tempfile
+import sys
 
 from subprocess import PIPE
 from glob import glob
 from unittest import mock
 from shutil import copyfile
 
-from otter.run.run_autograder import main as run_autograder
+from otter.api import grade_many
+from otter.check.notebook import _TESTS_DIR_OVERRIDE
+from otter.execute import execute_notebook, grade_notebook
+from otter.execute.check_wrapper import CheckCallWrapper
+from otter.execute.cell_cache import CellCache
+from otter.execute.snapshot import PrefixSnapshot, common_prefix_length, get_snapshot, set_snapshot
+from otter.execute.fork_tests import run_test_files_in_forks
+from otter.execute.screen import EMPTY, SKIP_MESSAGES, UNCHANGED, screen_notebook
+from otter.test_files import OKTestFile
+from otter.run.run_autograder import main as run_autograder, run_batch
+from otter.run.zygote import run_in_fork, Zygote, ZygoteError
+from otter.utils import ExecutionTimeout, chdir, time_limit
 
 from . import TestCase
 
@@ -129,6 +144,126 @@ class TestRun(TestCase):
             
             raise
 
+    def test_batch(self):
+        run_autograder(self.config['autograder_dir'])
+
+        with open(TEST_FILES_PATH + "autograder/results/results.json") as f:
+            expected_results = json.load(f)
+
+        with tempfile.TemporaryDirectory() as td:
+            ag_dir = os.path.join(td, "autograder")
+            batch_dir = os.path.join(td, "batch")
+            shutil.copytree(TEST_FILES_PATH + "autograder", ag_dir)
+            os.makedirs(batch_dir)
+
+            nb_path = TEST_FILES_PATH + "autograder/submission/fails2and6H.ipynb"
+            for fn in ["subm1.ipynb", "subm2.ipynb"]:
+                copyfile(nb_path, os.path.join(batch_dir, fn))
+
+            with open(os.path.join(batch_dir, "bad.ipynb"), "w+") as f:
+                f.write("this is not a notebook")
+
+            for options in [
+                {}, 
+                {"zygote": True}, 
+                {"zygote": True, "prefix_snapshot": True}, 
+                {"zygote": True, "prefix_snapshot": True, "single_pass": True},
+            ]:
+                run_batch(ag_dir, batch_dir, **options)
+
+                self.assertEqual(
+                    sorted(os.listdir(os.path.join(batch_dir, "results"))), 
+                    ["bad.ipynb.error", "subm1.ipynb.pkl", "subm2.ipynb.pkl"],
+                )
+
+                for fn in ["subm1.ipynb", "subm2.ipynb"]:
+                    with open(os.path.join(batch_dir, "results", f"{fn}.pkl"), "rb") as f:
+                        results = pickle.load(f)
+
+                    self.assertEqual(
+                        results.to_gradescope_dict(self.config), expected_results, 
+                        f"Batch results for {fn} did not match expected")
+
+                shutil.rmtree(os.path.join(batch_dir, "results"))
+
+    def test_batch_prescreen(self):
+        run_autograder(self.config['autograder_dir'])
+
+        with open(TEST_FILES_PATH + "autograder/results/results.json") as f:
+            expected_results = json.load(f)
+
+        with tempfile.TemporaryDirectory() as td:
+            ag_dir = os.path.join(td, "autograder")
+            batch_dir = os.path.join(td, "batch")
+            shutil.copytree(TEST_FILES_PATH + "autograder", ag_dir)
+            os.makedirs(batch_dir)
+
+            nb_path = TEST_FILES_PATH + "autograder/submission/fails2and6H.ipynb"
+            copyfile(nb_path, os.path.join(ag_dir, "source", "template.ipynb"))
+            for fn in ["subm1.ipynb", "subm2.ipynb"]:
+                copyfile(nb_path, os.path.join(batch_dir, fn))
+
+            # the results of the distributed notebook are recorded in the zygote, so no submission is
+            # executed
+            for options in [{}, {"prefix_snapshot": True}]:
+                run_batch(ag_dir, batch_dir, zygote=True, prescreen=True, plugins=[], **options)
+
+                for fn in ["subm1.ipynb", "subm2.ipynb"]:
+                    with open(os.path.join(batch_dir, "results", f"{fn}.pkl"), "rb") as f:
+                        results = pickle.load(f)
+
+                    self.assertEqual(results.output, SKIP_MESSAGES[UNCHANGED])
+                    self.assertEqual(
+                        results.to_gradescope_dict(self.config)["tests"], expected_results["tests"])
+
+                shutil.rmtree(os.path.join(batch_dir, "results"))
+
+    def test_grade_many(self):
+        run_autograder(self.config['autograder_dir'])
+
+        with open(TEST_FILES_PATH + "autograder/results/results.json") as f:
+            expected_results = json.load(f)
+
+        with tempfile.TemporaryDirectory() as td:
+            ag_path = os.path.join(td, "autograder.zip")
+            shutil.make_archive(ag_path[:-4], "zip", TEST_FILES_PATH + "autograder/source")
+
+            nb_path = TEST_FILES_PATH + "autograder/submission/fails2and6H.ipynb"
+            paths = [os.path.join(td, fn) for fn in ["subm1.ipynb", "subm2.ipynb", "subm3.ipynb"]]
+            for path in paths:
+                copyfile(nb_path, path)
+
+            # the plugins' output depends on the submission metadata, which otter run leaves empty
+            graded = []
+            for path, results in grade_many(paths, ag_path, workers=2):
+                graded.append(path)
+                self.assertEqual(
+                    results.to_gradescope_dict(self.config)["tests"], expected_results["tests"], 
+                    f"Results for {path} did not match expected")
+
+            self.assertEqual(sorted(graded), paths)
+
+    def test_single_pass(self):
+        run_autograder(self.config['autograder_dir'])
+
+        with open(TEST_FILES_PATH + "autograder/results/results.json") as f:
+            expected_results = json.load(f)
+
+        nb = nbformat.read(
+            TEST_FILES_PATH + "autograder/submission/fails2and6H.ipynb", as_version=NBFORMAT_VERSION)
+        num_code_cells = len([c for c in nb.cells if c.cell_type == "code"])
+
+        with mock.patch("otter.execute.execute_notebook.exec", create=True, side_effect=exec) as mocked_exec:
+            run_autograder(self.config['autograder_dir'], single_pass=True)
+
+        # one call to add the submission directory to sys.path and one for each cell
+        self.assertEqual(mocked_exec.call_count, num_code_cells + 1)
+
+        with open(TEST_FILES_PATH + "autograder/results/results.json") as f:
+            actual_results = json.load(f)
+
+        self.assertEqual(actual_results, expected_results, f"Actual results did not matched expected:\n{actual_results}")
+
     def tearDown(self):
         os.chdir(self.cwd)
         self.deletePaths([
@@ -140,3 +275,394 @@ class TestRun(TestCase):
             TEST_FILES_PATH + "autograder/submission/__init__.py",
             TEST_FILES_PATH + "autograder/submission/.OTTER_LOG",
         ])
+
+
+class TestCellCache(TestCase):
+
+    def test_memory(self):
+        cache = CellCache(max_entries=2)
+        with mock.patch("otter.execute.cell_cache.transform_cell", wraps=lambda s: s) as mocked_transform:
+            source, code = cache.compile_cell("x = 1\n")
+            self.assertEqual(cache.compile_cell("x = 1\n"), (source, code))
+            self.assertEqual(mocked_transform.call_count, 1)
+
+            # the prefix is part of the key
+            source, code = cache.compile_cell("x = 1\n", prefix="y = 2\n")
+            self.assertEqual(source, "y = 2\nx = 1\n")
+            self.assertEqual(mocked_transform.call_count, 2)
+
+            # the least recently used entry is evicted
+            cache.compile_cell("z = 3\n")
+            cache.compile_cell("x = 1\n")
+            self.assertEqual(mocked_transform.call_count, 4)
+
+        env = {}
+        exec(code, env)
+        self.assertEqual((env["x"], env["y"]), (1, 2))
+
+    def test_transform(self):
+        source, code = CellCache().compile_cell(["%matplotlib inline\n", "x = !echo hi\n", "y = 1"])
+        self.assertNotIn("%matplotlib", source)
+        self.assertIn("get_ipython().getoutput('echo hi')", source)
+
+        with self.assertRaises(SyntaxError):
+            CellCache().compile_cell("def f(:")
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as td:
+            source, code = CellCache(td).compile_cell("x = 1\n")
+            self.assertEqual(len(os.listdir(td)), 1)
+
+            with mock.patch("otter.execute.cell_cache.transform_cell") as mocked_transform:
+                self.assertEqual(CellCache(td).compile_cell("x = 1\n"), (source, code))
+                mocked_transform.assert_not_called()
+
+
+class TestForkedTests(TestCase):
+
+    @staticmethod
+    def make_test_file(name, *bodies):
+        return OKTestFile.from_spec({
+            "name": name,
+            "suites": [{"cases": [{"code": body} for body in bodies]}],
+        })
+
+    def test_forked_tests(self):
+        global_env = {"x": 2}
+        test_files = [
+            self.make_test_file("q1", ">>> x\n2", ">>> x + 1\n4"),
+            self.make_test_file("q2", ">>> x = 3\n>>> x\n3"),
+            self.make_test_file("q3", ">>> x\n2"),
+            self.make_test_file("q4", ">>> import os, signal\n>>> os.kill(os.getpid(), signal.SIGKILL)"),
+        ]
+
+        run_test_files_in_forks(test_files, global_env, 2)
+
+        self.assertEqual([tcr.passed for tcr in test_files[0].test_case_results], [True, False])
+        self.assertEqual(test_files[1].grade, 1)
+
+        # changes to the environment made by one test file aren't seen by the others
+        self.assertEqual(global_env, {"x": 2})
+        self.assertEqual(test_files[2].grade, 1)
+
+        # a crashed worker only fails its own test file
+        self.assertEqual(test_files[3].grade, 0)
+        self.assertIn("exited with code -9", test_files[3].test_case_results[0].message)
+
+        expected = self.make_test_file("q1", ">>> x\n2", ">>> x + 1\n4")
+        expected.run({"x": 2})
+        self.assertEqual(test_files[0].test_case_results, expected.test_case_results)
+
+
+class TestTimeouts(TestCase):
+
+    def test_time_limit(self):
+        with time_limit(0.2) as outer:
+            with self.assertRaises(ExecutionTimeout):
+                with time_limit(0.1) as inner:
+                    while True:
+                        pass
+
+            # the exception is raised again if it is caught
+            with self.assertRaises(ExecutionTimeout):
+                try:
+                    while True:
+                        pass
+                except ExecutionTimeout:
+                    pass
+
+                while True:
+                    pass
+
+        self.assertTrue(inner.expired)
+        self.assertTrue(outer.expired)
+
+        with time_limit(1) as limit:
+            pass
+
+        self.assertFalse(limit.expired)
+
+    def test_cell_timeout(self):
+        nb = nbformat.v4.new_notebook(cells=[
+            nbformat.v4.new_code_cell("x = 1"),
+            nbformat.v4.new_code_cell("while True:\n    try:\n        pass\n    except:\n        pass"),
+            nbformat.v4.new_code_cell("y = x + 1"),
+        ])
+
+        for single_pass in [False, True]:
+            timed_out_cells = []
+            global_env = execute_notebook(
+                nb, "results", {"results": []}, single_pass=single_pass, cell_timeout=0.1,
+                timed_out_cells=timed_out_cells)
+
+            self.assertEqual(timed_out_cells, [1])
+            self.assertEqual(global_env["y"], 2)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            nb_path = os.path.join(tempdir, "nb.ipynb")
+            nbformat.write(nb, nb_path)
+            results = grade_notebook(nb_path, cell_timeout=0.1)
+
+        self.assertEqual(results.output, "Cell 1 timed out after 0.1 seconds and was skipped")
+
+    def test_test_timeout(self):
+        test_file = TestForkedTests.make_test_file(
+            "q1", ">>> while True:\n...     pass", ">>> x\n2")
+        test_file.run({"x": 2}, timeout=0.1)
+
+        self.assertEqual([tcr.passed for tcr in test_file.test_case_results], [False, True])
+        self.assertIn("timed out after 0.1 seconds", test_file.test_case_results[0].message)
+
+
+def _resume_from_snapshot(nb, single_pass, **kwargs):
+    global_env = execute_notebook(
+        nb, "results", {"results": [], "calls": []}, single_pass=single_pass,
+        snapshot=get_snapshot(), **kwargs)
+    return global_env["y"], global_env["calls"], global_env["data"]
+
+
+def _add(x, y):
+    print(f"adding {x} and {y}")
+    return x + y
+
+
+def _zygote_state(module):
+    import sys
+    global _zygote_calls
+    _zygote_calls += 1
+    return module in sys.modules, _zygote_calls
+
+
+_zygote_calls = 0
+
+
+def _crash():
+    os.kill(os.getpid(), 9)
+
+
+def _spin():
+    while True:
+        try:
+            pass
+        except BaseException:
+            pass
+
+
+class TestZygote(TestCase):
+
+    def test_zygote(self):
+        zygote = Zygote(["colorsys"])
+        try:
+            zygote.start()
+            with mock.patch("sys.stdout") as stdout:
+                self.assertEqual(zygote.run(_add, 1, y=2), 3)
+            stdout.write.assert_any_call("adding 1 and 2\n")
+
+            # each call runs in a fresh child with the zygote's modules, so state isn't shared
+            self.assertEqual(zygote.run(_zygote_state, "colorsys"), (True, 1))
+            self.assertEqual(zygote.run(_zygote_state, "colorsys"), (True, 1))
+
+            zygote.preload(["this_module_does_not_exist"])
+            self.assertIn("this_module_does_not_exist", zygote.preload_modules)
+
+            with self.assertRaises(TypeError) as cm:
+                zygote.run(_add, 1, "a")
+            self.assertIn("Traceback", str(cm.exception.__cause__))
+
+            with self.assertRaisesRegex(ZygoteError, "exited with code -9"):
+                zygote.run(_crash)
+
+            # the zygote survives its children dying
+            self.assertEqual(zygote.run(_add, 2, 2), 4)
+
+        finally:
+            zygote.close()
+
+    def test_run_in_fork(self):
+        calls = _zygote_calls
+
+        # state changed in the child doesn't leak into this process or the next child
+        self.assertEqual(run_in_fork(_zygote_state, "colorsys")[0], ("colorsys" in sys.modules, calls + 1))
+        self.assertEqual(run_in_fork(_zygote_state, "colorsys")[0][1], calls + 1)
+        self.assertEqual(_zygote_calls, calls)
+
+        # the resources used by each child are measured separately
+        _, rusage = run_in_fork(_add, 1, 2)
+        self.assertGreater(rusage.ru_maxrss, 0)
+
+        with self.assertRaises(ZygoteError) as cm:
+            run_in_fork(_crash)
+        self.assertEqual(cm.exception.exitcode, -9)
+        self.assertIsNotNone(cm.exception.rusage)
+        self.assertFalse(cm.exception.timed_out)
+
+        # a child that ignores the exceptions used to interrupt it is killed
+        with self.assertRaises(ZygoteError) as cm:
+            run_in_fork(_spin, kill_after=0.5)
+        self.assertEqual(cm.exception.exitcode, -9)
+        self.assertTrue(cm.exception.timed_out)
+
+
+class TestPrefixSnapshot(TestCase):
+
+    @staticmethod
+    def make_notebook(*sources):
+        return nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell(s) for s in sources])
+
+    def test_common_prefix_length(self):
+        nb1 = self.make_notebook("import os", "x = 1", "y = 2", "z = 3")
+        nb2 = self.make_notebook("import os", "x = 1", "y = 3", "z = 3")
+        nb3 = self.make_notebook("import os", "x = 1", "grader.check('q1')", "z = 3")
+
+        self.assertEqual(common_prefix_length([nb1, nb2]), 2)
+        self.assertEqual(common_prefix_length([nb1, nb1]), 4)
+        self.assertEqual(common_prefix_length([nb3, nb3]), 2)
+        self.assertEqual(common_prefix_length([nb1, nb2, self.make_notebook("x = 1")]), 0)
+
+    def test_snapshot(self):
+        template = self.make_notebook("calls.append(1)\nx = 1\ndata = [1]", "y = x + 1")
+        nb = self.make_notebook("calls.append(1)\nx = 1\ndata = [1]", "data.append(2)\ny = x + 2")
+
+        for single_pass in [False, True]:
+            calls = []
+            snapshot = PrefixSnapshot(1)
+            execute_notebook(
+                template, "results", {"results": [], "calls": calls}, single_pass=single_pass, 
+                snapshot=snapshot)
+
+            self.assertTrue(snapshot.taken)
+            self.assertEqual(calls, [1])
+            self.assertNotIn("y", snapshot.global_env)
+
+            set_snapshot(snapshot)
+            try:
+                # the prefix isn't executed again in a forked process; in two-pass mode it's only
+                # included in the second pass
+                for _ in range(2):
+                    y, calls, data = run_in_fork(_resume_from_snapshot, nb, single_pass)[0]
+                    self.assertEqual((y, calls), (3, [] if single_pass else [1]))
+                    self.assertEqual(data, [1, 2])
+
+                # notebooks with different prefixes or options are executed from the start
+                y, calls, _ = run_in_fork(
+                    _resume_from_snapshot, 
+                    self.make_notebook("calls.append(1)\nx = 2\ndata = [1]", "y = x + 2"), 
+                    single_pass)[0]
+                self.assertEqual((y, len(calls)), (4, 1 if single_pass else 2))
+
+                _, calls, _ = run_in_fork(_resume_from_snapshot, nb, single_pass, seed=42)[0]
+                self.assertEqual(len(calls), 1 if single_pass else 2)
+
+            finally:
+                set_snapshot(None)
+
+            # notebooks are executed from the start in the process that took the snapshot, so that
+            # the objects in the snapshot aren't changed
+            calls = []
+            execute_notebook(
+                nb, "results", {"results": [], "calls": calls}, single_pass=single_pass, 
+                snapshot=snapshot)
+
+            self.assertEqual(len(calls), 1 if single_pass else 2)
+            self.assertEqual(snapshot.global_env["data"], [1])
+
+
+class TestPrescreen(TestCase):
+
+    make_notebook = staticmethod(TestPrefixSnapshot.make_notebook)
+
+    def test_screen_notebook(self):
+        template = self.make_notebook("import os", "x = ...")
+
+        changed = self.make_notebook("import os", "x = 1")
+        unchanged = self.make_notebook("import os", "x = ...")
+        unchanged["cells"][1]["outputs"] = [nbformat.v4.new_output("stream", text="foo")]
+        unchanged["cells"].append(nbformat.v4.new_markdown_cell("an answer"))
+
+        self.assertEqual(screen_notebook(unchanged, template), UNCHANGED)
+        self.assertIsNone(screen_notebook(changed, template))
+        self.assertIsNone(screen_notebook(unchanged))
+
+        empty = self.make_notebook("", "x = (", "# a comment", "%matplotlib inline")
+        self.assertEqual(screen_notebook(empty, template), EMPTY)
+
+        # checks in cell metadata are run even if the cell fails
+        empty["cells"][1]["metadata"]["otter"] = {"tests": ["q1"]}
+        self.assertIsNone(screen_notebook(empty, template))
+
+    def test_grade_notebook(self):
+        with tempfile.TemporaryDirectory() as td:
+            tests_glob = [os.path.join(td, "q1.py")]
+            with open(tests_glob[0], "w") as f:
+                f.write("test = " + repr({"name": "q1", "points": 1, "suites": [{"cases": [{"code": ">>> x\n1"}]}]}))
+
+            def grade(name, *sources):
+                path = os.path.join(td, f"{name}.ipynb")
+                nbformat.write(self.make_notebook(f"open('{name}.txt', 'a').write('x')", *sources), path)
+                results = grade_notebook(
+                    path, tests_glob=tests_glob, cwd=td, prescreen=True, template=template_path)
+
+                with open(os.path.join(td, f"{name}.txt")) as f:
+                    return results, len(f.read())
+
+            template_path = os.path.join(td, "template.ipynb")
+            nbformat.write(self.make_notebook("open('unchanged.txt', 'a').write('x')", "x = ..."), template_path)
+
+            with chdir(td):
+                # the first unchanged notebook is executed and later ones are given its results
+                results, num_runs = grade("unchanged", "x = ...")
+                self.assertEqual(results.total, 0)
+                self.assertIsNone(results.output)
+
+                results, num_runs_after = grade("unchanged", "x = ...")
+                self.assertEqual(num_runs_after, num_runs)
+                self.assertEqual(results.total, 0)
+                self.assertEqual(results.output, SKIP_MESSAGES[UNCHANGED])
+
+                for i in range(1, 3):
+                    results, num_runs_after = grade("changed", "x = 1")
+                    self.assertEqual(num_runs_after, i * num_runs)
+                    self.assertEqual(results.total, 1)
+                    self.assertIsNone(results.output)
+
+                nbformat.write(self.make_notebook("x = (", ""), os.path.join(td, "empty.ipynb"))
+                for _ in range(2):
+                    results = grade_notebook(
+                        os.path.join(td, "empty.ipynb"), tests_glob=tests_glob, cwd=td, 
+                        prescreen=True, template=template_path)
+                    self.assertEqual(results.total, 0)
+
+                self.assertEqual(results.output, SKIP_MESSAGES[EMPTY])
+
+
+class TestReentrancy(TestCase):
+
+    def test_check_call_wrapper(self):
+        wrapper1, wrapper2 = CheckCallWrapper("results1"), CheckCallWrapper("results2")
+        wrapper1.visit(ast.parse("import otter as ott\nnb = ott.Notebook()"))
+        wrapper2.visit(ast.parse("import otter\ngrader = otter.Notebook()"))
+
+        self.assertEqual(wrapper1.OTTER_INSTANCE_NAME, "nb")
+        self.assertEqual(wrapper2.OTTER_INSTANCE_NAME, "grader")
+        self.assertEqual(CheckCallWrapper.OTTER_INSTANCE_NAME, "grader")
+
+    def test_tests_dir_override(self):
+        nb = nbformat.v4.new_notebook(cells=[
+            nbformat.v4.new_code_cell("import otter\ngrader = otter.Notebook()"),
+            nbformat.v4.new_code_cell("1 / 0"),
+        ])
+
+        for single_pass in [False, True]:
+            with self.assertRaises(ZeroDivisionError):
+                execute_notebook(
+                    nb, "results", {"results": []}, test_dir="foo", single_pass=single_pass)
+
+            # the override is reset even if execution fails
+            self.assertIsNone(_TESTS_DIR_OVERRIDE.get())
+
+            global_env = execute_notebook(
+                nb, "results", {"results": []}, test_dir="foo", ignore_errors=True, 
+                single_pass=single_pass)
+
+            self.assertEqual(global_env["grader"]._path, "foo")
+            self.assertIsNone(_TESTS_DIR_OVERRIDE.get())